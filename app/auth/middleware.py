@@ -1,32 +1,95 @@
+import hashlib
+import hmac
+from dataclasses import dataclass
+
 from fastapi import Request
 from starlette.responses import JSONResponse
 
-# 配置中的 API Key（由 main.py 注入）
-_api_key: str = ""
+from app.config.settings import APIKeySettings
+from app.services import request_context
+from app.services.rate_limit import KeyLimits, limiter
+from app.utils.errors import RateLimitError
+
+# 公开路径白名单
+PUBLIC_PATHS = frozenset({"/health", "/", "/static/admin.html"})
+
+
+@dataclass(frozen=True)
+class APIKey:
+    name: str
+    key: bytes
+    admin: bool = False  # 可以使用诊断接口（profiling）
+
+
+# 配置中的 API Key 表（由 main.py 注入），按 key 的 SHA-256 摘要索引
+_keys: dict[bytes, APIKey] = {}
+
+
+def _digest(key: bytes) -> bytes:
+    return hashlib.sha256(key).digest()
+
+
+def configure_auth(api_key: str = "", keys: list[APIKeySettings] | None = None, admin_key: str = ""):
+    """配置认证中间件
+
+    api_key 为单 key 兼容配置（租户名 default），keys 为多租户 key 表；
+    admin_key 为诊断接口专用 key（租户名 admin），未设置时 api_key 兼任；
+    重复调用即热重载，未变化 key 的限流状态保留。
+    """
+    global _keys
+    entries = list(keys or [])
+    if api_key:
+        entries.insert(0, APIKeySettings(key=api_key, name="default"))
+    if admin_key:
+        entries.insert(0, APIKeySettings(key=admin_key, name="admin"))
+    admin = (admin_key or api_key).encode()
+
+    table: dict[bytes, APIKey] = {}
+    limits: dict[str, KeyLimits] = {}
+    for entry in entries:
+        if not entry.key:
+            continue
+        raw = entry.key.encode()
+        digest = _digest(raw)
+        name = entry.name or f"key-{digest.hex()[:8]}"
+        table[digest] = APIKey(name=name, key=raw, admin=bool(admin) and hmac.compare_digest(raw, admin))
+        limits[name] = KeyLimits(entry.rpm, entry.max_concurrent_streams)
+    _keys = table
+    limiter.configure(limits)
 
 
-def configure_auth(api_key: str = ""):
-    """配置认证中间件"""
-    global _api_key
-    _api_key = api_key
+def authenticate(provided: str) -> APIKey | None:
+    """查找 key；摘要索引定位后再做常数时间比较"""
+    raw = provided.encode()
+    entry = _keys.get(_digest(raw))
+    if entry is None or not hmac.compare_digest(entry.key, raw):
+        return None
+    return entry
+
+
+def _reject(body: dict, status_code: int, headers: dict[str, str] | None = None) -> JSONResponse:
+    """返回错误响应，并记录错误码供请求日志和 gateway_errors_total 统计"""
+    ctx = request_context.current()
+    if ctx is not None:
+        ctx.error_code = body["error"]["code"]
+    return JSONResponse(body, status_code=status_code, headers=headers)
 
 
 async def auth_middleware(request: Request, call_next):
-    # 公开路径白名单
-    public_paths = ["/health", "/", "/static/admin.html"]
-    if request.url.path.startswith("/static/") or request.url.path in public_paths:
+    path = request.url.path
+    if path in PUBLIC_PATHS or path.startswith("/static/"):
         return await call_next(request)
-    
+
     # API Key 是必需的
-    if not _api_key:
-        return JSONResponse(
+    if not _keys:
+        return _reject(
             {"error": {"message": "API key not configured on server", "code": "server_config_error"}},
             status_code=500,
         )
-    
+
     # 尝试多种方式获取 API Key
     provided_key = None
-    
+
     # 方式1: Authorization: Bearer <api_key>
     auth_header = request.headers.get("Authorization", "")
     if auth_header.startswith("Bearer "):
@@ -34,16 +97,32 @@ async def auth_middleware(request: Request, call_next):
     # 方式2: Authorization: <api_key> (OpenAI 风格)
     elif auth_header and " " not in auth_header:
         provided_key = auth_header.strip()
-    
+
     # 方式3: X-API-Key header
     if not provided_key:
         provided_key = request.headers.get("X-API-Key", "").strip()
-    
+
     # 验证 API Key
-    if provided_key != _api_key:
-        return JSONResponse(
+    entry = authenticate(provided_key) if provided_key else None
+    if entry is None:
+        return _reject(
             {"error": {"message": "Invalid API key", "code": "invalid_api_key"}},
             status_code=401,
         )
-    
+
+    # 按 key 限流
+    retry_after = await limiter.check_request(entry.name)
+    if retry_after is not None:
+        error = RateLimitError(f"Rate limit exceeded for key '{entry.name}'", retry_after=retry_after)
+        return _reject(
+            error.to_dict(),
+            status_code=error.status_code,
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+
+    ctx = request_context.current()
+    if ctx is not None:
+        ctx.api_key = entry.name
+        ctx.admin = entry.admin
+
     return await call_next(request)
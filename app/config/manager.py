@@ -1,7 +1,8 @@
+import os
 import yaml
 from pathlib import Path
 
-from app.config.settings import Settings, ServerSettings, AuthSettings, GeminiSettings, G4FSettings, LoggingSettings
+from app.config.settings import Settings, ServerSettings, AuthSettings, CassetteSettings, ContextSettings, GeminiSettings, G4FSettings, LoggingSettings, LoopMonitorSettings, ProfilingSettings, RoutingSettings, StubSettings, TracingSettings, UsageSettings
 
 
 class ConfigManager:
@@ -24,7 +25,15 @@ class ConfigManager:
             auth=AuthSettings(**data.get("auth", {})),
             logging=LoggingSettings(**data.get("logging", {})),
             gemini=GeminiSettings(**data.get("gemini", {})),
-            g4f=G4FSettings(**data.get("g4f", {}))
+            g4f=G4FSettings(**data.get("g4f", {})),
+            routing=RoutingSettings(**data.get("routing", {})),
+            context=ContextSettings(**data.get("context", {})),
+            usage=UsageSettings(**data.get("usage", {})),
+            tracing=TracingSettings(**data.get("tracing", {})),
+            stub=StubSettings(**data.get("stub", {})),
+            cassette=CassetteSettings(**data.get("cassette", {})),
+            profiling=ProfilingSettings(**data.get("profiling", {})),
+            loop_monitor=LoopMonitorSettings(**data.get("loop_monitor", {}))
         )
     
     def reload(self) -> None:
@@ -34,3 +43,13 @@ class ConfigManager:
     
     def get_settings(self) -> Settings:
         return self.settings
+
+
+def load_config() -> tuple[ConfigManager | None, Settings]:
+    """优先使用配置文件（CONFIG_PATH）中的设置，否则使用环境变量"""
+    config_path = os.getenv("CONFIG_PATH", "")
+    if config_path and Path(config_path).exists():
+        config_manager = ConfigManager(config_path)
+        config_manager.load()
+        return config_manager, config_manager.get_settings()
+    return None, Settings.from_env()
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List
 
 from pydantic import BaseModel, Field
 
@@ -7,11 +7,22 @@ from pydantic import BaseModel, Field
 class ServerSettings(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8022
+    workers: int = 1  # worker 进程数（通过 python -m app.server 启动时生效）
+    state_path: str = ""  # 跨进程共享状态的 SQLite 文件，为空时仅进程内共享
+
+
+class APIKeySettings(BaseModel):
+    key: str
+    name: str = ""  # 租户名，用于日志和统计；为空时由 key 的哈希生成
+    rpm: int | None = None  # 每分钟请求数上限（令牌桶，允许突发到该值）
+    max_concurrent_streams: int | None = None  # 同时进行的流式请求上限
 
 
 class AuthSettings(BaseModel):
     bearer_token: str = ""
     api_key: str = ""  # API Key 认证，优先级高于 bearer_token
+    keys: List[APIKeySettings] = Field(default_factory=list)  # 多租户 API Key 表，可热重载
+    admin_key: str = ""  # 诊断接口（profiling）专用 key，为空时使用 api_key
 
 
 class LoggingSettings(BaseModel):
@@ -20,6 +31,11 @@ class LoggingSettings(BaseModel):
     file: str | None = None
     rotation: str = "10 MB"
     retention: str = "7 days"
+    serialize: bool = False  # 输出 JSON 行（含 request_id/status 等结构化字段）
+    enqueue: bool = True  # 在后台线程写日志，不阻塞事件循环
+    sample_rate: float = 1.0  # 其余请求日志的采样率；错误和慢请求总是记录
+    slow_threshold: float = 5.0  # 超过该耗时（秒）的请求总是记录
+    always_log_status: int = 400  # 状态码不低于该值的请求总是记录（4xx 含认证失败和限流）
 
 
 class GeminiSettings(BaseModel):
@@ -29,6 +45,7 @@ class GeminiSettings(BaseModel):
     models: List[str] = Field(default_factory=list)
     proxy: str | None = None
     timeout: int = 30  # 超时时间（秒）
+    cookie_sync_interval: float = 60.0  # 持久化轮换后的 cookie / 检查文件变化的间隔（秒）
 
 
 class G4FSettings(BaseModel):
@@ -36,7 +53,158 @@ class G4FSettings(BaseModel):
     providers: List[str] = Field(default_factory=list)
     model_prefixes: List[str] = Field(default_factory=list)
     timeout: float = 30.0
-    cookies_dir: str = "/app/har_and_cookies"  # g4f cookie/har 文件目录  # 超时时间（秒）
+    cookies_dir: str = "/app/har_and_cookies"  # g4f cookie/har 文件目录
+    models_refresh_interval: float = 3600.0  # 模型目录刷新间隔（秒）；0 表示只在启动时发现一次
+
+
+class CircuitBreakerSettings(BaseModel):
+    failure_threshold: int = 5  # 连续失败多少次后熔断
+    recovery_timeout: float = 30.0  # 熔断后多久进入半开探测（秒）
+    half_open_max_calls: int = 1  # 半开状态允许的并发探测数
+    shared_sync_interval: float = 1.0  # 多 worker 时多久读取一次共享的熔断状态（秒）
+
+
+class HedgePolicy(BaseModel):
+    percentile: float = 95.0  # 主请求超过该分位耗时仍未返回则发出 hedge
+    min_delay: float = 0.5  # hedge 延迟下限（秒）
+    default_delay: float = 10.0  # 样本不足时使用的延迟（秒）
+
+
+class HedgingSettings(BaseModel):
+    # 启用 hedging 的模型及其阈值，如 {"gemini-3.0-flash": {"percentile": 95}}
+    models: Dict[str, HedgePolicy] = Field(default_factory=dict)
+    min_samples: int = 20  # 计算分位数所需的最少样本
+    budget_ratio: float = 0.1  # hedge 请求最多占正常请求的比例
+    budget_max_tokens: float = 10.0  # 预算令牌上限（允许的突发 hedge 数）
+    # 没有 fallback 时是否在同一路由上再发一次；同一账号的第二个请求通常同样慢，还会多占一份上游额度
+    same_route: bool = False
+
+
+class RetryPolicy(BaseModel):
+    max_attempts: int = 3  # 同一路由的总尝试次数（含首次）
+    base_delay: float = 0.5  # 指数退避基数（秒），实际等待在 [0, base * 2^n] 间随机
+    max_delay: float = 8.0  # 单次退避上限（秒）
+    max_retry_after: float = 10.0  # 上游要求等待超过该值时不再重试（秒）
+    # 参与重试的错误类型（AIGatewayError.code）
+    retry_on: List[str] = Field(default_factory=lambda: ["provider_error", "rate_limit_exceeded"])
+
+
+class RetrySettings(BaseModel):
+    default: RetryPolicy = RetryPolicy()
+    models: Dict[str, RetryPolicy] = Field(default_factory=dict)  # 按模型覆盖
+    budget_ratio: float = 0.2  # 重试最多占正常请求的比例
+    budget_max_tokens: float = 20.0  # 预算令牌上限
+
+
+class TimeoutBounds(BaseModel):
+    min: float = 10.0  # 超时下限（秒）
+    max: float = 180.0  # 超时上限（秒）
+    initial: float | None = None  # 样本不足时的超时，默认取上限
+
+
+class TimeoutSettings(BaseModel):
+    percentile: float = 99.0  # 基于该分位的历史耗时计算超时
+    factor: float = 2.0  # 超时 = 分位耗时 × factor，再限制在 [min, max]
+    min_samples: int = 20  # 计算分位数所需的最少样本
+    default: TimeoutBounds = TimeoutBounds()
+    models: Dict[str, TimeoutBounds] = Field(default_factory=dict)  # 按模型覆盖
+    # 非对话类调用（图片生成、文件对话）按操作单独统计延迟，使用各自的超时区间
+    operations: Dict[str, TimeoutBounds] = Field(
+        default_factory=lambda: {
+            "images": TimeoutBounds(min=30.0, max=300.0),
+            "files": TimeoutBounds(min=30.0, max=300.0),
+        }
+    )
+    total: float | None = None  # 单个请求跨重试和故障转移的总时限（秒），为空时不限制
+
+
+class TenantPolicy(BaseModel):
+    weight: float = 1.0  # 同一优先级类内，租户间按权重分配上游名额
+    priority: str | None = None  # 固定优先级类（如评测任务设为 batch），为空时按请求类型判断
+
+
+class SchedulerSettings(BaseModel):
+    max_concurrent: int = 0  # 同时进行的上游调用数，超出后按加权公平排队；0 表示不限制
+    # 优先级类权重：流式请求为 interactive，其他为 standard
+    classes: Dict[str, float] = Field(
+        default_factory=lambda: {"interactive": 8.0, "standard": 4.0, "batch": 1.0}
+    )
+    tenants: Dict[str, TenantPolicy] = Field(default_factory=dict)  # 按 API Key 租户名配置
+
+
+class RoutingSettings(BaseModel):
+    # 模型故障转移链，如 {"gemini-3.0-flash": ["g4f:deepseek-v3"]}
+    fallbacks: Dict[str, List[str]] = Field(default_factory=dict)
+    circuit_breaker: CircuitBreakerSettings = CircuitBreakerSettings()
+    hedging: HedgingSettings = HedgingSettings()
+    retry: RetrySettings = RetrySettings()
+    timeouts: TimeoutSettings = TimeoutSettings()
+    scheduler: SchedulerSettings = SchedulerSettings()
+
+
+class ContextSettings(BaseModel):
+    default_budget: int = 0  # 默认输入 token 预算，0 表示不裁剪
+    budgets: Dict[str, int] = Field(default_factory=dict)  # 按模型的预算，如 {"gemini-3.0-flash": 200000}
+    max_message_tokens: int = 0  # 单条非 system 消息（如工具输出）的上限，超过时截掉中间部分；0 表示不截断
+    min_input_budget: int = 1024  # 扣除 max_tokens 后输入预算的下限
+
+
+class UsageSettings(BaseModel):
+    enabled: bool = True
+    path: str = ""  # 用量记录的 SQLite 文件，为空时只保存在内存中
+    flush_interval: float = 5.0  # 批量写入间隔（秒）
+    max_batch: int = 500  # 缓冲达到该条数时提前写入
+    max_pending: int = 100000  # 缓冲上限，写入跟不上时丢弃最旧的记录
+
+
+class TracingSettings(BaseModel):
+    server_timing: bool = True  # 在响应中返回 Server-Timing 头
+    file: str | None = None  # JSONL 追踪文件，为空时不写入
+    sample_rate: float = 0.1  # 成功请求的采样率；5xx 和慢请求总是记录
+    slow_threshold: float = 10.0  # 超过该耗时（秒）视为慢请求
+    flush_interval: float = 1.0  # 批量写入间隔（秒）
+    max_pending: int = 10000  # 缓冲上限，写入跟不上时丢弃新记录
+
+
+class StubSettings(BaseModel):
+    """本地假上游（压测用），启用后替换 Gemini 和 g4f provider，不访问网络"""
+    enabled: bool = False
+    ttft_ms: float = 300.0  # 首 token 时间的中位数（毫秒）
+    ttft_sigma: float = 0.5  # 对数正态分布的离散程度，0 表示固定值
+    tokens_per_second: float = 50.0  # 输出速率，0 表示首 token 后立即完成
+    output_tokens: int = 200  # 每次回复的 token 数
+    error_rate: float = 0.0  # 注入错误的概率
+    errors: List[str] = Field(default_factory=lambda: ["rate_limit", "provider", "auth"])  # 随机选择的错误类型
+    image_kb: int = 512  # 生成图片的大小
+    seed: int | None = None  # 固定随机种子，使延迟序列可复现
+
+
+class ProfilingSettings(BaseModel):
+    """采样 profiler：管理接口按需启停全进程采样，X-Profile 请求头采样单个请求"""
+    interval: float = 0.005  # 采样间隔（秒）
+    max_duration: float = 300.0  # 全进程采样的最长时间，超时自动停止
+    keep_requests: int = 20  # 内存中保留的单请求 profile 数
+    dir: str | None = None  # 单请求 profile 同时写入该目录（<request_id>.folded），为空时只保存在内存中
+
+
+class LoopMonitorSettings(BaseModel):
+    """事件循环延迟监控与阻塞检测"""
+    enabled: bool = True
+    interval: float = 0.1  # 探测间隔（秒）
+    threshold: float = 0.1  # 单次阻塞超过该时长（秒）记为 stall 并抓取调用栈
+    window: float = 60.0  # /health 中最大延迟的统计窗口（秒）
+    keep: int = 20  # 保留最近的 stall 记录数
+    stack_depth: int = 30  # 调用栈保留的帧数（最内层）
+
+
+class CassetteSettings(BaseModel):
+    """上游交互的录制与回放（离线压测用）"""
+    record: str | None = None  # 录制文件（JSONL），为空时不录制
+    replay: str | None = None  # 回放文件，设置后 Gemini 和 g4f 替换为回放 provider，不访问网络
+    keep_text: bool = False  # 录制回复原文；默认只记录长度，回放时以等长占位文本代替
+    time_scale: float = 1.0  # 回放耗时倍率（0.5 表示快一倍，0 表示不等待）
+    flush_interval: float = 5.0  # 批量写入间隔（秒）
+    max_pending: int = 10000  # 缓冲上限，写入跟不上时丢弃新记录
 
 
 class Settings(BaseModel):
@@ -45,21 +213,32 @@ class Settings(BaseModel):
     logging: LoggingSettings = LoggingSettings()
     gemini: GeminiSettings = GeminiSettings()
     g4f: G4FSettings = G4FSettings()
+    routing: RoutingSettings = RoutingSettings()
+    context: ContextSettings = ContextSettings()
+    usage: UsageSettings = UsageSettings()
+    tracing: TracingSettings = TracingSettings()
+    stub: StubSettings = StubSettings()
+    cassette: CassetteSettings = CassetteSettings()
+    profiling: ProfilingSettings = ProfilingSettings()
+    loop_monitor: LoopMonitorSettings = LoopMonitorSettings()
 
     @classmethod
     def from_env(cls) -> "Settings":
         host = os.getenv("SERVER_HOST", "0.0.0.0")
         port = int(os.getenv("SERVER_PORT", "8022"))
+        workers = int(os.getenv("WORKERS", "1"))
+        state_path = os.getenv("STATE_PATH", "")
         bearer_token = os.getenv("BEARER_TOKEN", "")
         api_key = os.getenv("API_KEY", "")
+        admin_key = os.getenv("ADMIN_KEY", "")
         cookie_path = os.getenv("COOKIE_PATH", "")
         providers = [p for p in os.getenv("G4F_PROVIDERS", "").split(",") if p]
         prefixes = [p for p in os.getenv("G4F_MODEL_PREFIXES", "").split(",") if p]
         g4f_enabled = os.getenv("G4F_ENABLED", "false").lower() in {"1", "true", "yes"}
         log_level = os.getenv("LOG_LEVEL", "INFO")
         return cls(
-            server=ServerSettings(host=host, port=port),
-            auth=AuthSettings(bearer_token=bearer_token, api_key=api_key),
+            server=ServerSettings(host=host, port=port, workers=workers, state_path=state_path),
+            auth=AuthSettings(bearer_token=bearer_token, api_key=api_key, admin_key=admin_key),
             logging=LoggingSettings(level=log_level),
             gemini=GeminiSettings(
                 cookie_path=cookie_path,
@@ -51,11 +51,12 @@ class ConfigReloadHandler(FileSystemEventHandler):
         """处理具体的重载逻辑"""
         from app.config.settings import Settings
         
-        # 日志级别变化
+        # 日志配置变化：整体重新应用，级别和其他字段同时修改时不会漏掉
+        # （在观察器线程中执行，logger.remove() 等待 enqueue 线程不会阻塞事件循环）
         if hasattr(old, 'logging') and hasattr(new, 'logging'):
-            if old.logging.level != new.logging.level:
-                prev = log_manager.set_level(new.logging.level)
-                logger.info(f"Log level reloaded: {prev} -> {new.logging.level}")
+            if old.logging != new.logging:
+                log_manager.configure(new.logging)
+                logger.info(f"Logging config reloaded (level {old.logging.level} -> {new.logging.level})")
         
         # 其他配置变化日志
         if hasattr(old, 'gemini') and hasattr(new, 'gemini'):
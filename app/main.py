@@ -1,118 +1,383 @@
 import asyncio
 import os
-from pathlib import Path
+import time
+from contextlib import asynccontextmanager, contextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 from app.auth.middleware import auth_middleware, configure_auth
 from app.middlewares.logging import RequestLoggingMiddleware
-from app.config.manager import ConfigManager
-from app.config.watcher import ConfigWatcher
+from app.middlewares.profiling import ProfilingMiddleware
+from app.middlewares.runtime import RuntimeLeaseMiddleware
+from app.config.manager import load_config
 from app.config.settings import Settings
-from app.providers.g4f import G4FProvider
-from app.providers.gemini import GeminiProvider
+from app.providers.base import BaseProvider
 from app.routes.admin import configure as configure_admin
+from app.routes.admin import public_router as public_admin_router
 from app.routes.admin import router as admin_router
-from app.routes.claude import configure as configure_claude
 from app.routes.claude import router as claude_router
-from app.routes.files import configure as configure_files
 from app.routes.files import router as files_router
-from app.routes.openai import configure as configure_openai
 from app.routes.openai import router as openai_router
-from app.services.file_manager import FileManager
+from app.services import (
+    cassette, loop_monitor, metrics, profiling, request_context, runtime, shared_state, tokenizer, tracing, usage,
+)
+from app.services.cookie_store import refresher as cookie_refresher
+from app.services.circuit_breaker import CircuitBreakerRegistry
 from app.services.logger import logger, log_manager
+from app.services.model_catalog import ModelCatalog
+from app.services.router import FailoverRouter
+from app.services.scheduler import FairScheduler
+from app.services.timeouts import AdaptiveTimeouts
 
-config_manager = None
-config_watcher = None
-config_path = os.getenv("CONFIG_PATH", "")
-if config_path and Path(config_path).exists():
-    config_manager = ConfigManager(config_path)
-    config_manager.load()
-    
-    # 如果有日志配置，设置文件日志
-    settings = config_manager.get_settings()
-    if settings.logging.file:
-        log_manager.setup_file_logging(
-            settings.logging.file,
-            settings.logging.rotation,
-            settings.logging.retention
+
+class StartupTimer:
+    """记录启动各阶段耗时"""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def summary(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        parts = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.phases)
+        return f"Startup completed in {total:.1f}ms ({parts})"
+
+
+# 不影响 provider 实例的配置字段，只有这些字段变化时重载沿用旧实例
+_PROVIDER_RUNTIME_FIELDS = {
+    "gemini": {"cookie_sync_interval"},
+    "g4f": {"models_refresh_interval"},
+}
+
+
+def _reusable_providers(settings: Settings, previous: runtime.Runtime) -> dict[str, BaseProvider]:
+    """旧快照中配置未变的 provider，重载时沿用（保留已初始化的客户端和 cookie 轮换状态）"""
+    old = previous.settings
+    if not previous.version or (settings.stub, settings.cassette) != (old.stub, old.cassette):
+        return {}
+    reuse = {}
+    for name, provider in (("gemini", previous.gemini), ("g4f", previous.g4f)):
+        exclude = _PROVIDER_RUNTIME_FIELDS[name]
+        if provider is not None and (
+            getattr(settings, name).model_dump(exclude=exclude) == getattr(old, name).model_dump(exclude=exclude)
+        ):
+            reuse[name] = provider
+    return reuse
+
+
+def _build_providers(settings: Settings, reuse: dict[str, BaseProvider] | None = None):
+    """按需导入并创建 provider，未启用的 provider 不会导入其依赖库
+
+    reuse 中的 provider（配置未变的旧实例）直接沿用，不再创建。
+    """
+    reuse = reuse or {}
+    if settings.stub.enabled:
+        # 压测模式：两个 provider 都替换为本地假上游
+        from app.providers.stub import STUB_G4F_MODELS, StubG4FProvider, StubGeminiProvider
+
+        return (
+            reuse.get("gemini") or StubGeminiProvider(settings.stub, settings.gemini.models),
+            reuse.get("g4f") or StubG4FProvider(settings.stub, STUB_G4F_MODELS, settings.g4f.model_prefixes),
         )
-    
-    # 启动配置热重载观察器
-    config_watcher = ConfigWatcher(config_manager)
-    config_watcher.start()
-
-# 优先使用配置文件中的设置，否则使用环境变量
-if config_manager:
-    settings = config_manager.get_settings()
-else:
-    settings = Settings.from_env()
-
-app = FastAPI()
-app.add_middleware(RequestLoggingMiddleware)
-app.middleware("http")(auth_middleware)
-
-# 挂载静态文件目录
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-
-# 根路径返回 admin.html
-@app.get("/")
-async def root():
-    return FileResponse("app/static/admin.html")
-
-app.include_router(openai_router)
-app.include_router(claude_router)
-app.include_router(admin_router)
-app.include_router(files_router)
-
-
-gemini_provider = None
-if settings.gemini.enabled and settings.gemini.cookie_path:
-    gemini_provider = GeminiProvider(
-        cookie_path=settings.gemini.cookie_path,
-        model=settings.gemini.models[0] if settings.gemini.models else None,
-        proxy=settings.gemini.proxy,
-        auto_refresh=settings.gemini.auto_refresh,
-        timeout=settings.gemini.timeout,
+    if settings.cassette.replay:
+        # 回放录制的上游交互，同样不访问网络
+        from app.providers.replay import ReplayG4FProvider, ReplayGeminiProvider
+
+        if "gemini" in reuse and "g4f" in reuse:
+            return reuse["gemini"], reuse["g4f"]
+        interactions = cassette.load(settings.cassette.replay)
+        return (
+            reuse.get("gemini") or ReplayGeminiProvider(interactions, settings.cassette.time_scale),
+            reuse.get("g4f") or ReplayG4FProvider(interactions, settings.cassette.time_scale),
+        )
+
+    gemini_provider = reuse.get("gemini")
+    if gemini_provider is None and settings.gemini.enabled and settings.gemini.cookie_path:
+        from app.providers.gemini import GeminiProvider
+
+        gemini_provider = GeminiProvider(
+            cookie_path=settings.gemini.cookie_path,
+            model=settings.gemini.models[0] if settings.gemini.models else None,
+            proxy=settings.gemini.proxy,
+            auto_refresh=settings.gemini.auto_refresh,
+            timeout=settings.gemini.timeout,
+        )
+
+    g4f_provider = reuse.get("g4f")
+    if g4f_provider is None and settings.g4f.enabled:
+        from app.providers.g4f import G4FProvider
+
+        g4f_provider = G4FProvider(
+            providers=settings.g4f.providers,
+            model_prefixes=settings.g4f.model_prefixes,
+            timeout=settings.g4f.timeout,
+            cookies_dir=settings.g4f.cookies_dir,
+        )
+
+    if settings.cassette.record:
+        from app.providers.replay import RecordingProvider
+
+        if gemini_provider is not None and "gemini" not in reuse:
+            gemini_provider = RecordingProvider(gemini_provider)
+        if g4f_provider is not None and "g4f" not in reuse:
+            g4f_provider = RecordingProvider(g4f_provider)
+    return gemini_provider, g4f_provider
+
+
+async def build_runtime(settings: Settings, previous: runtime.Runtime) -> runtime.Runtime:
+    """根据配置构建新的运行时快照
+
+    延迟统计跨快照保留，新配置下的超时和 hedging 阈值无需重新学习；
+    配置未变的 provider、熔断器和调度器沿用旧快照中的实例，重载不会丢失熔断状态和排队中的请求。
+    重载时新建的 provider 在替换快照前完成初始化。
+    """
+    reloading = previous.version > 0
+    reuse = _reusable_providers(settings, previous)
+    # provider 构建可能触发重量级导入，放到线程中执行
+    gemini_provider, g4f_provider = await asyncio.to_thread(_build_providers, settings, reuse)
+    if reloading:
+        for provider in (gemini_provider, g4f_provider):
+            if provider is None or provider in reuse.values():
+                continue
+            try:
+                await provider.warm()
+            except Exception as e:
+                # 初始化失败不阻止重载，首个请求时会再次尝试并返回具体错误
+                logger.warning(f"Failed to warm up {provider.name} provider: {e}")
+
+    # 多 worker 时熔断冷却状态跨进程共享
+    state = shared_state.get_state()
+    shared = state if state.shared else None
+    old = previous.settings.routing
+
+    # 统一模型目录
+    catalog = ModelCatalog(settings.gemini.models, g4f_provider)
+    if previous.version and g4f_provider is not None:
+        # 重载时先完成模型发现再替换，避免目录短暂缺失 g4f 模型
+        await catalog.refresh()
+
+    # 故障转移路由（每个 provider 一个熔断器，含重试、自适应超时与可选 hedging）
+    provider_router = FailoverRouter(
+        {"gemini": gemini_provider, "g4f": g4f_provider},
+        fallbacks=settings.routing.fallbacks,
+        breakers=(
+            previous.router.breakers
+            if reloading and settings.routing.circuit_breaker == old.circuit_breaker
+            else CircuitBreakerRegistry(settings.routing.circuit_breaker, shared)
+        ),
+        hedging=settings.routing.hedging,
+        retry=settings.routing.retry,
+        timeouts=AdaptiveTimeouts(settings.routing.timeouts, previous.router.latency),
+        scheduler=(
+            previous.router.scheduler
+            if reloading and settings.routing.scheduler == old.scheduler
+            else FairScheduler(settings.routing.scheduler)
+        ),
+        model_label=catalog.metric_label,
     )
 
-g4f_provider = None
-if settings.g4f.enabled:
-    g4f_provider = G4FProvider(
-        providers=settings.g4f.providers,
-        model_prefixes=settings.g4f.model_prefixes,
-        timeout=settings.g4f.timeout,
-        cookies_dir=settings.g4f.cookies_dir,
+    return runtime.Runtime(
+        settings=settings,
+        gemini=gemini_provider,
+        g4f=g4f_provider,
+        router=provider_router,
+        catalog=catalog,
+        version=previous.version + 1,
     )
 
-g4f_models: list[str] = []
-if g4f_provider is not None:
-    try:
-        g4f_models = [m["id"] for m in (asyncio.run(g4f_provider.list_models()) or [])]
-    except Exception:
-        g4f_models = []
 
-configure_openai(gemini_provider, g4f_provider, settings.gemini.models)
-configure_claude(settings.gemini.models, g4f_models, gemini_provider, g4f_provider)
-configure_files(gemini_provider)
+def _apply_auth(rt: runtime.Runtime) -> None:
+    """配置重载后更新认证配置（API Key）"""
+    configure_auth(rt.settings.auth.api_key, rt.settings.auth.keys, rt.settings.auth.admin_key)
 
-# 初始化文件管理器 - 支持本地和 Docker 环境
-har_cookies_path = os.getenv("HAR_COOKIES_PATH", "/app/har_and_cookies")
-file_manager = FileManager(base_dir=har_cookies_path)
 
-# 配置 admin 路由
-configure_admin(config_manager, gemini_provider, g4f_provider, file_manager)
+async def _record_error_code(request: Request, exc: HTTPException):
+    """记录返回给客户端的错误码（计入 gateway_errors_total），响应与 FastAPI 默认处理相同"""
+    ctx = request_context.current()
+    error = exc.detail.get("error") if isinstance(exc.detail, dict) else None
+    if ctx is not None and isinstance(error, dict) and error.get("code"):
+        ctx.error_code = error["code"]
+    return await http_exception_handler(request, exc)
 
-# 配置认证（API Key）
-configure_auth(settings.auth.api_key)
 
+def _register_collectors() -> None:
+    """抓取 /metrics 时从当前快照读取的状态指标"""
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """应用关闭时清理资源"""
-    global config_watcher
-    if config_watcher:
-        config_watcher.stop()
+    def scheduler_queued():
+        for priority, count in runtime.current().router.scheduler.snapshot()["queued"].items():
+            yield {"priority": priority}, count
+
+    def scheduler_active():
+        yield {}, runtime.current().router.scheduler.snapshot()["active"]
+
+    def provider_healthy():
+        # 每个 provider（账号）：熔断器非 open 即视为可用
+        router = runtime.current().router
+        breakers = router.breakers.snapshot()
+        for name in router.providers:
+            state = breakers.get(name, {}).get("state", "closed")
+            yield {"provider": name, "state": state}, 0 if state == "open" else 1
+
+    metrics.registry.collector("gateway_scheduler_queued", "Requests waiting for an upstream slot", scheduler_queued)
+    metrics.registry.collector("gateway_scheduler_active", "Upstream slots in use", scheduler_active)
+    metrics.registry.collector("gateway_provider_healthy", "Provider/account availability by circuit state", provider_healthy)
+
+
+async def _refresh_catalog() -> None:
+    """启动时发现一次模型，之后按 models_refresh_interval 定时刷新当前快照的模型目录
+
+    间隔不大于 0 时不做定时刷新，首次发现后即退出。
+    """
+    while True:
+        rt = runtime.manager.current
+        try:
+            await rt.catalog.refresh()
+            logger.info(f"Model catalog refreshed: {len(rt.catalog.models)} models")
+        except Exception as e:
+            logger.warning(f"Model catalog refresh failed: {e}")
+        interval = rt.settings.g4f.models_refresh_interval
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timer = StartupTimer()
+    loop = asyncio.get_running_loop()
+
+    with timer.phase("config"):
+        config_manager, settings = load_config()
+
+    with timer.phase("shared_state"):
+        # 多 worker 模式下启动器通过 STATE_PATH 传入共享状态文件
+        state = shared_state.configure(settings.server.state_path or os.getenv("STATE_PATH", ""))
+        if state.shared:
+            logger.info(f"Worker {shared_state.worker_id()} using shared state at {state.path}")
+        # 在创建 Gemini 客户端之前选出 cookie refresher
+        cookie_refresher.interval = settings.gemini.cookie_sync_interval
+        cookie_refresher.elect()
+
+    with timer.phase("usage"):
+        usage.configure(settings.usage)
+        tracing.configure(settings.tracing)
+        cassette.configure(settings.cassette)
+        profiling.configure(settings.profiling)
+        loop_monitor.configure(settings.loop_monitor)
+
+    with timer.phase("logging"):
+        log_manager.configure(settings.logging)
+
+    with timer.phase("runtime"):
+        runtime.manager.builder = build_runtime
+        runtime.manager.add_listener(_apply_auth)
+        runtime.manager.install(await build_runtime(settings, runtime.manager.current))
+        _apply_auth(runtime.manager.current)
+
+    with timer.phase("routes"):
+        # 初始化文件管理器 - 支持本地和 Docker 环境
+        from app.services.file_manager import FileManager
+
+        har_cookies_path = os.getenv("HAR_COOKIES_PATH", "/app/har_and_cookies")
+        file_manager = FileManager(base_dir=har_cookies_path)
+
+        # 配置 admin 路由
+        configure_admin(config_manager, file_manager)
+
+    config_watcher = None
+    if config_manager is not None:
+        with timer.phase("watcher"):
+            # 启动配置热重载观察器；观察器线程中的变更交给事件循环重建快照
+            from app.config.watcher import ConfigWatcher
+
+            config_watcher = ConfigWatcher(config_manager)
+            config_watcher.start(
+                reload_callback=lambda old, new: asyncio.run_coroutine_threadsafe(
+                    runtime.manager.reload(new), loop
+                )
+            )
+
+    # 后台刷新模型目录，不阻塞启动
+    catalog_refresh = asyncio.create_task(_refresh_catalog())
+    # 在线程中预加载 token 编码，首个请求不必在事件循环上加载
+    tokenizer_warm = asyncio.create_task(asyncio.to_thread(tokenizer.default.warm))
+    # 持久化轮换后的 cookie，并同步其他 worker 写入的 cookie
+    cookie_sync = asyncio.create_task(cookie_refresher.run(lambda: runtime.manager.current.gemini))
+    # 用量记录批量落盘
+    usage_flush = asyncio.create_task(usage.recorder.run())
+    trace_flush = asyncio.create_task(tracing.writer.run())
+    cassette_flush = asyncio.create_task(cassette.recorder.run())
+    # 事件循环延迟监控与阻塞检测
+    loop_watch = asyncio.create_task(loop_monitor.monitor.run()) if settings.loop_monitor.enabled else None
+
+    logger.info(timer.summary())
+    try:
+        yield
+    finally:
+        # 应用关闭时清理资源
+        catalog_refresh.cancel()
+        tokenizer_warm.cancel()
+        cookie_sync.cancel()
+        if loop_watch is not None:
+            loop_watch.cancel()
+        usage_flush.cancel()
+        await usage.recorder.flush()
+        trace_flush.cancel()
+        await tracing.writer.flush()
+        cassette_flush.cancel()
+        await cassette.recorder.flush()
+        gemini = runtime.manager.current.gemini
+        if gemini is not None and cookie_refresher.is_leader:
+            # 退出前写回最新 cookie，重启后不必从过期 cookie 开始
+            gemini.persist_cookies()
+        cookie_refresher.resign()
+        if config_watcher:
+            config_watcher.stop()
+        runtime.manager.builder = None
+        for provider in runtime.manager.current.providers:
+            await provider.close()
         logger.info("Application shutdown complete")
+        await log_manager.flush()
+
+
+def create_app() -> FastAPI:
+    """创建应用；provider 等重资源在 lifespan 中初始化"""
+    app = FastAPI(lifespan=lifespan)
+    app.add_exception_handler(HTTPException, _record_error_code)
+    _register_collectors()
+    # 单请求 profiling 在认证之内，只对管理 key 生效
+    app.add_middleware(ProfilingMiddleware)
+    app.middleware("http")(auth_middleware)
+    # 日志中间件在认证之外，被拒绝的请求也会记录
+    app.add_middleware(RequestLoggingMiddleware)
+    # 最外层：整个请求周期租用同一个运行时快照
+    app.add_middleware(RuntimeLeaseMiddleware)
+
+    # 挂载静态文件目录
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+
+    # 根路径返回 admin.html
+    @app.get("/")
+    async def root():
+        return FileResponse("app/static/admin.html")
+
+    app.include_router(openai_router)
+    app.include_router(claude_router)
+    app.include_router(public_admin_router)
+    app.include_router(admin_router)
+    app.include_router(files_router)
+    return app
+
+
+app = create_app()
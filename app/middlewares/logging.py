@@ -2,7 +2,8 @@
 import time
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
-from app.services.logger import logger
+from app.services import metrics, request_context, runtime, tracing, usage
+from app.services.logger import log_manager, logger
 
 
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
@@ -10,6 +11,8 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
     
     async def dispatch(self, request: Request, call_next):
         start_time = time.time()
+        ctx = request_context.start(tracing.request_id(request.headers.get("X-Request-ID")))
+        metrics.IN_FLIGHT.inc()
         
         # 记录请求开始
         client_host = request.client.host if request.client else "unknown"
@@ -21,18 +24,83 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             # 计算耗时
             process_time = time.time() - start_time
             
-            # 记录请求完成
-            logger.info(
-                f"{request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s"
-            )
+            # 记录请求完成（错误和慢请求总是记录，其余按采样率记录）
+            if log_manager.should_log_access(response.status_code, process_time):
+                _access_logger(request, ctx, response.status_code, process_time).info(
+                    f"{request.method} {request.url.path} - {response.status_code} - {process_time:.3f}s [{ctx.request_id}]"
+                )
             
+            usage.recorder.record_request(process_time, response.status_code)
+            _observe(request, ctx, response.status_code, process_time)
+            if ctx.model and response.status_code < 400:
+                _observe_first_chunk(response, ctx)
+
+            tracing.writer.write(ctx, request.method, request.url.path, response.status_code, process_time)
+
             # 添加响应头
             response.headers["X-Process-Time"] = str(process_time)
+            response.headers["X-Request-ID"] = ctx.request_id
+            if tracing.writer.settings.server_timing:
+                response.headers["Server-Timing"] = tracing.server_timing(ctx, process_time)
+            if ctx.context_trimmed:
+                response.headers["X-Context-Trimmed"] = ctx.context_trimmed
+            if ctx.retries:
+                response.headers["X-Gateway-Retries"] = str(ctx.retries)
             return response
             
         except Exception as e:
             process_time = time.time() - start_time
-            logger.error(
+            usage.recorder.record_request(process_time, 500)
+            _observe(request, ctx, 500, process_time)
+            tracing.writer.write(ctx, request.method, request.url.path, 500, process_time)
+            _access_logger(request, ctx, 500, process_time).error(
                 f"{request.method} {request.url.path} - ERROR - {process_time:.3f}s - {str(e)}"
             )
             raise
+        finally:
+            metrics.IN_FLIGHT.dec()
+
+
+def _access_logger(request: Request, ctx: request_context.RequestContext, status: int, seconds: float):
+    """绑定结构化字段，JSON 日志中作为顶层字段输出"""
+    return logger.bind(
+        request_id=ctx.request_id,
+        method=request.method,
+        path=request.url.path,
+        status=status,
+        duration_ms=round(seconds * 1000, 2),
+        api_key=ctx.api_key,
+        model=ctx.model,
+    )
+
+
+def _route_label(request: Request) -> str:
+    """用路由模板而不是实际路径作为标签，避免标签基数膨胀"""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _observe(request: Request, ctx: request_context.RequestContext, status: int, seconds: float) -> None:
+    route = _route_label(request)
+    metrics.REQUESTS.inc(route, request.method, status)
+    metrics.REQUEST_DURATION.observe(route, value=seconds)
+    if ctx.error_code:
+        metrics.ERRORS.inc(ctx.error_code)
+    if ctx.model:
+        metrics.MODEL_REQUESTS.inc(runtime.current().catalog.metric_label(ctx.model), ctx.provider or "none", status)
+
+
+def _observe_first_chunk(response, ctx: request_context.RequestContext) -> None:
+    """响应体第一块发给客户端时记录首 token 时间（流式响应在路由返回后才开始发送）"""
+    body = response.body_iterator
+    label = runtime.current().catalog.metric_label(ctx.model)
+
+    async def iterate():
+        observed = False
+        async for chunk in body:
+            if not observed and chunk:
+                observed = True
+                metrics.TIME_TO_FIRST_TOKEN.observe(label, value=time.monotonic() - ctx.started)
+            yield chunk
+
+    response.body_iterator = iterate()
@@ -0,0 +1,42 @@
+"""单请求 profiling 中间件
+
+管理 key 认证的请求带 X-Profile 头时采样该请求，直到响应体（含流式响应）发送完毕。
+结果保存在内存（及可选目录）中，响应头 X-Profile-ID 给出查询用的 ID：
+GET /admin/profile/requests/{id} 下载折叠格式的调用栈。
+"""
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services import profiling, request_context
+
+
+class ProfilingMiddleware:
+    """使用纯 ASGI 中间件而非 BaseHTTPMiddleware：无论响应体是否被发送
+    （客户端提前断开、发送出错），请求结束时都会结束采样"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        ctx = request_context.current()
+        if (
+            scope["type"] != "http"
+            or ctx is None
+            or not ctx.admin
+            or not Headers(scope=scope).get(profiling.HEADER)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = profiling.profiler
+        profile = profiler.begin(ctx, scope["path"])
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-ID", profile.request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.end(profile)
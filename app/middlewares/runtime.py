@@ -0,0 +1,21 @@
+"""运行时快照租约中间件"""
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.services import runtime
+
+
+class RuntimeLeaseMiddleware:
+    """每个请求租用当前运行时快照，直到响应（含流式响应体）发送完毕
+
+    使用纯 ASGI 中间件而非 BaseHTTPMiddleware，以便覆盖整个响应周期。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        async with runtime.lease():
+            await self.app(scope, receive, send)
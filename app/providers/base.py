@@ -15,3 +15,11 @@ class BaseProvider(ABC):
     @abstractmethod
     async def list_models(self) -> list[dict]:
         raise NotImplementedError
+
+    async def warm(self) -> None:
+        """预先建立上游连接（配置重载时在替换快照前调用），默认无需准备"""
+        return None
+
+    async def close(self) -> None:
+        """释放 provider 持有的资源（配置重载后旧 provider 会被关闭）"""
+        return None
@@ -9,12 +9,10 @@ from g4f import cookies as g4f_cookies
 
 from app.providers.base import BaseProvider
 from app.services.logger import logger
+from app.services.model_registry import ModelRegistry
 
 # 默认 cookie 目录
 default_cookies_dir = "/app/har_and_cookies"
-if Path(default_cookies_dir).exists():
-    g4f_cookies.set_cookies_dir(default_cookies_dir)
-    logger.info(f"g4f cookies directory set to: {default_cookies_dir}")
 
 
 class G4FProvider(BaseProvider):
@@ -39,10 +37,11 @@ class G4FProvider(BaseProvider):
         self.timeout = timeout
         self._client = AsyncClient()
         
-        # 如果指定了 cookie 目录，设置它
-        if cookies_dir and Path(cookies_dir).exists():
+        # 设置 cookie 目录（未指定时使用默认目录）
+        cookies_dir = cookies_dir or default_cookies_dir
+        if Path(cookies_dir).exists():
             g4f_cookies.set_cookies_dir(cookies_dir)
-            logger.info(f"g4f cookies directory updated to: {cookies_dir}")
+            logger.info(f"g4f cookies directory set to: {cookies_dir}")
     
     def _get_provider(self, model: str) -> Any | None:
         """根据模型名获取对应的 g4f Provider"""
@@ -65,17 +64,15 @@ class G4FProvider(BaseProvider):
         # 默认使用 OpenaiChat
         return g4f.Provider.OpenaiChat
     
-    async def list_models(self) -> list[dict]:
-        """列出支持的模型 - 从 g4f 库动态获取"""
-        models = []
-        
+    def available_models(self) -> list[str]:
+        """g4f 库支持的全部模型（未按前缀过滤）"""
         # 从 g4f.Provider.OpenaiChat 获取最新模型列表
         try:
             from g4f.Provider.openai.models import models as openai_models
-            models.extend(openai_models)
+            return list(openai_models)
         except Exception:
             # 如果获取失败，使用默认列表
-            models = [
+            return [
                 "gpt-5-2", "gpt-5-2-instant", "gpt-5-2-thinking",
                 "gpt-5-1", "gpt-5-1-instant", "gpt-5-1-thinking",
                 "gpt-5", "gpt-5-instant", "gpt-5-thinking",
@@ -83,14 +80,10 @@ class G4FProvider(BaseProvider):
                 "gpt-4o", "gpt-4o-mini",
                 "o1", "o1-mini", "o3-mini", "o3-mini-high", "o4-mini", "o4-mini-high",
             ]
-        
-        # 根据配置的 prefixes 过滤
-        if self.model_prefixes:
-            filtered = [m for m in models 
-                       if any(m.startswith(p) for p in self.model_prefixes)]
-        else:
-            filtered = models
-        
+    
+    async def list_models(self) -> list[dict]:
+        """列出支持的模型 - 从 g4f 库动态获取，按配置的 prefixes 过滤"""
+        filtered = ModelRegistry(self.model_prefixes).filter_models(self.available_models())
         return [{"id": model, "object": "model", "owned_by": "g4f"} 
                 for model in filtered]
     
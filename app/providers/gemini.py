@@ -1,10 +1,16 @@
+import asyncio
 import json
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any, Iterable
 
 from gemini_webapi import GeminiClient
 
 from app.providers.base import BaseProvider
+from app.services.chat import Message, messages_from_dicts
+from app.services.cookie_store import COOKIE_NAMES, CookieStore, refresher
+from app.services.logger import logger
+from app.services.tracing import span
 from app.utils.errors import classify_exception, AuthenticationError, AIGatewayError
 
 
@@ -30,8 +36,15 @@ class GeminiProvider(BaseProvider):
         self.auto_close = auto_close
         self.close_delay = close_delay
         self.auto_refresh = auto_refresh
+        self.store = CookieStore(cookie_path)
         self._client: GeminiClient | None = None
         self._initialized = False
+        self._cookie_mtime: int | None = None  # 当前客户端所用 cookie 文件的 mtime
+        self._cookie_values: tuple[str, str] | None = None
+        self._leases: dict[int, int] = {}  # 每个客户端上进行中的请求数
+        self._rotate_lock = asyncio.Lock()
+        self._retiring: dict[asyncio.Task, GeminiClient] = {}  # 等待关闭的旧客户端
+        self.drain_timeout = 300.0
 
     @staticmethod
     def load_cookie_values(path: str) -> tuple[str, str]:
@@ -44,69 +57,192 @@ class GeminiProvider(BaseProvider):
             psidts = ""
         return psid, psidts
 
+    def _read_cookies(self) -> tuple[str, str, int | None]:
+        try:
+            mtime = self.store.mtime()
+            psid, psidts = self.load_cookie_values(self.cookie_path)
+        except ValueError as e:
+            raise AuthenticationError(f"Invalid cookie: {e}")
+        except FileNotFoundError:
+            raise AuthenticationError("Cookie file not found")
+        return psid, psidts, mtime
+
+    async def _init_client(self, client: GeminiClient) -> None:
+        try:
+            with span("client_init"):
+                await client.init(
+                    timeout=self.timeout,
+                    auto_close=self.auto_close,
+                    close_delay=self.close_delay,
+                    # 多 worker 时只有选出的 refresher 轮换 cookie
+                    auto_refresh=self.auto_refresh and refresher.is_leader,
+                )
+        except Exception as e:
+            raise classify_exception(e, "gemini")
+
     async def _ensure_client(self) -> GeminiClient:
         if self._client is None:
-            try:
-                psid, psidts = self.load_cookie_values(self.cookie_path)
-            except ValueError as e:
-                raise AuthenticationError(f"Invalid cookie: {e}")
-            except FileNotFoundError:
-                raise AuthenticationError("Cookie file not found")
-            
+            psid, psidts, mtime = self._read_cookies()
             self._client = GeminiClient(psid, psidts, proxy=self.proxy)
+            self._cookie_mtime = mtime
+            self._cookie_values = (psid, psidts)
         
         if not self._initialized:
-            try:
-                await self._client.init(
-                    timeout=self.timeout,
-                    auto_close=self.auto_close,
-                    close_delay=self.close_delay,
-                    auto_refresh=self.auto_refresh,
-                )
-                self._initialized = True
-            except Exception as e:
-                raise classify_exception(e, "gemini")
+            await self._init_client(self._client)
+            self._initialized = True
         
         return self._client
 
+    @asynccontextmanager
+    async def _lease_client(self):
+        """租用当前客户端；轮换后旧客户端等租约归零再关闭"""
+        client = await self._ensure_client()
+        key = id(client)
+        self._leases[key] = self._leases.get(key, 0) + 1
+        try:
+            yield client
+        finally:
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+
+    async def warm(self) -> None:
+        """创建并初始化客户端，新快照上的首个请求不必等待初始化"""
+        await self._ensure_client()
+
+    async def close(self) -> None:
+        for task in list(self._retiring):
+            task.cancel()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        # 尚未开始执行就被取消的任务不会自行关闭客户端
+        for client in self._retiring.values():
+            await client.close()
+        self._retiring.clear()
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._initialized = False
+
+    def cookies_changed(self) -> bool:
+        """cookie 文件是否在客户端创建后被替换"""
+        return self._client is not None and self.store.mtime() != self._cookie_mtime
+
+    async def reload_cookies(self) -> None:
+        """用文件中的 cookie 轮换客户端"""
+        await self.rotate()
+
+    async def rotate(self, cookies: tuple[str, str] | None = None) -> dict | None:
+        """后台创建并初始化新客户端，成功后原子替换
+
+        cookies 为空时读取 cookie 文件；给出新 cookie 时先用它初始化客户端，
+        成功后才原子写入 cookie 文件，返回写入的内容。
+        初始化期间旧客户端继续服务；初始化失败时保留旧客户端和 cookie 文件并抛出错误。
+        旧客户端在其进行中的请求结束后关闭。
+        """
+        saved = None
+        async with self._rotate_lock:
+            if cookies is None:
+                psid, psidts, mtime = self._read_cookies()
+            else:
+                psid, psidts = cookies
+            client = GeminiClient(psid, psidts, proxy=self.proxy)
+            try:
+                await self._init_client(client)
+            except Exception:
+                await client.close()
+                raise
+            if cookies is not None:
+                saved = self.store.save(psid, psidts)
+                mtime = self.store.mtime()
+
+            previous = self._client
+            self._client, self._initialized = client, True
+            self._cookie_mtime, self._cookie_values = mtime, (psid, psidts)
+            logger.info("Gemini client rotated")
+
+        if previous is not None:
+            self._retiring[asyncio.create_task(self._retire(previous))] = previous
+        return saved
+
+    async def _retire(self, client: GeminiClient, poll_interval: float = 0.1) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        try:
+            while self._leases.get(id(client)) and loop.time() < deadline:
+                await asyncio.sleep(poll_interval)
+        finally:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Failed to close retired Gemini client: {e}")
+            self._retiring.pop(asyncio.current_task(), None)
+
+    async def update_cookies(self, psid: str, psidts: str = "") -> dict:
+        """用新 cookie 轮换客户端：新客户端初始化成功后才原子写入 cookie 文件
+
+        失败时 cookie 文件和旧客户端都不受影响，其他 worker 也不会加载无效的 cookie。
+        """
+        return await self.rotate((psid, psidts))
+
+    def persist_cookies(self) -> bool:
+        """把客户端内存中轮换后的 cookie 原子写回文件，有变化时返回 True"""
+        if self._client is None or not self._initialized or self._cookie_values is None:
+            return False
+        current = []
+        for name in COOKIE_NAMES:
+            try:
+                current.append(self._client.cookies.get(name))
+            except Exception as e:
+                logger.debug(f"Cannot read rotated cookie {name}: {e}")
+                return False
+        psid, psidts = current
+        if not psid or (psid, psidts or "") == self._cookie_values:
+            return False
+        self.store.save(psid, psidts or "")
+        self._cookie_mtime = self.store.mtime()
+        self._cookie_values = (psid, psidts or "")
+        return True
+
     @staticmethod
-    def _extract_text(content: Any) -> str:
-        if isinstance(content, str):
-            return content
-        if isinstance(content, list):
-            parts: list[str] = []
-            for item in content:
-                if isinstance(item, dict) and item.get("type") == "text":
-                    parts.append(item.get("text", ""))
-            return "\n".join(part for part in parts if part)
-        return ""
-
-    @classmethod
-    def _messages_to_prompt(cls, messages: Iterable[dict]) -> str:
-        lines: list[str] = []
-        for message in messages:
-            role = message.get("role", "user")
-            text = cls._extract_text(message.get("content"))
-            if text:
-                lines.append(f"{role}: {text}")
-        return "\n".join(lines)
-
-    async def chat_completions(self, messages: list[dict], model: str | None = None, **kwargs) -> dict:
+    def _as_messages(messages: Iterable[Message | dict]) -> list[Message]:
+        messages = list(messages)
+        if messages and isinstance(messages[0], dict):
+            return messages_from_dicts(messages)
+        return messages
+
+    @staticmethod
+    def _messages_to_prompt(messages: Iterable[Message]) -> str:
+        return "\n".join(f"{m.role}: {m.text}" for m in messages if m.text)
+
+    async def chat_completions(self, messages: list[Message | dict], model: str | None = None, **kwargs) -> dict:
+        """对话；消息中的图片附件解码为临时文件随请求上传"""
+        files: list[str] = []
         try:
-            client = await self._ensure_client()
-            prompt = self._messages_to_prompt(messages)
+            messages = self._as_messages(messages)
+            with span("prompt"):
+                prompt = self._messages_to_prompt(messages)
+            attachments = [a for m in messages for a in m.attachments]
+            if attachments:
+                with span("tempfiles"):
+                    files = [a.write_temp() for a in attachments]
+
+            options: dict[str, Any] = {}
+            if files:
+                options["files"] = files
             selected_model = model or self.model
-            
             if selected_model:
-                response = await client.generate_content(prompt, model=selected_model)
-            else:
-                response = await client.generate_content(prompt)
+                options["model"] = selected_model
+            async with self._lease_client() as client:
+                response = await client.generate_content(prompt, **options)
             
             return {"text": response.text, "images": response.images, "raw": response}
         except AIGatewayError:
             raise
         except Exception as e:
             raise classify_exception(e, "gemini")
+        finally:
+            for f in files:
+                Path(f).unlink(missing_ok=True)
 
     async def chat_completions_with_files(
         self,
@@ -116,20 +252,20 @@ class GeminiProvider(BaseProvider):
         model: str | None = None
     ) -> dict:
         try:
-            client = await self._ensure_client()
-            
             # 构建提示词（包含历史消息上下文）
-            context = self._messages_to_prompt(messages)
+            with span("prompt"):
+                context = self._messages_to_prompt(self._as_messages(messages))
             if context:
                 prompt = f"{context}\n\n{text}"
             else:
                 prompt = text
             
             selected_model = model or self.model
-            if selected_model:
-                response = await client.generate_content(prompt, files=files, model=selected_model)
-            else:
-                response = await client.generate_content(prompt, files=files)
+            async with self._lease_client() as client:
+                if selected_model:
+                    response = await client.generate_content(prompt, files=files, model=selected_model)
+                else:
+                    response = await client.generate_content(prompt, files=files)
             
             return {"text": response.text, "images": response.images, "raw": response}
         except AIGatewayError:
@@ -147,16 +283,16 @@ class GeminiProvider(BaseProvider):
         import aiohttp
         
         try:
-            client = await self._ensure_client()
             selected_model = model or self.model
             
             # 构建生图提示词
             image_prompt = f"Generate an image: {prompt}"
             
-            if selected_model:
-                response = await client.generate_content(image_prompt, model=selected_model)
-            else:
-                response = await client.generate_content(image_prompt)
+            async with self._lease_client() as client:
+                if selected_model:
+                    response = await client.generate_content(image_prompt, model=selected_model)
+                else:
+                    response = await client.generate_content(image_prompt)
             
             # 处理返回的图像
             images = []
@@ -165,15 +301,17 @@ class GeminiProvider(BaseProvider):
                 if hasattr(img, 'url') and img.url:
                     # 下载图像数据
                     try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(img.url, timeout=30) as resp:
-                                if resp.status == 200:
-                                    image_bytes = await resp.read()
-                                    b64_data = base64.b64encode(image_bytes).decode('utf-8')
-                                    images.append({"b64_json": b64_data})
-                                else:
-                                    # 如果下载失败，返回 URL
-                                    images.append({"url": img.url})
+                        with span("image_download"):
+                            async with aiohttp.ClientSession() as session:
+                                async with session.get(img.url, timeout=30) as resp:
+                                    image_bytes = await resp.read() if resp.status == 200 else None
+                        if image_bytes is not None:
+                            with span("image_encode"):
+                                b64_data = base64.b64encode(image_bytes).decode('utf-8')
+                            images.append({"b64_json": b64_data})
+                        else:
+                            # 如果下载失败，返回 URL
+                            images.append({"url": img.url})
                     except Exception as e:
                         # 下载失败时返回 URL
                         images.append({"url": img.url})
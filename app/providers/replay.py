@@ -0,0 +1,212 @@
+"""上游交互的录制与回放 provider
+
+- RecordingProvider 包装真实的 Gemini / g4f provider，把每次上游调用交给 cassette.recorder 记录，
+  其他属性（cookie 管理、模型发现等）原样转发
+- ReplayGeminiProvider / ReplayG4FProvider 按录制文件回放：同一方法和模型的录制记录依次循环使用
+  （没有该模型的记录时使用同一方法的任意记录），按原耗时 × time_scale 等待后返回相同形态的回复
+  或抛出相同类型的错误。文本未录制原文时以等长占位文本代替，图片以等大小的随机数据代替
+配合 benchmarks.loadgen --replay，可以在隔离环境中复现生产流量的回复形态和耗时分布。
+"""
+import asyncio
+import base64
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from app.providers.base import BaseProvider
+from app.services import cassette
+from app.utils.errors import AIGatewayError, AuthenticationError, ProviderError, RateLimitError
+
+_FILLER = "lorem ipsum dolor sit amet "
+
+
+class RecordingProvider(BaseProvider):
+    def __init__(self, inner: BaseProvider) -> None:
+        self.inner = inner
+
+    @property
+    def name(self) -> str:
+        return self.inner.name
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self.inner, item)
+
+    async def _record(
+        self,
+        method: str,
+        model: str | None,
+        request: dict[str, int],
+        call: Awaitable[Any],
+        extract: Callable[[Any], tuple[str | None, list[dict] | None]],
+    ) -> Any:
+        started = time.monotonic()
+        try:
+            result = await call
+        except Exception as e:
+            cassette.recorder.record(self.name, method, model, request, started, time.monotonic() - started, error=e)
+            raise
+        text, images = extract(result)
+        cassette.recorder.record(self.name, method, model, request, started, time.monotonic() - started,
+                                 text=text, images=images)
+        return result
+
+    async def chat_completions(self, *args, **kwargs) -> dict:
+        if self.name == "gemini":
+            messages = kwargs.get("messages", args[0] if args else None)
+            model = kwargs.get("model", args[1] if len(args) > 1 else None)
+            extract = _gemini_text
+        else:
+            payload = args[0] if args else kwargs["payload"]
+            messages, model = payload.get("messages"), payload.get("model")
+            extract = _openai_text
+        request = cassette.describe_request(messages)
+        return await self._record("chat", model, request, self.inner.chat_completions(*args, **kwargs), extract)
+
+    async def chat_completions_with_files(self, messages: list, text: str, files: list[str], model: str | None = None) -> dict:
+        request = cassette.describe_request(messages, files=len(files))
+        call = self.inner.chat_completions_with_files(messages, text, files, model)
+        return await self._record("chat_files", model, request, call, _gemini_text)
+
+    async def generate_images(self, prompt: str, model: str | None = None, **kwargs) -> list[dict]:
+        request = cassette.describe_request(prompt_chars=len(prompt), n=kwargs.get("n", 1))
+        call = self.inner.generate_images(prompt=prompt, model=model, **kwargs)
+        return await self._record("images", model, request, call, lambda images: (None, images))
+
+    async def list_models(self) -> list[dict]:
+        return await self.inner.list_models()
+
+    async def warm(self) -> None:
+        await self.inner.warm()
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+def _gemini_text(result: dict) -> tuple[str | None, None]:
+    return result.get("text") or "", None
+
+
+def _openai_text(result: dict) -> tuple[str | None, None]:
+    choices = result.get("choices") or [{}]
+    return choices[0].get("message", {}).get("content") or "", None
+
+
+def rebuild_error(provider: str, error: dict[str, Any]) -> BaseException:
+    """按录制的错误信息重建异常，路由层的重试、熔断和故障转移行为与录制时一致"""
+    message = error.get("message", "")
+    code = error.get("code")
+    if code == "rate_limit_exceeded":
+        return RateLimitError(message, retry_after=error.get("retry_after"))
+    if code == "authentication_error":
+        return AuthenticationError(message)
+    if code == "provider_error":
+        return ProviderError(provider, message.removeprefix(f"{provider} error: "))
+    if code:
+        return AIGatewayError(message, code, error.get("status", 500))
+    if error.get("type") == "TimeoutError":
+        return asyncio.TimeoutError(message)
+    # 未分类的原始异常交给路由层按消息内容分类
+    return RuntimeError(message)
+
+
+class ReplayProvider(BaseProvider):
+    name = "replay"
+
+    def __init__(self, interactions: list[dict], time_scale: float = 1.0) -> None:
+        self.time_scale = time_scale
+        self._entries: dict[tuple[str, str | None], list[dict]] = {}
+        self._cursors: dict[tuple[str, str | None], int] = {}
+        models = set()
+        for entry in interactions:
+            if entry.get("provider") != self.name:
+                continue
+            method, model = entry.get("method"), entry.get("model")
+            self._entries.setdefault((method, model), []).append(entry)
+            self._entries.setdefault((method, None), []).append(entry)
+            if model:
+                models.add(model)
+        self.models = sorted(models)
+        self.replayed = 0
+        self._images: dict[int, str] = {}
+
+    def has(self, method: str) -> bool:
+        return (method, None) in self._entries
+
+    def _next(self, method: str, model: str | None) -> dict:
+        key = (method, model) if (method, model) in self._entries else (method, None)
+        entries = self._entries.get(key)
+        if not entries:
+            raise ProviderError(self.name, f"no recorded {method} interaction to replay")
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        return entries[cursor % len(entries)]
+
+    async def _replay(self, method: str, model: str | None) -> dict:
+        entry = self._next(method, model)
+        self.replayed += 1
+        if self.time_scale > 0:
+            await asyncio.sleep(entry.get("duration_ms", 0) / 1000 * self.time_scale)
+        if "error" in entry:
+            raise rebuild_error(self.name, entry["error"])
+        return entry.get("response", {})
+
+    @staticmethod
+    def _text(response: dict) -> str:
+        if "text" in response:
+            return response["text"]
+        chars = response.get("text_chars", 0)
+        return (_FILLER * (chars // len(_FILLER) + 1))[:chars]
+
+    def _image(self, size: int) -> str:
+        if size not in self._images:
+            self._images[size] = base64.b64encode(os.urandom(size)).decode()
+        return self._images[size]
+
+    async def generate_images(self, prompt: str, model: str | None = None, n: int = 1) -> list[dict]:
+        response = await self._replay("images", model)
+        return [
+            {"b64_json": self._image(image["bytes"])} if image.get("bytes") else {"url": ""}
+            for image in response.get("images", [])
+        ]
+
+    async def list_models(self) -> list[dict]:
+        return [{"id": m, "object": "model", "owned_by": self.name} for m in self.models]
+
+
+class ReplayGeminiProvider(ReplayProvider):
+    """接口与 GeminiProvider 相同（消息列表 + 模型名，cookie 相关操作为空操作）"""
+
+    name = "gemini"
+
+    async def chat_completions(self, messages: list, model: str | None = None, **kwargs) -> dict:
+        return {"text": self._text(await self._replay("chat", model)), "images": []}
+
+    async def chat_completions_with_files(self, messages: list, text: str, files: list[str], model: str | None = None) -> dict:
+        method = "chat_files" if self.has("chat_files") else "chat"
+        return {"text": self._text(await self._replay(method, model)), "images": []}
+
+    def cookies_changed(self) -> bool:
+        return False
+
+    async def reload_cookies(self) -> None:
+        return None
+
+    def persist_cookies(self) -> bool:
+        return False
+
+
+class ReplayG4FProvider(ReplayProvider):
+    """接口与 G4FProvider 相同（OpenAI 风格的 payload 和响应）"""
+
+    name = "g4f"
+    model_prefixes: list[str] = []
+
+    def available_models(self) -> list[str]:
+        return list(self.models)
+
+    async def chat_completions(self, payload: dict) -> dict:
+        text = self._text(await self._replay("chat", payload.get("model")))
+        return {
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
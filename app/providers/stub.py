@@ -0,0 +1,110 @@
+"""本地假上游 provider（压测用）
+
+stub.enabled 时替换 Gemini 和 g4f，整个网关在单机、无网络环境下也能完整运行：
+- 首 token 时间按对数正态分布采样，之后按 tokens_per_second 生成 output_tokens 个 token
+- 按 error_rate 注入限流 / provider / 认证错误
+- 图片为固定大小的随机字节
+网关其余部分（认证、调度、路由、重试、熔断、用量统计等）不受影响，压测结果反映网关自身的开销。
+"""
+import asyncio
+import base64
+import math
+import os
+import random
+
+from app.config.settings import StubSettings
+from app.providers.base import BaseProvider
+from app.utils.errors import AuthenticationError, ProviderError, RateLimitError
+
+STUB_G4F_MODELS = ["gpt-4o", "gpt-4o-mini", "gpt-image"]
+_WORDS = ("the", "gateway", "routes", "every", "request", "to", "a", "healthy", "upstream", "model")
+
+
+class StubProvider(BaseProvider):
+    name = "stub"
+
+    def __init__(self, settings: StubSettings | None = None, models: list[str] | None = None) -> None:
+        self.settings = settings or StubSettings()
+        self.models = models or []
+        self._random = random.Random(self.settings.seed)
+        self._image_b64: str | None = None
+        self.calls = 0
+
+    def sample_ttft(self) -> float:
+        median = self.settings.ttft_ms / 1000
+        if self.settings.ttft_sigma <= 0:
+            return median
+        return self._random.lognormvariate(math.log(median), self.settings.ttft_sigma) if median > 0 else 0.0
+
+    def _maybe_fail(self) -> None:
+        if self.settings.error_rate <= 0 or self._random.random() >= self.settings.error_rate:
+            return
+        kind = self._random.choice(self.settings.errors or ["provider"])
+        if kind == "rate_limit":
+            raise RateLimitError(f"{self.name} stub rate limited", retry_after=1.0)
+        if kind == "auth":
+            raise AuthenticationError(f"{self.name} stub cookie expired")
+        raise ProviderError(self.name, "stub upstream failure")
+
+    async def _generate(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.sample_ttft())
+        self._maybe_fail()
+        tokens = self.settings.output_tokens
+        if self.settings.tokens_per_second > 0:
+            await asyncio.sleep(tokens / self.settings.tokens_per_second)
+        return " ".join(_WORDS[i % len(_WORDS)] for i in range(tokens))
+
+    def _image(self) -> str:
+        if self._image_b64 is None:
+            self._image_b64 = base64.b64encode(os.urandom(self.settings.image_kb * 1024)).decode()
+        return self._image_b64
+
+    async def generate_images(self, prompt: str, model: str | None = None, n: int = 1) -> list[dict]:
+        await self._generate()
+        return [{"b64_json": self._image()} for _ in range(n)]
+
+    async def list_models(self) -> list[dict]:
+        return [{"id": m, "object": "model", "owned_by": self.name} for m in self.models]
+
+
+class StubGeminiProvider(StubProvider):
+    """接口与 GeminiProvider 相同（消息列表 + 模型名，cookie 相关操作为空操作）"""
+
+    name = "gemini"
+
+    async def chat_completions(self, messages: list, model: str | None = None, **kwargs) -> dict:
+        return {"text": await self._generate(), "images": []}
+
+    async def chat_completions_with_files(self, messages: list, text: str, files: list[str], model: str | None = None) -> dict:
+        return await self.chat_completions(messages, model)
+
+    def cookies_changed(self) -> bool:
+        return False
+
+    async def reload_cookies(self) -> None:
+        return None
+
+    def persist_cookies(self) -> bool:
+        return False
+
+
+class StubG4FProvider(StubProvider):
+    """接口与 G4FProvider 相同（OpenAI 风格的 payload 和响应）"""
+
+    name = "g4f"
+
+    def __init__(self, settings: StubSettings | None = None, models: list[str] | None = None,
+                 model_prefixes: list[str] | None = None) -> None:
+        super().__init__(settings, models)
+        self.model_prefixes = model_prefixes or []
+
+    def available_models(self) -> list[str]:
+        return list(self.models)
+
+    async def chat_completions(self, payload: dict) -> dict:
+        text = await self._generate()
+        return {
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
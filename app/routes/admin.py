@@ -1,20 +1,31 @@
+import asyncio
 import json
-from datetime import datetime
+import time
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
 from app.config.manager import ConfigManager
-from app.providers.g4f import G4FProvider
-from app.providers.gemini import GeminiProvider
 from app.services.logger import LogLevel, log_manager
+from app.services import loop_monitor, metrics, profiling, request_context, runtime, usage
 from app.services.file_manager import FileManager
+from app.services.rate_limit import limiter
+from app.utils.errors import AIGatewayError
 
-router = APIRouter()
+def require_admin() -> None:
+    """管理接口只接受管理 key（auth.admin_key，未设置时为 auth.api_key），租户 key 返回 403"""
+    ctx = request_context.current()
+    if ctx is None or not ctx.admin:
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+
+# /admin/* 和 /metrics（含所有租户的流量和 provider 健康状况）只对管理 key 开放
+router = APIRouter(dependencies=[Depends(require_admin)])
+# 无需管理 key 的接口（/health 无需认证）
+public_router = APIRouter()
 _config_manager: ConfigManager | None = None
-_gemini: GeminiProvider | None = None
-_g4f: G4FProvider | None = None
 _file_manager: FileManager | None = None
 
 
@@ -36,35 +47,32 @@ class LogLevelUpdate(BaseModel):
 
 def configure(
     manager: ConfigManager | None,
-    gemini: GeminiProvider | None = None,
-    g4f: G4FProvider | None = None,
     file_manager: FileManager | None = None
 ) -> None:
-    global _config_manager, _gemini, _g4f, _file_manager
+    global _config_manager, _file_manager
     _config_manager = manager
-    _gemini = gemini
-    _g4f = g4f
     _file_manager = file_manager
 
 
-@router.get("/health")
+@public_router.get("/health")
 async def health():
     """健康检查，包含各 provider 状态"""
+    rt = runtime.current()
     providers = {}
     
     # Gemini 状态
-    if _gemini is None:
+    if rt.gemini is None:
         providers["gemini"] = "not_configured"
     else:
         try:
-            # 简单检查：尝试加载 cookie
-            _gemini.load_cookie_values(_gemini.cookie_path)
+            # 简单检查：尝试加载 cookie（读文件放到线程中，不阻塞事件循环）
+            await asyncio.to_thread(rt.gemini.load_cookie_values, rt.gemini.cookie_path)
             providers["gemini"] = "ok"
         except Exception as e:
             providers["gemini"] = f"error: {type(e).__name__}"
     
     # g4f 状态
-    if _g4f is None:
+    if rt.g4f is None:
         providers["g4f"] = "not_configured"
     else:
         providers["g4f"] = "ok"
@@ -81,7 +89,9 @@ async def health():
     return {
         "status": overall,
         "version": "1.0.0",
-        "providers": providers
+        "runtime_version": rt.version,
+        "providers": providers,
+        "event_loop": loop_monitor.monitor.snapshot(),
     }
 
 
@@ -89,34 +99,103 @@ async def health():
 async def reload_config():
     if _config_manager is None:
         raise HTTPException(status_code=503, detail="Config manager not configured")
+    old = _config_manager.get_settings()
     _config_manager.reload()
-    return {"status": "success", "message": "Configuration reloaded"}
+    new = _config_manager.get_settings()
+    if old.logging != new.logging:
+        # logger.remove() 会等待 enqueue 线程写完队列，不在事件循环上执行
+        await asyncio.to_thread(log_manager.configure, new.logging)
+    try:
+        # 在后台构建新的运行时快照并原子替换，进行中的请求继续使用旧快照
+        rt = await runtime.manager.reload(new)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to apply configuration: {e}")
+    return {"status": "success", "message": "Configuration reloaded", "runtime_version": rt.version}
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 文本格式指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/admin/loop")
+async def loop_status():
+    """事件循环延迟和最近的阻塞记录（含阻塞时事件循环线程的调用栈）"""
+    return loop_monitor.monitor.snapshot(stacks=True)
+
+
+@router.get("/admin/routing")
+async def routing_status():
+    """查看故障转移链和各 provider 熔断器状态"""
+    return runtime.current().router.snapshot()
+
+
+@router.get("/admin/timeouts")
+async def timeout_status():
+    """查看各模型当前的自适应超时"""
+    timeouts = runtime.current().router.timeouts
+    return {
+        "percentile": timeouts.settings.percentile,
+        "factor": timeouts.settings.factor,
+        "models": timeouts.snapshot()
+    }
+
+
+@router.get("/admin/scheduler")
+async def scheduler_status():
+    """查看上游名额调度：排队数、各优先级排队耗时和公平指数"""
+    return runtime.current().router.scheduler.snapshot()
+
+
+@router.get("/admin/usage")
+async def usage_rollup(
+    since: float | None = None,
+    until: float | None = None,
+    bucket: str = "hour",
+    group_by: str = "api_key",
+):
+    """按时间桶汇总用量（since/until 为 Unix 时间戳，默认最近 24 小时）
+
+    bucket: minute/hour/day；group_by: api_key/model/provider
+    """
+    until = until if until is not None else time.time()
+    since = since if since is not None else until - 86400
+    try:
+        rows = await usage.recorder.rollup(since, until, bucket, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "since": since,
+        "until": until,
+        "bucket": bucket,
+        "group_by": group_by,
+        "rows": rows,
+        "pending": usage.recorder.pending,
+        "dropped": usage.recorder.dropped,
+    }
+
+
+@router.get("/admin/keys")
+async def key_status():
+    """查看各 API Key 租户的限额和当前用量（不返回 key 本身）"""
+    # 共享模式下要读取 SQLite，放到线程中执行
+    return {"keys": await asyncio.to_thread(limiter.snapshot)}
 
 
 @router.post("/admin/cookies")
 async def update_cookies(cookies: CookieUpdate):
     """更新 Gemini Cookie，立即生效"""
-    global _gemini
+    gemini = runtime.current().gemini
 
-    if _gemini is None:
+    if gemini is None:
         raise HTTPException(status_code=503, detail="Gemini provider not configured")
 
-    # 保存到 cookie 文件
-    cookie_data = {
-        "__Secure-1PSID": cookies.__Secure_1PSID,
-        "__Secure-1PSIDTS": cookies.__Secure_1PSIDTS or "",
-        "updated_at": datetime.now().isoformat()
-    }
-
-    Path(_gemini.cookie_path).write_text(
-        json.dumps(cookie_data, indent=2),
-        encoding="utf-8"
-    )
-
-    # 重新初始化 provider
-    _gemini._initialized = False
-    _gemini._client = None
-    await _gemini._ensure_client()
+    # 后台用新 cookie 初始化客户端，成功后才写入 cookie 文件；旧客户端继续服务直到替换
+    try:
+        cookie_data = await gemini.update_cookies(cookies.__Secure_1PSID, cookies.__Secure_1PSIDTS or "")
+    except AIGatewayError as e:
+        raise HTTPException(status_code=400, detail=f"Cookies rejected, previous cookies kept: {e.message}")
 
     return {
         "status": "success",
@@ -128,9 +207,9 @@ async def update_cookies(cookies: CookieUpdate):
 @router.get("/admin/cookies/status")
 async def cookie_status():
     """查看 Cookie 状态（脱敏）"""
-    global _gemini
+    gemini = runtime.current().gemini
 
-    if _gemini is None:
+    if gemini is None:
         return CookieStatus(
             has_psid=False,
             has_psidts=False,
@@ -139,13 +218,13 @@ async def cookie_status():
         )
 
     try:
-        cookie_path = _gemini.cookie_path
+        cookie_path = gemini.cookie_path
         if not Path(cookie_path).exists():
             return CookieStatus(
                 has_psid=False,
                 has_psidts=False,
                 updated_at=None,
-                auto_refresh=getattr(_gemini, 'auto_refresh', True)
+                auto_refresh=getattr(gemini, 'auto_refresh', True)
             )
 
         data = json.loads(Path(cookie_path).read_text(encoding="utf-8"))
@@ -153,7 +232,7 @@ async def cookie_status():
             has_psid=bool(data.get("__Secure-1PSID")),
             has_psidts=bool(data.get("__Secure-1PSIDTS")),
             updated_at=data.get("updated_at"),
-            auto_refresh=getattr(_gemini, 'auto_refresh', True)
+            auto_refresh=getattr(gemini, 'auto_refresh', True)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read cookie status: {e}")
@@ -162,13 +241,13 @@ async def cookie_status():
 @router.get("/admin/cookies/content")
 async def cookie_content():
     """获取 Cookie 实际内容（用于编辑）"""
-    global _gemini
+    gemini = runtime.current().gemini
 
-    if _gemini is None:
+    if gemini is None:
         raise HTTPException(status_code=503, detail="Gemini provider not configured")
 
     try:
-        cookie_path = _gemini.cookie_path
+        cookie_path = gemini.cookie_path
         if not Path(cookie_path).exists():
             # 返回空模板
             return {
@@ -198,6 +277,44 @@ async def set_log_level(payload: LogLevelUpdate):
     }
 
 
+def _folded(content: str, name: str) -> PlainTextResponse:
+    return PlainTextResponse(content, headers={"Content-Disposition": f'attachment; filename="{name}.folded"'})
+
+
+@router.get("/admin/profile")
+async def profile_status():
+    """查看采样状态和最近的单请求 profile"""
+    return profiling.profiler.status()
+
+
+@router.post("/admin/profile/start")
+async def start_profile(interval: float | None = None, duration: float | None = None):
+    """开始全进程采样（duration 秒后自动停止，上限 profiling.max_duration）"""
+    if interval is not None and not 0.001 <= interval <= 1.0:
+        raise HTTPException(status_code=422, detail="interval must be between 0.001 and 1.0 seconds")
+    if not profiling.profiler.start(interval, duration):
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    return {"status": "started", **profiling.profiler.status()}
+
+
+@router.post("/admin/profile/stop")
+async def stop_profile():
+    """停止全进程采样，下载折叠格式调用栈（flamegraph.pl / speedscope 可直接读取）"""
+    content = profiling.profiler.stop()
+    if content is None:
+        raise HTTPException(status_code=404, detail="No profile recorded")
+    return _folded(content, f"profile-{int(time.time())}")
+
+
+@router.get("/admin/profile/requests/{request_id}")
+async def request_profile(request_id: str):
+    """下载单请求 profile（请求带 X-Profile 头时响应头 X-Profile-ID 给出 ID）"""
+    profile = profiling.profiler.find(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _folded(profile.folded(), f"request-{request_id}")
+
+
 @router.post("/admin/files/har")
 async def upload_har(
     file: UploadFile = File(...),
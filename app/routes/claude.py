@@ -1,20 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from pydantic import BaseModel
 from typing import Literal
+import json
 import uuid
 
-from app.providers.gemini import GeminiProvider
-from app.providers.g4f import G4FProvider
-from app.utils.errors import AIGatewayError, http_exception_from_error, ProviderError
+from app.services import codec, context, request_context, runtime, tokenizer, tracing, usage
+from app.services.model_catalog import catalog_response
+from app.services.rate_limit import limiter
+from app.services.router import invoke_chat
+from app.utils.errors import AIGatewayError, http_exception_from_error
 from app.services.logger import logger
 
 router = APIRouter()
 
-_gemini_models: list[str] = []
-_g4f_models: list[str] = []
-_gemini: GeminiProvider | None = None
-_g4f: G4FProvider | None = None
-
 
 class ClaudeMessage(BaseModel):
     role: Literal["user", "assistant"]
@@ -29,6 +27,14 @@ class ClaudeRequest(BaseModel):
     stream: bool = False
 
 
+class ClaudeCountTokensRequest(BaseModel):
+    """count_tokens 请求：客户端会带上 content block、工具定义等，按宽松格式接收"""
+    model: str
+    messages: list[dict]
+    system: str | list[dict] | None = None
+    tools: list[dict] | None = None
+
+
 class ClaudeContent(BaseModel):
     type: Literal["text"] = "text"
     text: str
@@ -49,39 +55,7 @@ class ClaudeResponse(BaseModel):
     usage: ClaudeUsage
 
 
-def configure(
-    gemini_models: list[str],
-    g4f_models: list[str],
-    gemini: GeminiProvider | None = None,
-    g4f: G4FProvider | None = None
-) -> None:
-    global _gemini_models, _g4f_models, _gemini, _g4f
-    _gemini_models = gemini_models
-    _g4f_models = g4f_models
-    _gemini = gemini
-    _g4f = g4f
-
-
-def _is_gemini_model(model: str) -> bool:
-    return model.startswith("gemini-")
-
-
-def _claude_to_openai_messages(claude_req: ClaudeRequest) -> list[dict]:
-    """将 Claude 请求转换为 OpenAI 格式"""
-    messages = []
-    
-    # 处理 system prompt
-    if claude_req.system:
-        messages.append({"role": "system", "content": claude_req.system})
-    
-    # 转换 messages
-    for msg in claude_req.messages:
-        messages.append({"role": msg.role, "content": msg.content})
-    
-    return messages
-
-
-def _openai_to_claude_response(openai_result: dict, model: str) -> ClaudeResponse:
+def _openai_to_claude_response(openai_result: dict, model: str, input_tokens: int = 0) -> ClaudeResponse:
     """将 OpenAI 格式结果转换为 Claude 格式"""
     # 提取文本内容
     text = ""
@@ -90,9 +64,7 @@ def _openai_to_claude_response(openai_result: dict, model: str) -> ClaudeRespons
     elif "choices" in openai_result and openai_result["choices"]:
         text = openai_result["choices"][0].get("message", {}).get("content", "")
     
-    # 估算 token 数 (简化处理)
-    input_tokens = len(str(openai_result.get("messages", []))) // 4
-    output_tokens = len(text) // 4
+    output_tokens = tokenizer.count(text)
     
     return ClaudeResponse(
         id=f"msg_{uuid.uuid4().hex[:24]}",
@@ -103,42 +75,46 @@ def _openai_to_claude_response(openai_result: dict, model: str) -> ClaudeRespons
 
 
 @router.get("/v1/claude/models")
-async def list_models():
-    models = _gemini_models + _g4f_models
-    return {"data": [{"type": "model", "id": m, "display_name": m} for m in models]}
+async def list_models(if_none_match: str | None = Header(None)):
+    return catalog_response(runtime.current().catalog.claude, if_none_match)
+
+
+@router.post("/v1/messages/count_tokens")
+async def count_tokens(payload: ClaudeCountTokensRequest):
+    """本地计算输入 token 数，不调用上游"""
+    system = tokenizer.content_text(payload.system) or None
+    total = tokenizer.count_messages(payload.messages, system)
+    for tool in payload.tools or []:
+        schema = json.dumps(tool.get("input_schema") or {}, ensure_ascii=False)
+        total += tokenizer.count(f"{tool.get('name', '')} {tool.get('description', '')} {schema}")
+    return {"input_tokens": total}
 
 
 @router.post("/v1/messages")
-async def messages(payload: ClaudeRequest):
-    """Claude 协议消息完成 - 支持 Gemini 和 g4f"""
+async def messages(raw: Request):
+    """Claude 协议消息完成 - 支持 Gemini 和 g4f
+
+    请求体走快速解析路径（格式见 ClaudeRequest），响应直接序列化为 bytes
+    """
+    body = await raw.body()
+    with tracing.span("parse"):
+        request = codec.parse_claude(body)
     try:
-        model = payload.model
-        
-        if _is_gemini_model(model):
-            if _gemini is None:
-                raise ProviderError("gemini", "Provider not configured")
-            
-            # 转换为 OpenAI 格式并调用
-            openai_messages = _claude_to_openai_messages(payload)
-            result = await _gemini.chat_completions(
-                messages=openai_messages,
-                model=model
+        model = request.model
+        rt = runtime.current()
+        with tracing.span("trim"):
+            request.messages, input_tokens = context.fit(rt.settings.context, model, request.messages, request.max_tokens)
+        usage.track_request(model, request.input_chars, input_tokens)
+        async with limiter.stream(request_context.api_key() if request.stream else None):
+            routed = await rt.router.call(
+                model,
+                lambda provider, target: invoke_chat(provider, target, request.messages),
+                interactive=request.stream,
             )
-            
-            return _openai_to_claude_response(result, model)
-        
-        # g4f 模型
-        if _g4f is None:
-            raise ProviderError("g4f", "Provider not configured")
-        
-        # g4f 可以直接接受 OpenAI 格式
-        openai_payload = {
-            "model": model,
-            "messages": _claude_to_openai_messages(payload)
-        }
-        result = await _g4f.chat_completions(openai_payload)
         
-        return _openai_to_claude_response(result, model)
+        response = _openai_to_claude_response(routed.value, model, input_tokens)
+        usage.track_response(routed.route.provider, len(response.content[0].text), response.usage.output_tokens)
+        return codec.JSONBytesResponse(response.model_dump_json().encode())
         
     except AIGatewayError as e:
         raise http_exception_from_error(e)
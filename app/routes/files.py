@@ -4,17 +4,11 @@ from typing import List
 import tempfile
 from pathlib import Path
 
-from app.providers.gemini import GeminiProvider
+from app.services import runtime, tokenizer
+from app.utils.errors import AIGatewayError, http_exception_from_error
 
 router = APIRouter()
 
-_gemini: GeminiProvider | None = None
-
-
-def configure(gemini: GeminiProvider | None) -> None:
-    global _gemini
-    _gemini = gemini
-
 
 @router.post("/v1/files")
 async def upload_file(
@@ -22,7 +16,7 @@ async def upload_file(
     purpose: str = Form("assistants")
 ):
     """上传文件，返回 file_id"""
-    if _gemini is None:
+    if runtime.current().gemini is None:
         raise HTTPException(status_code=503, detail="Gemini provider not configured")
     
     # 保存上传的文件
@@ -51,7 +45,8 @@ async def chat_with_files(
     files: List[UploadFile] = File(default=[])
 ):
     """上传文件并进行对话"""
-    if _gemini is None:
+    rt = runtime.current()
+    if rt.gemini is None:
         raise HTTPException(status_code=503, detail="Gemini provider not configured")
     
     if not model.startswith("gemini-"):
@@ -67,13 +62,21 @@ async def chat_with_files(
             file_paths.append(tmp.name)
     
     try:
-        # 调用 Gemini
-        result = await _gemini.chat_completions_with_files(
-            messages=[],
-            text=message,
-            files=file_paths,
-            model=model
+        # 经路由层调用 Gemini，享有熔断、重试和文件对话专用的超时
+        routed = await rt.router.call(
+            model,
+            lambda provider, target: provider.chat_completions_with_files(
+                messages=[],
+                text=message,
+                files=file_paths,
+                model=target
+            ),
+            allow_fallback=False,
+            operation="files",
         )
+        result = routed.value
+        prompt_tokens = tokenizer.count_messages([{"content": message}])
+        completion_tokens = tokenizer.count(result.get("text", ""))
         
         return {
             "id": f"chatcmpl-{model.replace('-', '')}",
@@ -85,11 +88,13 @@ async def chat_with_files(
                 "finish_reason": "stop"
             }],
             "usage": {
-                "prompt_tokens": 0,
-                "completion_tokens": len(result.get("text", "")) // 4,
-                "total_tokens": len(result.get("text", "")) // 4
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
             }
         }
+    except AIGatewayError as e:
+        raise http_exception_from_error(e)
     finally:
         # 清理临时文件
         for fp in file_paths:
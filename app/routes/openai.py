@@ -1,25 +1,19 @@
-import base64
-import re
-from pathlib import Path
-from tempfile import NamedTemporaryFile
 from typing import Any, Literal
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.providers.g4f import G4FProvider
-from app.providers.gemini import GeminiProvider
+from app.services import codec, context, metrics, request_context, runtime, tokenizer, tracing, usage
+from app.services.model_catalog import catalog_response
+from app.services.rate_limit import limiter
+from app.services.router import invoke_chat, invoke_images
 from app.services.stream import sse_chat_chunks
-from app.utils.errors import AIGatewayError, http_exception_from_error, ProviderError
+from app.utils.errors import AIGatewayError, http_exception_from_error
 from app.services.logger import logger
 
 router = APIRouter()
 
-_gemini: GeminiProvider | None = None
-_g4f: G4FProvider | None = None
-_gemini_models: list[str] = []
-
 
 class TextContent(BaseModel):
     type: Literal["text"] = "text"
@@ -39,6 +33,7 @@ class ChatMessage(BaseModel):
 class ChatCompletionRequest(BaseModel):
     model: str
     messages: list[ChatMessage]
+    max_tokens: int | None = None
     stream: bool = False
 
 
@@ -50,49 +45,21 @@ class ImageGenerationRequest(BaseModel):
     response_format: Literal["url", "b64_json"] = "b64_json"
 
 
-def configure(gemini: GeminiProvider | None, g4f: G4FProvider | None, gemini_models: list[str]) -> None:
-    global _gemini, _g4f, _gemini_models
-    _gemini = gemini
-    _g4f = g4f
-    _gemini_models = gemini_models
-
-
-def _is_gemini_model(model: str) -> bool:
-    return model.startswith("gemini-")
-
-
-def _extract_image_from_content(content: list) -> tuple[str, list[str]]:
-    """从 content 中提取文本和图片
-    
-    Returns:
-        (text_prompt, list_of_temp_file_paths)
-    """
-    text_parts = []
-    image_files = []
-    
-    for item in content:
-        if item.get("type") == "text":
-            text_parts.append(item.get("text", ""))
-        elif item.get("type") == "image_url":
-            image_url = item.get("image_url", {}).get("url", "")
-            # 处理 base64 图片
-            if image_url.startswith("data:image"):
-                # 提取 base64 数据
-                match = re.match(r"data:image/(\w+);base64,(.+)", image_url)
-                if match:
-                    ext, base64_data = match.groups()
-                    image_bytes = base64.b64decode(base64_data)
-                    
-                    # 保存到临时文件
-                    with NamedTemporaryFile(suffix=f".{ext}", delete=False) as f:
-                        f.write(image_bytes)
-                        image_files.append(f.name)
-    
-    return "\n".join(text_parts), image_files
+def _served_image_bytes(data: list[dict]) -> int:
+    """内联返回的图片字节数（base64 解码后的大小）"""
+    total = 0
+    for item in data:
+        payload = item.get("b64_json") or ""
+        url = item.get("url") or ""
+        if url.startswith("data:"):
+            payload = url.partition(",")[2]
+        total += len(payload) * 3 // 4
+    return total
 
 
-def _create_openai_response(text: str, model: str) -> dict:
+def _create_openai_response(text: str, model: str, prompt_tokens: int = 0) -> dict:
     """创建标准 OpenAI 响应"""
+    completion_tokens = tokenizer.count(text)
     return {
         "id": f"chatcmpl-{model.replace('-', '')}",
         "object": "chat.completion",
@@ -103,94 +70,44 @@ def _create_openai_response(text: str, model: str) -> dict:
             "finish_reason": "stop"
         }],
         "usage": {
-            "prompt_tokens": 0,
-            "completion_tokens": len(text) // 4,
-            "total_tokens": len(text) // 4
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
         }
     }
 
 
 @router.get("/v1/models")
-async def list_models():
-    data = [
-        {"id": model, "object": "model", "owned_by": "google"}
-        for model in _gemini_models
-    ]
-    if _g4f is not None:
-        try:
-            data.extend(await _g4f.list_models())
-        except Exception:
-            pass
-    return {"object": "list", "data": data}
+async def list_models(if_none_match: str | None = Header(None)):
+    return catalog_response(runtime.current().catalog.openai, if_none_match)
 
 
 @router.post("/v1/chat/completions")
-async def chat_completions(payload: ChatCompletionRequest):
-    model = payload.model
-    stream = payload.stream
+async def chat_completions(raw: Request):
+    """请求体走快速解析路径（格式见 ChatCompletionRequest），响应直接序列化为 bytes"""
+    body = await raw.body()
+    with tracing.span("parse"):
+        request = codec.parse_openai(body)
+    model = request.model
+    stream = request.stream
+    rt = runtime.current()
     
     try:
-        if _is_gemini_model(model):
-            if _gemini is None:
-                raise ProviderError("gemini", "Provider not configured")
-            
-            # 检查最后一条消息是否包含图片
-            last_message = payload.messages[-1] if payload.messages else None
-            has_image = (
-                last_message and 
-                isinstance(last_message.content, list) and
-                any(item.get("type") == "image_url" for item in last_message.content)
+        with tracing.span("trim"):
+            request.messages, prompt_tokens = context.fit(rt.settings.context, model, request.messages, request.max_tokens)
+        usage.track_request(model, request.input_chars, prompt_tokens)
+        async with limiter.stream(request_context.api_key() if stream else None):
+            routed = await rt.router.call(
+                model,
+                lambda provider, target: invoke_chat(provider, target, request.messages),
+                # 图片只有 Gemini 能处理，带附件的请求不做跨 provider 故障转移
+                allow_fallback=not request.has_attachments,
+                interactive=stream,
             )
-            
-            if has_image:
-                # Vision 请求
-                text, image_files = _extract_image_from_content(last_message.content)
-                
-                # 构建历史消息（不含最后一条）
-                prev_messages = [
-                    {"role": m.role, "content": m.content if isinstance(m.content, str) else str(m.content)}
-                    for m in payload.messages[:-1]
-                ]
-                
-                result = await _gemini.chat_completions_with_files(
-                    messages=prev_messages,
-                    text=text,
-                    files=image_files,
-                    model=model
-                )
-                
-                # 清理临时文件
-                for f in image_files:
-                    try:
-                        Path(f).unlink()
-                    except:
-                        pass
-            else:
-                # 普通文本请求
-                messages = [
-                    {"role": m.role, "content": m.content if isinstance(m.content, str) else str(m.content)}
-                    for m in payload.messages
-                ]
-                result = await _gemini.chat_completions(messages=messages, model=model)
-            
-            return _create_openai_response(result.get("text", ""), model)
-        
-        # g4f 处理 (暂不支持 Vision)
-        if _g4f is None:
-            raise ProviderError("g4f", "Provider not configured")
-        
-        # 转换为标准 OpenAI 格式
-        messages = []
-        for m in payload.messages:
-            if isinstance(m.content, str):
-                messages.append({"role": m.role, "content": m.content})
-            else:
-                # 多模态，g4f 可能不支持，提取文本部分
-                text_parts = [item.get("text", "") for item in m.content if item.get("type") == "text"]
-                messages.append({"role": m.role, "content": "\n".join(text_parts)})
-        
-        openai_payload = {"model": model, "messages": messages, "stream": stream}
-        return await _g4f.chat_completions(openai_payload)
+        output = routed.value.get("text", "")
+        result = _create_openai_response(output, model, prompt_tokens)
+        usage.track_response(routed.route.provider, len(output), result["usage"]["completion_tokens"])
+        return codec.JSONBytesResponse(result)
         
     except AIGatewayError as e:
         raise http_exception_from_error(e)
@@ -212,68 +129,40 @@ async def images(payload: ImageGenerationRequest):
     """图像生成 - 支持 Gemini 和 g4f"""
     model = payload.model
     prompt = payload.prompt
+    rt = runtime.current()
     
     if not prompt:
         raise HTTPException(status_code=422, detail="prompt required")
     
-    if _is_gemini_model(model):
-        if _gemini is None:
-            raise HTTPException(status_code=503, detail="Gemini provider not configured")
-        
-        # Gemini 图像生成
-        try:
-            images = await _gemini.generate_images(prompt=prompt, model=model)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Image generation failed: {e}")
-        
-        data = []
-        for image in images[:payload.n]:  # 限制数量
-            # image 是 dict，包含 b64_json 或 url
-            if payload.response_format == "url":
-                if "url" in image and image["url"]:
-                    item = {"url": image["url"]}
-                elif "b64_json" in image:
-                    item = {"url": f"data:image/png;base64,{image['b64_json']}"}
-                else:
-                    item = {"url": ""}
-            else:
-                # 默认返回 b64_json
-                item = {"b64_json": image.get("b64_json", "")}
-            
-            data.append(item)
-        
-        return {
-            "created": 0,
-            "data": data
-        }
-    
-    # g4f 图像生成
-    if _g4f is None:
-        raise HTTPException(status_code=503, detail="g4f provider not configured")
-    
     try:
-        # 使用 g4f 生成图像
-        images = await _g4f.generate_images(
-            prompt=prompt,
-            model=model,
-            n=payload.n
+        # 经路由层调用，享有熔断、重试和图片生成专用的超时
+        routed = await rt.router.call(
+            model,
+            lambda provider, target: invoke_images(provider, target, prompt, payload.n),
+            allow_fallback=False,
+            operation="images",
         )
-        
-        # 格式化响应
-        data = []
-        for image in images[:payload.n]:
-            if payload.response_format == "url" and "url" in image:
-                item = {"url": image["url"]}
-            else:
-                # 默认返回 b64_json
-                item = {"b64_json": image.get("b64_json", "")}
-            data.append(item)
-        
-        return {
-            "created": 0,
-            "data": data
-        }
-        
-    except Exception as e:
-        logger.error(f"Image generation via g4f failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Image generation failed: {e}")
+    except AIGatewayError as e:
+        logger.error(f"Image generation failed: {e.message}")
+        raise http_exception_from_error(e)
+    
+    provider = routed.route.provider
+    data = []
+    for image in routed.value[:payload.n]:  # 限制数量
+        # image 是 dict，包含 b64_json 或 url
+        if payload.response_format == "url" and image.get("url"):
+            item = {"url": image["url"]}
+        elif payload.response_format == "url" and provider == "gemini":
+            # Gemini 只返回图片数据时以 data URL 内联
+            b64 = image.get("b64_json")
+            item = {"url": f"data:image/png;base64,{b64}" if b64 else ""}
+        else:
+            # 默认返回 b64_json
+            item = {"b64_json": image.get("b64_json", "")}
+        data.append(item)
+    
+    metrics.IMAGE_BYTES.inc(provider, amount=_served_image_bytes(data))
+    return {
+        "created": 0,
+        "data": data
+    }
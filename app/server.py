@@ -0,0 +1,50 @@
+"""服务启动器
+
+用法：python -m app.server [--workers N] [--host HOST] [--port PORT]
+
+按配置启动一个或多个 uvicorn worker 进程。多 worker 时各进程通过
+共享状态（SQLite 文件）同步熔断冷却、限流计数等，避免每个进程各自为政。
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+import uvicorn
+
+from app.config.manager import load_config
+
+DEFAULT_STATE_FILE = "gemini-gateway-state.db"
+
+
+def prepare_state_path(workers: int, configured: str) -> str:
+    """确定共享状态文件；多 worker 且未配置时在临时目录创建一个新的"""
+    if configured or workers <= 1:
+        return configured
+    path = Path(tempfile.gettempdir()) / DEFAULT_STATE_FILE
+    # 默认文件只属于本次启动，清掉上次遗留的冷却和租约
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    return str(path)
+
+
+def main(argv: list[str] | None = None) -> None:
+    _, settings = load_config()
+
+    parser = argparse.ArgumentParser(description="Start the AI gateway")
+    parser.add_argument("--host", default=settings.server.host)
+    parser.add_argument("--port", type=int, default=settings.server.port)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", settings.server.workers)))
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+    state_path = prepare_state_path(workers, settings.server.state_path or os.getenv("STATE_PATH", ""))
+    if state_path:
+        # worker 进程重新加载配置，通过环境变量传递共享状态位置
+        os.environ["STATE_PATH"] = state_path
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""比例预算（令牌桶）
+
+每个正常请求存入 ratio 个令牌，每次额外请求（hedge、重试）消耗 1 个，
+令牌上限为 max_tokens。这样额外负载最多约为正常流量的 ratio 倍，
+故障期间不会把上游压垮。
+"""
+from threading import Lock
+
+
+class Budget:
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0, initial: float | None = None) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens if initial is None else initial
+        self._lock = Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
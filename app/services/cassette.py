@@ -0,0 +1,148 @@
+"""上游交互录制（cassette）
+
+启用 cassette.record 后，Gemini 和 g4f provider 的每次上游调用记录为 JSONL 文件中的一行：
+方法、模型、请求规模、耗时，以及回复的形态（文本长度、图片数量与大小）或错误类型。
+录制内容经过脱敏：
+- 不记录提示词、cookie、图片数据和图片 URL
+- 回复文本默认只记录长度（keep_text 时保留原文）
+- 错误信息截断，只保留错误码和状态码等分类所需的字段
+写入在后台批量进行。录制文件由 app.providers.replay 回放。
+"""
+import asyncio
+import json
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterable
+
+from app.config.settings import CassetteSettings
+from app.services.logger import logger
+from app.utils.errors import AIGatewayError
+
+MAX_ERROR_CHARS = 200
+
+
+def describe_request(messages: Iterable[Any] | None = None, **extra: int) -> dict[str, int]:
+    """请求规模（消息数、字符数、附件数），不含内容本身"""
+    summary: dict[str, int] = {}
+    if messages is not None:
+        messages = list(messages)
+        summary["messages"] = len(messages)
+        summary["input_chars"] = sum(len(_text(m)) for m in messages)
+        summary["attachments"] = sum(len(getattr(m, "attachments", ())) for m in messages)
+    summary.update(extra)
+    return summary
+
+
+def _text(message: Any) -> str:
+    if isinstance(message, dict):
+        content = message.get("content")
+        return content if isinstance(content, str) else ""
+    return getattr(message, "text", "")
+
+
+def describe_images(images: list[dict]) -> list[dict[str, int]]:
+    """图片只保留大小；URL 形式的图片记为 0 字节"""
+    return [{"bytes": len(image.get("b64_json") or "") * 3 // 4} for image in images]
+
+
+def describe_error(error: BaseException) -> dict[str, Any]:
+    record: dict[str, Any] = {"type": type(error).__name__, "message": str(error)[:MAX_ERROR_CHARS]}
+    if isinstance(error, AIGatewayError):
+        record.update(message=error.message[:MAX_ERROR_CHARS], code=error.code, status=error.status_code)
+        if error.details.get("retry_after") is not None:
+            record["retry_after"] = error.details["retry_after"]
+    return record
+
+
+class CassetteRecorder:
+    def __init__(self, settings: CassetteSettings | None = None) -> None:
+        self.settings = settings or CassetteSettings()
+        self._pending: list[str] = []
+        self._lock = Lock()
+        self._started = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.record)
+
+    def record(
+        self,
+        provider: str,
+        method: str,
+        model: str | None,
+        request: dict[str, int],
+        started: float,
+        duration: float,
+        text: str | None = None,
+        images: list[dict] | None = None,
+        error: BaseException | None = None,
+    ) -> None:
+        """缓冲一条交互记录；started 和 duration 为 time.monotonic() 秒"""
+        if not self.enabled:
+            return
+        entry: dict[str, Any] = {
+            "offset_ms": round((started - self._started) * 1000, 1),
+            "provider": provider,
+            "method": method,
+            "model": model,
+            "request": request,
+            "duration_ms": round(duration * 1000, 1),
+        }
+        if error is not None:
+            entry["error"] = describe_error(error)
+        else:
+            response: dict[str, Any] = {"text_chars": len(text or "")}
+            if text is not None and self.settings.keep_text:
+                response["text"] = text
+            if images:
+                response["images"] = describe_images(images)
+            entry["response"] = response
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            if len(self._pending) < self.settings.max_pending:
+                self._pending.append(line)
+
+    def _append(self, lines: list[str]) -> None:
+        path = Path(self.settings.record)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self) -> int:
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return 0
+        try:
+            await asyncio.to_thread(self._append, lines)
+        except Exception as e:
+            logger.warning(f"Cassette flush failed, {len(lines)} interactions dropped: {e}")
+            return 0
+        return len(lines)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.flush_interval)
+            await self.flush()
+
+
+def load(path: str) -> list[dict[str, Any]]:
+    """读取录制文件，跳过损坏的行（如进程退出时写了一半）"""
+    interactions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                interactions.append(json.loads(line))
+            except ValueError:
+                continue
+    return interactions
+
+
+recorder = CassetteRecorder()
+
+
+def configure(settings: CassetteSettings) -> CassetteRecorder:
+    global recorder
+    recorder = CassetteRecorder(settings)
+    return recorder
@@ -0,0 +1,99 @@
+"""协议无关的内部请求表示
+
+OpenAI 和 Claude 请求体各自在一次遍历中解析为 ChatRequest（见 codec），之后的上下文裁剪、
+token 计数、路由和 provider 调用都使用这一表示：
+- Message 只保存角色、纯文本和附件，不再为每一层转换复制一份 dict
+- 图片以原始 data URL 引用保存为 Attachment，需要时才解码写入临时文件，
+  不会再被 str() 序列化进提示词
+响应方向由各路由的适配函数转换回对应协议。
+"""
+import base64
+from dataclasses import dataclass, field
+from tempfile import NamedTemporaryFile
+from typing import Iterable
+
+_DATA_IMAGE = "data:image/"
+
+
+@dataclass(slots=True)
+class Attachment:
+    url: str  # data:image/<ext>;base64,<data>，原样引用
+    # 快速解析路径下 base64 数据直接引用原始请求体（此时 url 只是占位）
+    payload: bytes | memoryview | None = field(default=None, repr=False)
+    _data: bytes | None = field(default=None, repr=False)
+
+    @property
+    def ext(self) -> str:
+        return self.url[len(_DATA_IMAGE):self.url.find(";", len(_DATA_IMAGE))]
+
+    @property
+    def mime(self) -> str:
+        return f"image/{self.ext}"
+
+    def data(self) -> bytes:
+        if self._data is None:
+            encoded = self.payload if self.payload is not None else self.url.partition(",")[2]
+            self._data = base64.b64decode(encoded)
+        return self._data
+
+    def write_temp(self) -> str:
+        """写入临时文件并返回路径，调用方负责删除"""
+        with NamedTemporaryFile(suffix=f".{self.ext}", delete=False) as f:
+            f.write(self.data())
+            return f.name
+
+
+@dataclass(slots=True)
+class Message:
+    role: str
+    text: str
+    attachments: tuple[Attachment, ...] = ()
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.text}
+
+
+@dataclass(slots=True)
+class ChatRequest:
+    model: str
+    messages: list[Message]
+    max_tokens: int | None = None
+    stream: bool = False
+
+    @property
+    def has_attachments(self) -> bool:
+        return any(m.attachments for m in self.messages)
+
+    @property
+    def input_chars(self) -> int:
+        return sum(len(m.text) for m in self.messages)
+
+    def dicts(self) -> list[dict]:
+        """OpenAI 风格的纯文本消息（供只接受 dict 的 provider 使用）"""
+        return [m.to_dict() for m in self.messages]
+
+
+def split_openai_content(content: str | list[dict]) -> tuple[str, tuple[Attachment, ...]]:
+    """OpenAI content 拆分为文本和 base64 图片附件；非 data URL 的图片忽略"""
+    if isinstance(content, str):
+        return content, ()
+    texts: list[str] = []
+    attachments: list[Attachment] = []
+    for item in content:
+        kind = item.get("type")
+        if kind == "text":
+            texts.append(item.get("text", ""))
+        elif kind == "image_url":
+            url = (item.get("image_url") or {}).get("url", "")
+            if url.startswith(_DATA_IMAGE) and ";base64," in url:
+                attachments.append(Attachment(url))
+    return "\n".join(texts), tuple(attachments)
+
+
+def messages_from_dicts(messages: Iterable[dict]) -> list[Message]:
+    """OpenAI 风格 dict 消息转换为 Message（兼容直接传 dict 的调用方）"""
+    result = []
+    for m in messages:
+        text, attachments = split_openai_content(m.get("content") or "")
+        result.append(Message(m.get("role", "user"), text, attachments))
+    return result
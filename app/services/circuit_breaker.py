@@ -0,0 +1,173 @@
+"""Provider 熔断器
+
+每个 provider（账号）一个熔断器，三种状态：
+- closed: 正常放行，连续失败达到阈值后转为 open
+- open: 直接拒绝，等待 recovery_timeout 后转为 half_open
+- half_open: 放行少量探测请求，成功则恢复 closed，失败则重新 open
+
+多 worker 部署时，熔断（冷却）状态写入共享状态，其他 worker 据此同步跳过该后端。
+共享状态每 shared_sync_interval 秒最多读取一次，不在每个请求上查询。
+"""
+import time
+from enum import Enum
+from threading import Lock
+from typing import TYPE_CHECKING, Callable
+
+from app.config.settings import CircuitBreakerSettings
+
+if TYPE_CHECKING:
+    from app.services.shared_state import SharedState
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        shared: "SharedState | None" = None,
+        shared_sync_interval: float = 1.0,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._clock = clock
+        self._shared = shared
+        self.shared_sync_interval = shared_sync_interval
+        self._shared_until: float | None = None  # 缓存的共享冷却截止时间（time.time()）
+        self._shared_synced_at: float | None = None
+        self._lock = Lock()
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def _current_state(self) -> CircuitState:
+        # open 状态超过恢复时间后自动进入 half_open
+        if self._state is CircuitState.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self) -> bool:
+        """是否放行本次请求；half_open 状态下会占用一个探测名额"""
+        with self._lock:
+            state = self._current_state()
+            if state is CircuitState.CLOSED:
+                return not self._adopt_shared_cooldown()
+            if state is CircuitState.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state is CircuitState.HALF_OPEN and self._shared is not None:
+                self._shared.delete(self._cooldown_key)
+                self._shared_until = None
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state is CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._trip()
+
+    def release(self) -> None:
+        """请求既未成功也未失败（被取消、参数错误等），归还探测名额"""
+        with self._lock:
+            if self._state is CircuitState.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _trip(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock()
+        self._probes = 0
+        if self._shared is not None:
+            self._shared.set(self._cooldown_key, time.time() + self.recovery_timeout, ttl=self.recovery_timeout)
+
+    @property
+    def _cooldown_key(self) -> str:
+        return f"cooldown:{self.name}"
+
+    def _adopt_shared_cooldown(self) -> bool:
+        """其他 worker 已熔断该后端时，本地同步进入 open，剩余冷却时间保持一致"""
+        if self._shared is None:
+            return False
+        now = self._clock()
+        if self._shared_synced_at is None or now - self._shared_synced_at >= self.shared_sync_interval:
+            self._shared_until = self._shared.get(self._cooldown_key)
+            self._shared_synced_at = now
+        until = self._shared_until
+        if until is None:
+            return False
+        remaining = until - time.time()
+        if remaining <= 0:
+            return False
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock() - (self.recovery_timeout - remaining)
+        self._probes = 0
+        return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = 0.0
+            if state is CircuitState.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (self._clock() - self._opened_at))
+            return {
+                "state": state.value,
+                "failures": self._failures,
+                "retry_in": round(retry_in, 3),
+            }
+
+
+class CircuitBreakerRegistry:
+    """按 provider/账号名懒加载熔断器"""
+
+    def __init__(
+        self,
+        settings: CircuitBreakerSettings | None = None,
+        shared: "SharedState | None" = None,
+    ) -> None:
+        self.settings = settings or CircuitBreakerSettings()
+        self.shared = shared
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        name,
+                        failure_threshold=self.settings.failure_threshold,
+                        recovery_timeout=self.settings.recovery_timeout,
+                        half_open_max_calls=self.settings.half_open_max_calls,
+                        shared=self.shared,
+                        shared_sync_interval=self.settings.shared_sync_interval,
+                    )
+                    self._breakers[name] = breaker
+        return breaker
+
+    def snapshot(self) -> dict[str, dict]:
+        return {name: breaker.snapshot() for name, breaker in self._breakers.items()}
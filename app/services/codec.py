@@ -0,0 +1,169 @@
+"""对话接口的快速解析与序列化
+
+对话请求可能带有数 MB 的 base64 图片，完整的 pydantic 校验会逐字段遍历并复制
+这些内容。这里的快速路径：
+- 用 orjson（未安装时退回标准库 json）直接解析原始请求体
+- 解析前把大段 base64 图片从请求体中摘出，换成短占位 URL，图片数据以 memoryview
+  引用原始请求体：JSON 解析器不必扫描、复制数 MB 的字符串，解码推迟到上传前
+- 只校验网关实际用到的字段（model、messages 的 role/content、stream、max_tokens），
+  一次遍历构建 ChatRequest
+- 响应直接序列化为 bytes
+校验失败时抛出 RequestValidationError，返回与 FastAPI 相同格式的 422。
+"""
+import json
+from typing import Any
+
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+
+from app.services.chat import ChatRequest, Message, split_openai_content
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+_DATA_URL = b'"data:image/'
+MIN_REF_BYTES = 64 * 1024  # 小于该大小的图片直接随 JSON 解析
+
+OPENAI_ROLES = frozenset({"system", "user", "assistant"})
+CLAUDE_ROLES = frozenset({"user", "assistant"})
+
+
+def loads(body: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class JSONBytesResponse(Response):
+    """直接把内容序列化为 bytes 的 JSON 响应"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def extract_data_urls(body: bytes) -> tuple[bytes, dict[str, memoryview]]:
+    """把大段 base64 data URL 换成占位 URL，返回 (新请求体, 占位 URL -> base64 数据)
+
+    JSON 中未转义的双引号只能是字符串定界符，因此 `"data:image/` 一定是字符串开头，
+    其后第一个双引号就是结尾；含反斜杠转义的字符串保持原样交给 JSON 解析器。
+    """
+    start = body.find(_DATA_URL)
+    if start < 0:
+        return body, {}
+    view = memoryview(body)
+    parts: list[bytes | memoryview] = []
+    refs: dict[str, memoryview] = {}
+    pos = 0
+    while start >= 0:
+        comma = body.find(b",", start, start + 64)
+        end = body.find(b'"', start + 1)
+        if end < 0:
+            break
+        prefix = body[start + 1:comma + 1] if comma >= 0 else b""
+        if prefix.endswith(b";base64,") and end - comma > MIN_REF_BYTES and body.find(b"\\", comma, end) < 0:
+            marker = f"{prefix.decode('ascii', 'replace')}@ref{len(refs)}"
+            parts.append(view[pos:start + 1])
+            parts.append(marker.encode())
+            refs[marker] = view[comma + 1:end]
+            pos = end
+        start = body.find(_DATA_URL, end + 1)
+    if not refs:
+        return body, {}
+    parts.append(view[pos:])
+    return b"".join(parts), refs
+
+
+def _error(loc: tuple, msg: str, kind: str = "value_error", value: Any = None) -> RequestValidationError:
+    return RequestValidationError([{"type": kind, "loc": ("body", *loc), "msg": msg, "input": value}])
+
+
+def _object(body: bytes) -> dict:
+    try:
+        data = loads(body)
+    except ValueError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body", 0), "msg": f"JSON decode error: {e}", "input": {}}])
+    if not isinstance(data, dict):
+        raise _error((), "Input should be a valid dictionary", "model_attributes_type", data)
+    return data
+
+
+def _common(data: dict) -> tuple[str, list, int | None, bool]:
+    model = data.get("model")
+    if not isinstance(model, str):
+        raise _error(("model",), "Field required" if model is None else "Input should be a valid string", value=model)
+    messages = data.get("messages")
+    if not isinstance(messages, list):
+        raise _error(("messages",), "Input should be a valid list", value=messages)
+    max_tokens = data.get("max_tokens")
+    if max_tokens is not None and (not isinstance(max_tokens, int) or isinstance(max_tokens, bool)):
+        raise _error(("max_tokens",), "Input should be a valid integer", value=max_tokens)
+    stream = data.get("stream", False)
+    if not isinstance(stream, bool):
+        raise _error(("stream",), "Input should be a valid boolean", value=stream)
+    return model, messages, max_tokens, stream
+
+
+def _role(message: Any, index: int, roles: frozenset) -> str:
+    if not isinstance(message, dict):
+        raise _error(("messages", index), "Input should be a valid dictionary", value=message)
+    role = message.get("role")
+    if role not in roles:
+        raise _error(("messages", index, "role"), f"Input should be one of {sorted(roles)}", "literal_error", role)
+    return role
+
+
+def parse_openai(body: bytes) -> ChatRequest:
+    """解析 /v1/chat/completions 请求体"""
+    stripped, refs = extract_data_urls(body)
+    request, used = _parse_openai(stripped, refs)
+    if used != len(refs):
+        # 占位 URL 出现在 image_url 以外的位置（如作为文本发送的 data URL），按原始请求体重新解析
+        request, _ = _parse_openai(body, {})
+    return request
+
+
+def _parse_openai(body: bytes, refs: dict[str, memoryview]) -> tuple[ChatRequest, int]:
+    model, raw_messages, max_tokens, stream = _common(_object(body))
+    messages = []
+    used = 0
+    for i, m in enumerate(raw_messages):
+        role = _role(m, i, OPENAI_ROLES)
+        content = m.get("content")
+        if not isinstance(content, (str, list)) or (isinstance(content, list) and not all(isinstance(c, dict) for c in content)):
+            raise _error(("messages", i, "content"), "Input should be a valid string or list of objects", value=content)
+        text, attachments = split_openai_content(content)
+        if refs:
+            for attachment in attachments:
+                attachment.payload = refs.get(attachment.url)
+                used += attachment.payload is not None
+        messages.append(Message(role, text, attachments))
+    return ChatRequest(model, messages, max_tokens, stream), used
+
+
+def parse_claude(body: bytes) -> ChatRequest:
+    """解析 /v1/messages 请求体"""
+    data = _object(body)
+    model, raw_messages, max_tokens, stream = _common(data)
+    system = data.get("system")
+    if system is not None and not isinstance(system, str):
+        raise _error(("system",), "Input should be a valid string", value=system)
+    messages = [Message("system", system)] if system else []
+    for i, m in enumerate(raw_messages):
+        role = _role(m, i, CLAUDE_ROLES)
+        content = m.get("content")
+        if not isinstance(content, str):
+            raise _error(("messages", i, "content"), "Input should be a valid string", "string_type", content)
+        messages.append(Message(role, content))
+    return ChatRequest(model, messages, max_tokens, stream)
@@ -0,0 +1,106 @@
+"""按 token 预算裁剪上下文
+
+长对话在转发给上游前按模型的输入预算裁剪：
+- system 消息和最后一条消息总是保留
+- 超过 max_message_tokens 的单条非 system 消息（通常是工具输出，包括最后一条）保留首尾、截掉中间
+- 仍超出预算时从最旧的一轮开始丢弃，保留连续的最近历史
+每条消息只计数一次（分词器按内容缓存），裁剪在一次遍历中完成。
+"""
+from dataclasses import dataclass, replace
+
+from app.config.settings import ContextSettings
+from app.services import request_context, tokenizer
+from app.services.chat import Message
+from app.services.tokenizer import MESSAGE_OVERHEAD, REPLY_OVERHEAD
+
+
+@dataclass(slots=True)
+class TrimReport:
+    dropped: int = 0
+    truncated: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def trimmed(self) -> bool:
+        return bool(self.dropped or self.truncated)
+
+    def header(self) -> str:
+        return (
+            f"dropped={self.dropped}; truncated={self.truncated}; "
+            f"tokens={self.tokens_before}->{self.tokens_after}"
+        )
+
+
+def budget_for(settings: ContextSettings, model: str, max_tokens: int | None = None) -> int:
+    """模型的输入预算（扣除为输出预留的 max_tokens），0 表示不限制"""
+    budget = settings.budgets.get(model, settings.default_budget)
+    if budget <= 0:
+        return 0
+    return max(budget - (max_tokens or 0), settings.min_input_budget)
+
+
+def _truncate(text: str, tokens: int, limit: int) -> str:
+    """按平均每 token 字符数保留首尾，中间替换为标记"""
+    keep = int(len(text) * limit / tokens)
+    head, tail = keep * 2 // 3, keep // 3
+    return f"{text[:head]}\n...[truncated {tokens - limit} tokens]...\n{text[len(text) - tail:]}"
+
+
+def _limit(message: Message, size: int, max_message_tokens: int) -> tuple[Message, int, bool]:
+    """超过 max_message_tokens 的消息截掉中间部分，返回 (消息, 大小, 是否截断)"""
+    if max_message_tokens <= 0 or size - MESSAGE_OVERHEAD <= max_message_tokens:
+        return message, size, False
+    message = replace(message, text=_truncate(message.text, size - MESSAGE_OVERHEAD, max_message_tokens))
+    return message, MESSAGE_OVERHEAD + tokenizer.count(message.text), True
+
+
+def trim(messages: list[Message], budget: int, max_message_tokens: int = 0) -> tuple[list[Message], TrimReport]:
+    """返回裁剪后的消息和裁剪报告"""
+    sizes = [MESSAGE_OVERHEAD + tokenizer.count(m.text) for m in messages]
+    report = TrimReport(tokens_before=REPLY_OVERHEAD + sum(sizes))
+    if not messages or (budget <= 0 and max_message_tokens <= 0):
+        report.tokens_after = report.tokens_before
+        return messages, report
+
+    last = len(messages) - 1
+    final, final_size, final_truncated = messages[last], sizes[last], False
+    if final.role != "system":
+        final, final_size, final_truncated = _limit(final, final_size, max_message_tokens)
+    report.truncated += final_truncated
+    used = REPLY_OVERHEAD + final_size + sum(
+        size for message, size in zip(messages[:last], sizes) if message.role == "system"
+    )
+    kept: list[Message] = [final]
+    history_full = False
+    # 从新到旧遍历：system 消息总是保留，历史消息在预算内保留
+    for i in range(last - 1, -1, -1):
+        message, size = messages[i], sizes[i]
+        if message.role == "system":
+            kept.append(message)
+            continue
+        if history_full:
+            report.dropped += 1
+            continue
+        message, size, truncated = _limit(message, size, max_message_tokens)
+        if budget > 0 and used + size > budget:
+            history_full = True
+            report.dropped += 1
+            continue
+        kept.append(message)
+        used += size
+        report.truncated += truncated
+
+    kept.reverse()
+    report.tokens_after = used
+    return kept, report
+
+
+def fit(settings: ContextSettings, model: str, messages: list[Message], max_tokens: int | None = None) -> tuple[list[Message], int]:
+    """按配置裁剪请求消息，返回 (消息, 输入 token 数)；裁剪情况记入请求上下文"""
+    budget = budget_for(settings, model, max_tokens)
+    messages, report = trim(messages, budget, settings.max_message_tokens)
+    ctx = request_context.current()
+    if ctx is not None and report.trimmed:
+        ctx.context_trimmed = report.header()
+    return messages, report.tokens_after
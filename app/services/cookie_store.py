@@ -0,0 +1,111 @@
+"""Gemini cookie 持久化与跨 worker 同步
+
+gemini_webapi 的 auto_refresh 只在内存中轮换 __Secure-1PSIDTS。这里负责：
+- 原子写入 cookie 文件（临时文件 + rename），读者永远不会看到半个文件
+- 通过共享状态租约选出唯一的 refresher：只有它开启 auto_refresh，
+  并把轮换后的 cookie 写回文件，避免多个 worker 各自轮换互相作废
+- 所有 worker 监测文件 mtime，变化后重新加载 cookie
+"""
+import asyncio
+import json
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+
+from app.services.logger import logger
+from app.services.shared_state import SharedState, get_state, worker_id
+
+if TYPE_CHECKING:
+    from app.providers.gemini import GeminiProvider
+
+COOKIE_NAMES = ("__Secure-1PSID", "__Secure-1PSIDTS")
+
+
+def write_json_atomic(path: str | Path, data: Any) -> None:
+    """写入临时文件并 fsync 后 rename 覆盖目标文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class CookieStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> dict:
+        return json.loads(Path(self.path).read_text(encoding="utf-8"))
+
+    def save(self, psid: str, psidts: str = "") -> dict:
+        data = {
+            "__Secure-1PSID": psid,
+            "__Secure-1PSIDTS": psidts,
+            "updated_at": datetime.now().isoformat(),
+        }
+        write_json_atomic(self.path, data)
+        return data
+
+    def mtime(self) -> int | None:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+
+class CookieRefresher:
+    """选举唯一的 cookie refresher，并在各 worker 间同步 cookie 文件"""
+
+    LOCK = "gemini-cookie-refresher"
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        state: Callable[[], SharedState] = get_state,
+    ) -> None:
+        self.interval = interval
+        self._state = state
+        self.is_leader = False
+
+    def elect(self) -> bool:
+        """获取或续期 refresher 租约；租约时长覆盖数个同步周期，持有者宕机后由其他 worker 接管"""
+        self.is_leader = self._state().try_lock(self.LOCK, worker_id(), ttl=self.interval * 3)
+        return self.is_leader
+
+    def resign(self) -> None:
+        if self.is_leader:
+            self._state().unlock(self.LOCK, worker_id())
+            self.is_leader = False
+
+    async def sync(self, provider: "GeminiProvider") -> None:
+        was_leader = self.is_leader
+        self.elect()
+        if provider.cookies_changed() or (self.is_leader and not was_leader):
+            # 文件被其他 worker/管理接口更新，或本 worker 刚接任 refresher（需要开启 auto_refresh）
+            logger.info("Reloading Gemini cookies")
+            await provider.reload_cookies()
+        elif self.is_leader and provider.persist_cookies():
+            logger.info("Persisted refreshed Gemini cookies")
+
+    async def run(self, provider: Callable[[], "GeminiProvider | None"]) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            gemini = provider()
+            if gemini is None:
+                continue
+            try:
+                await self.sync(gemini)
+            except Exception as e:
+                logger.warning(f"Gemini cookie sync failed: {e}")
+
+
+refresher = CookieRefresher()
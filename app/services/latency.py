@@ -0,0 +1,39 @@
+"""滚动延迟统计
+
+按 key（通常是模型名）保存最近 N 个成功请求的耗时，用于计算分位数。
+hedging 阈值、自适应超时都基于这里的数据。
+"""
+import math
+from collections import deque
+from threading import Lock
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 500) -> None:
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._lock = Lock()
+
+    def observe(self, key: str, seconds: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            with self._lock:
+                samples = self._samples.setdefault(key, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def count(self, key: str) -> int:
+        samples = self._samples.get(key)
+        return len(samples) if samples else 0
+
+    def percentile(self, key: str, pct: float, min_samples: int = 1) -> float | None:
+        """返回第 pct 分位的耗时（秒），样本不足时返回 None"""
+        samples = self._samples.get(key)
+        if not samples or len(samples) < max(1, min_samples):
+            return None
+        ordered = sorted(samples)
+        # nearest-rank 分位数
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def keys(self) -> list[str]:
+        return list(self._samples)
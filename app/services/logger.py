@@ -1,49 +1,94 @@
+"""日志
+
+- 控制台和文件 sink 都使用 loguru 的 enqueue 模式：请求路径上只格式化并入队，
+  写 stdout/磁盘在后台线程完成，不阻塞事件循环
+- 可选 JSON 行格式，logger.bind() 绑定的字段（request_id、status 等）作为顶层字段输出
+- 高频的成功请求日志可按采样率记录，出错和慢请求总是记录
+- 切换日志级别时按原配置重建全部 sink，文件日志不会丢失
+"""
+import json
+import random
 import sys
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal
+
 from loguru import logger
 
+from app.config.settings import LoggingSettings
+
 LogLevel = Literal["DEBUG", "INFO", "WARNING", "ERROR"]
 
+CONSOLE_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | {message}"
+
+
+def _json_format(record: dict) -> str:
+    """把记录序列化为一行 JSON，放进 extra 后交给 loguru 输出"""
+    data: dict[str, Any] = {
+        "ts": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+    }
+    data.update((k, v) for k, v in record["extra"].items() if not k.startswith("_"))
+    if record["exception"] is not None:
+        data["exception"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(data, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
 class LogManager:
-    def __init__(self, level: LogLevel = "INFO"):
+    def __init__(self, level: LogLevel = "INFO", enqueue: bool = True):
         self.current_level = level
+        self.settings = LoggingSettings(level=level, enqueue=enqueue)
         self.file_handler_id = None
+        self.console_handler_id = None
+        self._file: tuple[str, str, str] | None = None  # (路径, rotation, retention)
         self._setup_logger()
-    
+
     def _setup_logger(self) -> None:
+        """按当前配置重建控制台和文件 sink"""
         logger.remove()
-        # Console handler
-        logger.add(
+        json_lines = self.settings.serialize
+        self.console_handler_id = logger.add(
             sys.stdout,
             level=self.current_level,
-            format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | {message}",
-            colorize=True
+            format=_json_format if json_lines else CONSOLE_FORMAT,
+            colorize=not json_lines,
+            enqueue=self.settings.enqueue,
         )
-    
+        self.file_handler_id = None
+        if self._file is not None:
+            file_path, rotation, retention = self._file
+            self.file_handler_id = logger.add(
+                file_path,
+                level=self.current_level,
+                format=_json_format if json_lines else self.settings.format,
+                rotation=rotation,
+                retention=retention,
+                encoding="utf-8",
+                enqueue=self.settings.enqueue,
+            )
+
+    def configure(self, settings: LoggingSettings) -> None:
+        """应用 logging 配置（级别、格式、采样、文件日志）"""
+        self.settings = settings
+        self.current_level = settings.level.upper()  # type: ignore
+        if settings.file:
+            Path(settings.file).parent.mkdir(parents=True, exist_ok=True)
+            self._file = (settings.file, settings.rotation, settings.retention)
+        else:
+            self._file = None
+        self._setup_logger()
+        if settings.file:
+            logger.info(f"File logging enabled: {settings.file}")
+
     def setup_file_logging(self, file_path: str, rotation: str = "10 MB", retention: str = "7 days"):
         """配置文件日志"""
-        # 移除旧的文件 handler
-        if self.file_handler_id is not None:
-            try:
-                logger.remove(self.file_handler_id)
-            except:
-                pass
-        
         # 确保目录存在
         Path(file_path).parent.mkdir(parents=True, exist_ok=True)
-        
-        # 添加新的文件 handler
-        self.file_handler_id = logger.add(
-            file_path,
-            level=self.current_level,
-            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {message}",
-            rotation=rotation,
-            retention=retention,
-            encoding="utf-8"
-        )
+        self._file = (file_path, rotation, retention)
+        self._setup_logger()
         logger.info(f"File logging enabled: {file_path}")
-    
+
     def set_level(self, level: LogLevel) -> str:
         """切换日志级别，返回之前的级别"""
         previous = self.current_level
@@ -51,10 +96,23 @@ class LogManager:
         self._setup_logger()
         logger.info(f"Log level changed from {previous} to {level}")
         return previous
-    
+
     def get_level(self) -> str:
         return self.current_level
 
+    def should_log_access(self, status: int, seconds: float) -> bool:
+        """状态码不低于 always_log_status（默认 400）或慢于 slow_threshold 的请求总是记录，其余按采样率记录"""
+        return (
+            status >= self.settings.always_log_status
+            or seconds >= self.settings.slow_threshold
+            or random.random() < self.settings.sample_rate
+        )
+
+    async def flush(self) -> None:
+        """等待队列中的日志写完（关闭前调用）"""
+        await logger.complete()
+
+
 # 全局实例
 log_manager = LogManager("INFO")
 
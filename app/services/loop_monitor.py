@@ -0,0 +1,135 @@
+"""事件循环延迟监控与阻塞检测
+
+事件循环上的同步操作（读写文件、HAR 的 JSON 解析、大图片 base64 编解码等）会让所有并发请求
+和流式响应同时停顿。这里分两部分观测：
+- 延迟：后台协程每 interval 秒 sleep 一次，实际唤醒时间与预期之差即调度延迟，记入直方图
+- 阻塞：看门狗线程检查协程的心跳，超过 threshold 仍未唤醒时，从另一个线程抓取事件循环线程
+  当前的调用栈（即正在阻塞的回调），循环恢复后补上阻塞时长，记为一次 stall 并输出警告日志
+汇总见 /health（不含调用栈）和 /metrics，最近 stall 的调用栈见 GET /admin/loop。
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any
+
+from app.config.settings import LoopMonitorSettings
+from app.services import metrics
+from app.services.logger import logger
+
+
+class Stall:
+    __slots__ = ("at", "duration", "stack")
+
+    def __init__(self, stack: list[str]) -> None:
+        self.at = time.time()
+        self.duration: float | None = None  # 循环恢复前为 None
+        self.stack = stack
+
+    def to_dict(self, stack: bool = True) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "at": datetime.fromtimestamp(self.at, timezone.utc).isoformat(),
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+        }
+        if stack:
+            data["stack"] = self.stack
+        return data
+
+
+class LoopMonitor:
+    def __init__(self, settings: LoopMonitorSettings | None = None) -> None:
+        self.settings = settings or LoopMonitorSettings()
+        self.stalls: deque[Stall] = deque(maxlen=self.settings.keep)
+        self.stall_count = 0
+        self.last_lag = 0.0
+        # (时刻, 延迟)，用于统计窗口内的最大延迟
+        self._lags: deque[tuple[float, float]] = deque()
+        self._heartbeat = 0.0
+        self._captured = 0.0  # 已抓取调用栈的心跳，避免同一次阻塞重复抓取
+        self._pending: tuple[float, Stall] | None = None  # (心跳, 抓取到的 stall)
+        self._loop_thread: int | None = None
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._watchdog is not None and self._watchdog.is_alive()
+
+    def _capture(self) -> list[str]:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return []
+        return [line.rstrip() for line in traceback.format_list(traceback.extract_stack(frame, self.settings.stack_depth))]
+
+    def _watch(self) -> None:
+        """看门狗线程：心跳超时即抓取事件循环线程的调用栈"""
+        poll = max(0.005, self.settings.threshold / 4)
+        while not self._stopped.wait(poll):
+            heartbeat = self._heartbeat
+            overdue = time.monotonic() - heartbeat - self.settings.interval
+            if heartbeat and overdue > self.settings.threshold and self._captured != heartbeat:
+                self._captured = heartbeat
+                self._pending = (heartbeat, Stall(self._capture()))
+
+    def record(self, lag: float, heartbeat: float = 0.0) -> None:
+        """记录一次唤醒延迟（在事件循环中调用），heartbeat 为本次探测开始的心跳"""
+        now = time.monotonic()
+        self.last_lag = lag
+        self._lags.append((now, lag))
+        while self._lags and self._lags[0][0] < now - self.settings.window:
+            self._lags.popleft()
+        metrics.LOOP_LAG.observe(value=lag)
+
+        pending, self._pending = self._pending, None
+        if lag < self.settings.threshold:
+            return
+        # 阻塞短于看门狗轮询间隔时可能没有调用栈
+        stall = pending[1] if pending and pending[0] == heartbeat else Stall([])
+        stall.duration = lag
+        self.stalls.append(stall)
+        self.stall_count += 1
+        metrics.LOOP_STALLS.inc()
+        where = "\n".join(stall.stack[-8:]) if stall.stack else "(stack not captured)"
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms\n{where}")
+
+    async def run(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        interval = self.settings.interval
+        try:
+            while True:
+                heartbeat = self._heartbeat = time.monotonic()
+                await asyncio.sleep(interval)
+                self.record(max(0.0, time.monotonic() - heartbeat - interval), heartbeat)
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._heartbeat = 0.0
+
+    def snapshot(self, stacks: bool = False) -> dict[str, Any]:
+        window_max = max((lag for _, lag in self._lags), default=0.0)
+        return {
+            "lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(window_max * 1000, 2),  # 统计窗口内
+            "window_s": self.settings.window,
+            "threshold_ms": round(self.settings.threshold * 1000, 1),
+            "stalls": self.stall_count,
+            "recent_stalls": [s.to_dict(stacks) for s in reversed(self.stalls)],
+        }
+
+
+monitor = LoopMonitor()
+
+
+def configure(settings: LoopMonitorSettings) -> LoopMonitor:
+    global monitor
+    monitor.stop()
+    monitor = LoopMonitor(settings)
+    return monitor
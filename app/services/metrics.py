@@ -0,0 +1,188 @@
+"""Prometheus 指标
+
+手写的最小实现（Counter / Gauge / Histogram + 文本格式输出），不引入
+prometheus_client 依赖。请求路径上只做字典查找和加法；
+排队数、熔断状态等现成状态在抓取时由 collector 读取，不在请求路径上维护。
+"""
+import bisect
+import math
+from threading import Lock
+from typing import Callable, Iterable
+
+# LLM 调用耗时跨度大，桶覆盖 50ms ~ 3min
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180)
+# 事件循环延迟正常在毫秒级，超过 100ms 即可感知
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+Sample = tuple[str, dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = Lock()
+
+    def _key(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(v) for v in labels)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, value in list(self._values.items()):
+            yield self.name, dict(zip(self.label_names, key)), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合: [各桶计数..., +Inf 计数, 总和]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, *labels, value: float) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, *labels) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterable[Sample]:
+        for key, counts in list(self._values.items()):
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, counts[-1]
+
+
+class _CollectedGauge(_Metric):
+    """抓取时通过回调取值的 gauge"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Iterable[tuple[dict[str, str], float]]]) -> None:
+        super().__init__(name, help)
+        self._collect = collect
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._collect():
+            yield self.name, labels, value
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, name: str, help: str, collect: Callable[[], Iterable[tuple[dict[str, str], float]]]) -> None:
+        self.register(_CollectedGauge(name, help, collect))
+
+    def render(self) -> str:
+        parts = []
+        for metric in self._metrics.values():
+            try:
+                parts.append(metric.render())
+            except Exception as e:
+                # 单个 collector 出错不影响其他指标
+                parts.append(f"# {metric.name} collection failed: {_escape(str(e))}")
+        return "\n".join(parts) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter("gateway_requests_total", "HTTP requests by route and status", ("route", "method", "status"))
+REQUEST_DURATION = registry.histogram("gateway_request_duration_seconds", "HTTP request latency by route", ("route",))
+IN_FLIGHT = registry.gauge("gateway_requests_in_flight", "HTTP requests currently being served")
+MODEL_REQUESTS = registry.counter("gateway_model_requests_total", "Model calls by model, serving provider and status", ("model", "provider", "status"))
+TIME_TO_FIRST_TOKEN = registry.histogram("gateway_time_to_first_token_seconds", "Time from request start to the first response body chunk", ("model",))
+UPSTREAM_DURATION = registry.histogram("gateway_upstream_duration_seconds", "Upstream call latency by provider and model", ("provider", "model", "outcome"))
+RETRIES = registry.counter("gateway_retries_total", "Upstream retries on the same route by provider and error code", ("provider", "code"))
+# outcome: won（hedge 先返回）/ lost（主请求先返回）/ failed（都失败）/ skipped（预算不足未发出）
+HEDGES = registry.counter("gateway_hedges_total", "Hedged requests by outcome", ("outcome",))
+ERRORS = registry.counter("gateway_errors_total", "Errors returned to clients by AIGatewayError code", ("code",))
+IMAGE_BYTES = registry.counter("gateway_image_bytes_total", "Image bytes served", ("provider",))
+LOOP_LAG = registry.histogram("gateway_event_loop_lag_seconds", "Event loop scheduling lag", buckets=LOOP_LAG_BUCKETS)
+LOOP_STALLS = registry.counter("gateway_event_loop_stalls_total", "Event loop stalls longer than the blocking threshold")
+
+
+def render() -> str:
+    return registry.render()
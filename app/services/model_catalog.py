@@ -0,0 +1,81 @@
+"""统一模型目录
+
+汇总 Gemini 配置的模型和 g4f 动态发现的模型（经 ModelRegistry 按前缀过滤），
+一次性序列化为 /v1/models 和 /v1/claude/models 的响应字节并计算 ETag。
+请求路径上只做一次属性读取，不再重复查询和序列化。
+目录属于运行时快照：配置重载时随新快照重建（Gemini 模型列表来自新配置），
+g4f 模型由 app.main 中的后台任务定时调用 refresh 重新发现。
+指标的 model 标签也以目录为准，目录外的模型名（客户端可任意填写）归为 "other"。
+"""
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from fastapi import Response
+
+from app.services.model_registry import ModelRegistry
+
+if TYPE_CHECKING:
+    from app.providers.g4f import G4FProvider
+
+
+@dataclass(frozen=True)
+class RenderedCatalog:
+    body: bytes
+    etag: str
+
+
+def _render(payload: dict) -> RenderedCatalog:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return RenderedCatalog(body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+
+
+def catalog_response(rendered: RenderedCatalog, if_none_match: str | None = None) -> Response:
+    """返回缓存的目录字节；客户端 ETag 匹配时返回 304"""
+    headers = {"ETag": rendered.etag, "Cache-Control": "no-cache"}
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if rendered.etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=rendered.body, media_type="application/json", headers=headers)
+
+
+class ModelCatalog:
+    def __init__(self, gemini_models: list[str] | None = None, g4f: "G4FProvider | None" = None) -> None:
+        self.g4f = g4f
+        self._gemini_models = list(gemini_models or [])
+        self._g4f_models: list[str] = []
+        self.openai = _render({"object": "list", "data": []})
+        self.claude = _render({"data": []})
+        self._known: frozenset[str] = frozenset()
+        self._rebuild()
+
+    @property
+    def models(self) -> list[tuple[str, str]]:
+        """(模型 ID, owned_by) 列表"""
+        return [(m, "google") for m in self._gemini_models] + [(m, "g4f") for m in self._g4f_models]
+
+    def metric_label(self, model: str | None) -> str:
+        """指标的 model 标签：目录中的模型原样返回，其余归为 other，避免标签基数膨胀"""
+        return model if model in self._known else "other"
+
+    def _rebuild(self) -> None:
+        models = self.models
+        self._known = frozenset(m for m, _ in models)
+        self.openai = _render({
+            "object": "list",
+            "data": [{"id": m, "object": "model", "owned_by": owner} for m, owner in models],
+        })
+        self.claude = _render({
+            "data": [{"type": "model", "id": m, "display_name": m} for m, _ in models],
+        })
+
+    async def refresh(self) -> None:
+        """重新发现 g4f 模型并重建缓存"""
+        if self.g4f is not None:
+            # 读取 g4f 模型列表会触发模块导入，放到线程中避免阻塞事件循环
+            available = await asyncio.to_thread(self.g4f.available_models)
+            self._g4f_models = ModelRegistry(self.g4f.model_prefixes).filter_models(available)
+        self._rebuild()
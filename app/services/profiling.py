@@ -0,0 +1,253 @@
+"""采样 profiler
+
+后台线程按固定间隔读取各线程的调用栈（sys._current_frames），按折叠格式计数：
+每行 `帧1;帧2;...;帧N 次数`，可直接交给 flamegraph.pl、inferno 或 speedscope 生成火焰图。
+被测代码不插桩，开销只取决于采样频率。
+
+两种模式共用一个采样线程，只在需要时运行：
+- 全进程：管理接口启动/停止，采样所有线程（事件循环线程和 to_thread 的工作线程），超时自动停止
+- 单请求：带 X-Profile 头的管理 key 请求，只在事件循环正在执行该请求的任务时计入样本。
+  请求的任务通过事件循环的 task factory 识别：请求上下文中有进行中的 profile 时创建的任务都归属该请求
+多 worker 时各进程独立采样。
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any
+
+from app.config.settings import ProfilingSettings
+from app.services import request_context
+from app.services.logger import logger
+
+HEADER = "X-Profile"
+
+
+def _path_prefixes() -> list[str]:
+    prefixes = {os.getcwd()} | {p for p in sys.path if p and os.path.isdir(p)}
+    return sorted((os.path.join(p, "") for p in prefixes), key=len, reverse=True)
+
+
+class StackFolder:
+    """把帧链转换为折叠格式的一行；帧标签按 code 对象缓存"""
+
+    def __init__(self) -> None:
+        self._labels: dict[Any, str] = {}
+        self._prefixes = _path_prefixes()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for prefix in self._prefixes:
+                if filename.startswith(prefix):
+                    filename = filename[len(prefix):]
+                    break
+            name = getattr(code, "co_qualname", code.co_name)
+            label = f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def fold(self, frame, root: str | None = None) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        if root:
+            labels.append(root)
+        return ";".join(reversed(labels))
+
+
+def render(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class RequestProfile:
+    def __init__(self, request_id: str, path: str) -> None:
+        self.request_id = request_id
+        self.path = path
+        self.started = time.monotonic()
+        self.duration = 0.0
+        self.stacks: Counter = Counter()
+        self.samples = 0  # 该请求的任务在事件循环上运行时采到的样本
+        self.active = True
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "path": self.path,
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": self.samples,
+        }
+
+    def folded(self) -> str:
+        return render(self.stacks)
+
+
+class Profiler:
+    def __init__(self, settings: ProfilingSettings | None = None) -> None:
+        self.settings = settings or ProfilingSettings()
+        self._folder = StackFolder()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        # 全进程采样
+        self._stacks: Counter | None = None
+        self._started = 0.0
+        self._deadline = 0.0
+        self._samples = 0
+        self._last: Counter | None = None  # 最近一次结束的全进程采样
+        # 单请求采样
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.Task, RequestProfile]" = weakref.WeakKeyDictionary()
+        self._requests: set[RequestProfile] = set()
+        self.recent: deque[RequestProfile] = deque(maxlen=self.settings.keep_requests)
+
+    @property
+    def running(self) -> bool:
+        return self._stacks is not None
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.settings.interval,
+            "elapsed": round(time.monotonic() - self._started, 3) if self.running else None,
+            "samples": self._samples if self.running else None,
+            "requests": [p.summary() for p in self.recent],
+        }
+
+    # ---- 采样线程 ----
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                if self._stacks is not None and time.monotonic() >= self._deadline:
+                    logger.warning(f"Profiler stopped after max_duration {self.settings.max_duration}s")
+                    self._finish()
+                if self._stacks is None and not self._requests:
+                    self._thread = None
+                    return
+                self._sample(own)
+            time.sleep(self.settings.interval)
+
+    def _sample(self, own: int) -> None:
+        frames = sys._current_frames()
+        if self._stacks is not None:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident != own:
+                    self._stacks[self._folder.fold(frame, f"thread:{names.get(ident, ident)}")] += 1
+            self._samples += 1
+        if self._requests and self._loop is not None:
+            task = asyncio.current_task(self._loop)
+            profile = self._tasks.get(task) if task is not None else None
+            if profile is not None and profile.active:
+                frame = frames.get(self._loop_thread)
+                if frame is not None:
+                    profile.stacks[self._folder.fold(frame)] += 1
+                    profile.samples += 1
+
+    # ---- 全进程 ----
+
+    def start(self, interval: float | None = None, duration: float | None = None) -> bool:
+        """开始全进程采样；已在运行时返回 False"""
+        with self._lock:
+            if self._stacks is not None:
+                return False
+            if interval:
+                self.settings = self.settings.model_copy(update={"interval": interval})
+            self._stacks = Counter()
+            self._samples = 0
+            self._started = time.monotonic()
+            self._deadline = self._started + min(duration or self.settings.max_duration, self.settings.max_duration)
+            self._ensure_thread()
+        return True
+
+    def _finish(self) -> Counter | None:
+        stacks, self._stacks = self._stacks, None
+        self._last = stacks
+        return stacks
+
+    def stop(self) -> str | None:
+        """停止全进程采样并返回折叠格式结果；未在运行时返回最近一次（超时自动停止）的结果"""
+        with self._lock:
+            stacks = self._finish() if self._stacks is not None else self._last
+        return render(stacks) if stacks is not None else None
+
+    # ---- 单请求 ----
+
+    def _install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """包装事件循环的 task factory，记录被 profile 的请求创建的任务"""
+        if self._loop is loop:
+            return
+        previous = loop.get_task_factory()
+        tasks = self._tasks
+
+        def factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            ctx = request_context.current()
+            if ctx is not None and ctx.profile is not None and ctx.profile.active:
+                tasks[task] = ctx.profile
+            return task
+
+        loop.set_task_factory(factory)
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+
+    def begin(self, ctx: request_context.RequestContext, path: str) -> RequestProfile:
+        """开始采样当前请求（在请求所在的任务中调用）"""
+        loop = asyncio.get_running_loop()
+        profile = RequestProfile(ctx.request_id, path)
+        with self._lock:
+            self._install(loop)
+            self._tasks[asyncio.current_task()] = profile
+            self._requests.add(profile)
+            self._ensure_thread()
+        ctx.profile = profile
+        return profile
+
+    def end(self, profile: RequestProfile) -> None:
+        """结束单请求采样；重复调用无效"""
+        with self._lock:
+            if not profile.active:
+                return
+            profile.active = False
+            profile.duration = time.monotonic() - profile.started
+            self._requests.discard(profile)
+            self.recent.append(profile)
+        if self.settings.dir:
+            asyncio.get_running_loop().run_in_executor(None, self._save, profile)
+
+    def _save(self, profile: RequestProfile) -> None:
+        try:
+            directory = Path(self.settings.dir)
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"{profile.request_id}.folded").write_text(profile.folded(), encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"Failed to save profile {profile.request_id}: {e}")
+
+    def find(self, request_id: str) -> RequestProfile | None:
+        for profile in reversed(self.recent):
+            if profile.request_id == request_id:
+                return profile
+        return None
+
+
+profiler = Profiler()
+
+
+def configure(settings: ProfilingSettings) -> Profiler:
+    global profiler
+    profiler.stop()
+    profiler = Profiler(settings)
+    return profiler
@@ -0,0 +1,187 @@
+"""按 API Key 限流
+
+- 请求速率：每个 key 每分钟 rpm 个请求
+- 并发流：每个 key 同时进行的流式请求数
+单进程时在内存中计数：请求速率用令牌桶（容量 rpm，允许突发，按 rpm/60 每秒补充），
+配置热重载时保留未变化 key 的桶状态，避免重载即清零限额。
+多 worker 共享状态（server.state_path）时改为跨进程计数，限额对整个服务生效而不是每个 worker 各一份：
+- 请求速率用共享计数器的固定 60 秒窗口
+- 并发流按名额租约占用（每个名额一个租约），worker 异常退出时租约在 STREAM_LEASE_TTL 后过期
+共享状态的读写是同步的 SQLite 事务，放到线程中执行，不阻塞事件循环。
+"""
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable
+
+from app.services import shared_state
+from app.services.shared_state import SharedState
+from app.utils.errors import RateLimitError
+
+WINDOW = 60.0
+STREAM_LEASE_TTL = 600.0  # 超过该时长的流式请求名额可能被其他请求占用
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """取令牌；成功返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+@dataclass(frozen=True)
+class KeyLimits:
+    rpm: int | None = None
+    max_concurrent_streams: int | None = None
+
+
+class KeyLimiter:
+    def __init__(self, clock: Callable[[], float] = time.monotonic, state: SharedState | None = None) -> None:
+        self._clock = clock
+        self._state = state  # 为 None 时使用当前的全局共享状态
+        self._limits: dict[str, KeyLimits] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._streams: dict[str, int] = {}
+        self._lock = Lock()
+
+    def _shared(self) -> SharedState | None:
+        state = self._state or shared_state.get_state()
+        return state if state.shared else None
+
+    def configure(self, limits: dict[str, KeyLimits]) -> None:
+        """替换限额表；rpm 未变化的 key 保留现有令牌桶"""
+        with self._lock:
+            buckets = {}
+            for name, limit in limits.items():
+                if not limit.rpm:
+                    continue
+                bucket = self._buckets.get(name)
+                if bucket is None or self._limits.get(name, KeyLimits()).rpm != limit.rpm:
+                    bucket = TokenBucket(limit.rpm / 60, limit.rpm, self._clock)
+                buckets[name] = bucket
+            self._limits = dict(limits)
+            self._buckets = buckets
+
+    async def check_request(self, name: str) -> float | None:
+        """占用一次请求额度；超限时返回建议的重试等待秒数"""
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            return None
+        state = self._shared()
+        if state is not None:
+            # 共享模式是固定 60 秒窗口而非令牌桶：窗口边界前后可能出现最多 2 × rpm 的突发
+            now = time.time()
+            count = await asyncio.to_thread(state.incr, f"rpm:{name}:{int(now // WINDOW)}", ttl=WINDOW * 2)
+            return WINDOW - now % WINDOW if count > self._limits[name].rpm else None
+        wait = bucket.try_acquire()
+        return wait or None
+
+    @asynccontextmanager
+    async def stream(self, name: str | None):
+        """占用一个并发流名额，超限时抛出 RateLimitError"""
+        limit = self._limits.get(name).max_concurrent_streams if name in self._limits else None
+        if not limit:
+            yield
+            return
+        state = self._shared()
+        if state is not None:
+            async with self._shared_stream(state, name, limit):
+                yield
+            return
+        with self._lock:
+            active = self._streams.get(name, 0)
+            if active >= limit:
+                raise RateLimitError(f"Too many concurrent streams for key '{name}' (limit {limit})")
+            self._streams[name] = active + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._streams[name] -= 1
+
+    @asynccontextmanager
+    async def _shared_stream(self, state: SharedState, name: str, limit: int):
+        owner = f"{shared_state.worker_id()}:{uuid.uuid4().hex[:8]}"
+        acquire = asyncio.ensure_future(asyncio.to_thread(_take_lease, state, name, limit, owner))
+        try:
+            lease = await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # 线程中可能已拿到租约：完成后归还，避免名额一直占到租约过期
+            def unlock(future: asyncio.Future) -> None:
+                if not future.cancelled() and future.exception() is None and future.result():
+                    state.unlock(future.result(), owner)
+
+            acquire.add_done_callback(unlock)
+            raise
+        if lease is None:
+            raise RateLimitError(f"Too many concurrent streams for key '{name}' (limit {limit})")
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(state.unlock, lease, owner)
+
+    def _active_streams(self, name: str, limit: KeyLimits) -> int:
+        state = self._shared()
+        if state is None or not limit.max_concurrent_streams:
+            return self._streams.get(name, 0)
+        return sum(
+            state.get(f"lock:stream:{name}:{slot}") is not None for slot in range(limit.max_concurrent_streams)
+        )
+
+    def _remaining(self, name: str, limit: KeyLimits) -> float | None:
+        if name not in self._buckets:
+            return None
+        state = self._shared()
+        if state is None:
+            return round(self._buckets[name].tokens, 3)
+        used = state.get(f"rpm:{name}:{int(time.time() // WINDOW)}", 0)
+        return max(0, limit.rpm - used)
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            name: {
+                "rpm": limit.rpm,
+                "max_concurrent_streams": limit.max_concurrent_streams,
+                "tokens": self._remaining(name, limit),
+                "active_streams": self._active_streams(name, limit),
+            }
+            for name, limit in self._limits.items()
+        }
+
+
+def _take_lease(state: SharedState, name: str, limit: int, owner: str) -> str | None:
+    """依次尝试各名额的租约，返回拿到的租约名；都被占用时返回 None"""
+    for slot in range(limit):
+        lease = f"stream:{name}:{slot}"
+        if state.try_lock(lease, owner, STREAM_LEASE_TTL):
+            return lease
+    return None
+
+
+limiter = KeyLimiter()
@@ -0,0 +1,48 @@
+"""请求级上下文
+
+由请求中间件在每个请求开始时创建，路由、provider 调用链可以在其中
+记录统计信息（如重试次数），中间件在响应时读取并写入响应头。
+"""
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class RequestContext:
+    started: float = field(default_factory=time.monotonic)
+    request_id: str = ""
+    spans: list[tuple[str, float, float]] = field(default_factory=list)  # (阶段, 相对开始时间, 耗时)
+    retries: int = 0
+    api_key: str | None = None  # 通过认证的租户名
+    admin: bool = False  # 以管理 key 认证
+    # 用量统计：由路由在调用上游前后填写
+    model: str | None = None
+    provider: str | None = None
+    input_chars: int = 0
+    output_chars: int = 0
+    input_tokens: int | None = None  # 本地分词器计数；未设置时按字符数估算
+    output_tokens: int | None = None
+    context_trimmed: str | None = None  # 上下文裁剪报告，作为响应头返回
+    error_code: str | None = None  # 返回给客户端的 AIGatewayError.code
+    profile: Any = None  # 进行中的单请求 profile（profiler.RequestProfile）
+
+
+_current: ContextVar[RequestContext | None] = ContextVar("request_context", default=None)
+
+
+def start(request_id: str = "") -> RequestContext:
+    ctx = RequestContext(request_id=request_id)
+    _current.set(ctx)
+    return ctx
+
+
+def current() -> RequestContext | None:
+    return _current.get()
+
+
+def api_key() -> str | None:
+    """当前请求的租户名，不在请求中或未认证时为 None"""
+    ctx = _current.get()
+    return ctx.api_key if ctx else None
@@ -0,0 +1,377 @@
+"""跨 Provider 故障转移路由
+
+按模型解析出调用链（主模型 + 配置的 fallback），依次尝试；
+每个 provider 由熔断器保护，熔断中的后端直接跳过，不再等待超时。
+对启用 hedging 的模型，主请求超过延迟分位阈值仍未返回时，
+向备用路由发出第二个请求，先完成者胜出，落败者被取消。
+同一路由上的瞬时错误按指数退避（full jitter）重试，重试总量受预算限制。
+每次上游调用都受按模型自适应的超时约束；超时不在同一路由上重试，直接转移到下一个路由，
+超时的调用按超时值记入延迟统计（删失样本），避免统计只看到成功的快请求而把超时越调越短。
+配置 timeouts.total 时，整个请求（含重试和故障转移）不超过该总时限。
+启用调度器时，每次上游调用先在加权公平队列中获得名额再执行，重试退避期间归还名额。
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+from app.config.settings import HedgingSettings, RetryPolicy, RetrySettings
+from app.services import metrics, request_context
+from app.providers.base import BaseProvider
+from app.services.budget import Budget
+from app.services.chat import Message
+from app.services.circuit_breaker import CircuitBreakerRegistry
+from app.services.latency import LatencyTracker
+from app.services.scheduler import FairScheduler, Flow
+from app.services.logger import logger
+from app.services.timeouts import AdaptiveTimeouts, latency_key
+from app.services.tracing import span
+from app.utils.errors import (
+    AIGatewayError,
+    AuthenticationError,
+    ProviderError,
+    RateLimitError,
+    classify_exception,
+)
+
+T = TypeVar("T")
+
+# 触发熔断计数和故障转移的错误类型
+FAILOVER_ERRORS = (ProviderError, RateLimitError, AuthenticationError)
+
+
+def provider_for_model(model: str) -> str:
+    """根据模型名推断 provider"""
+    return "gemini" if model.startswith("gemini-") else "g4f"
+
+
+@dataclass(frozen=True)
+class Route:
+    provider: str
+    model: str
+
+    @classmethod
+    def parse(cls, spec: str) -> "Route":
+        """解析 'provider:model' 或纯模型名"""
+        provider, sep, model = spec.partition(":")
+        if sep and provider in ("gemini", "g4f"):
+            return cls(provider, model)
+        return cls(provider_for_model(spec), spec)
+
+    def __str__(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+@dataclass
+class RouteResult(Generic[T]):
+    value: T
+    route: Route
+    hedged: bool = False
+
+
+async def invoke_chat(provider: BaseProvider, model: str, messages: list[Message]) -> dict:
+    """以统一方式调用各 provider 的文本对话，返回 {"text": ...}
+
+    Gemini 直接消费 Message（含图片附件），其他 provider 只接收纯文本 dict。
+    """
+    if provider.name == "gemini":
+        return await provider.chat_completions(messages=messages, model=model)
+    result = await provider.chat_completions({"model": model, "messages": [m.to_dict() for m in messages]})
+    text = ""
+    if result.get("choices"):
+        text = result["choices"][0].get("message", {}).get("content", "") or ""
+    return {"text": text}
+
+
+async def invoke_images(provider: BaseProvider, model: str, prompt: str, n: int) -> list[dict]:
+    """以统一方式调用各 provider 的图片生成；Gemini 每次返回一组图片，不接受 n"""
+    if provider.name == "gemini":
+        return await provider.generate_images(prompt=prompt, model=model)
+    return await provider.generate_images(prompt=prompt, model=model, n=n)
+
+
+class FailoverRouter:
+    def __init__(
+        self,
+        providers: dict[str, BaseProvider | None],
+        fallbacks: dict[str, list[str]] | None = None,
+        breakers: CircuitBreakerRegistry | None = None,
+        hedging: HedgingSettings | None = None,
+        latency: LatencyTracker | None = None,
+        retry: RetrySettings | None = None,
+        timeouts: AdaptiveTimeouts | None = None,
+        scheduler: FairScheduler | None = None,
+        model_label: Callable[[str], str] | None = None,
+    ) -> None:
+        self.providers = {name: p for name, p in providers.items() if p is not None}
+        self.fallbacks = {model: [Route.parse(s) for s in specs] for model, specs in (fallbacks or {}).items()}
+        self.breakers = breakers or CircuitBreakerRegistry()
+        self.hedging = hedging or HedgingSettings()
+        self.latency = latency or (timeouts.latency if timeouts else LatencyTracker())
+        self.timeouts = timeouts or AdaptiveTimeouts(latency=self.latency)
+        self.hedge_budget = Budget(self.hedging.budget_ratio, self.hedging.budget_max_tokens)
+        self.retry = retry or RetrySettings()
+        self.retry_budget = Budget(self.retry.budget_ratio, self.retry.budget_max_tokens)
+        self.scheduler = scheduler or FairScheduler()
+        # 指标的 model 标签（通常为模型目录的 metric_label，把目录外的模型名归为 other）
+        self.model_label = model_label or (lambda model: model)
+        self.stats = {"hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "retries": 0, "retries_skipped": 0, "timeouts": 0}
+        self.retries_by_code: dict[str, int] = {}
+
+    def resolve(self, model: str, allow_fallback: bool = True) -> list[Route]:
+        """返回模型的调用链，主路由在前"""
+        chain = [Route(provider_for_model(model), model)]
+        if allow_fallback:
+            chain.extend(r for r in self.fallbacks.get(model, []) if r not in chain)
+        return chain
+
+    def hedge_delay(self, model: str) -> float | None:
+        """主请求等待多久后发出 hedge；未启用 hedging 时返回 None"""
+        policy = self.hedging.models.get(model)
+        if policy is None:
+            return None
+        observed = self.latency.percentile(model, policy.percentile, self.hedging.min_samples)
+        if observed is None:
+            return policy.default_delay
+        return max(policy.min_delay, observed)
+
+    def retry_delay(self, policy: RetryPolicy, error: AIGatewayError, attempt: int) -> float | None:
+        """第 attempt 次失败后应等待多久重试；不应重试时返回 None"""
+        if attempt + 1 >= policy.max_attempts or error.code not in policy.retry_on:
+            return None
+        hint = error.details.get("retry_after")
+        if hint is not None:
+            if hint > policy.max_retry_after:
+                return None
+            delay = hint
+        else:
+            delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+        if not self.retry_budget.try_spend():
+            self.stats["retries_skipped"] += 1
+            return None
+        return delay
+
+    async def _attempt(
+        self,
+        route: Route,
+        invoke: Callable[[BaseProvider, str], Awaitable[T]],
+        deadline_at: float | None = None,
+        operation: str = "chat",
+        flow: Flow | None = None,
+    ) -> T:
+        """在单个路由上执行调用（含重试和超时），维护熔断器和延迟统计
+
+        deadline_at 为请求总时限（time.monotonic() 时刻），单次调用的超时和重试等待都不超过它。
+        operation 区分对话和图片生成等调用，各自统计延迟、计算超时。
+        每次尝试单独占用 flow 的调度名额，重试退避期间不占名额。
+        熔断器只在重试用尽后记一次失败，中间失败的尝试不计入。
+        失败时抛出 AIGatewayError；熔断或未配置时抛出 ProviderError。
+        """
+        provider = self.providers.get(route.provider)
+        if provider is None:
+            raise ProviderError(route.provider, "Provider not configured")
+
+        breaker = self.breakers.get(route.provider)
+        policy = self.retry.models.get(route.model, self.retry.default)
+        key = latency_key(route.model, operation)
+        flow = flow or self.scheduler.flow(request_context.api_key())
+        last_error: AIGatewayError | None = None
+        attempt = 0
+        while True:
+            if not breaker.allow_request():
+                if last_error is not None:
+                    raise last_error
+                logger.debug(f"Circuit open, skipping {route}")
+                raise ProviderError(route.provider, "Circuit open, backend temporarily disabled")
+
+            try:
+                async with self.scheduler.slot(flow):
+                    # 超时从拿到名额后开始计算，排队时间只受请求总时限约束
+                    started = time.monotonic()
+                    timeout = self.timeouts.timeout_for(key)
+                    limit = timeout if deadline_at is None else min(timeout, deadline_at - started)
+                    with span("upstream"):
+                        value = await asyncio.wait_for(invoke(provider, route.model), limit)
+            except Exception as e:
+                metrics.UPSTREAM_DURATION.observe(
+                    route.provider, self.model_label(route.model),
+                    "timeout" if isinstance(e, asyncio.TimeoutError) else "error",
+                    value=time.monotonic() - started,
+                )
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                    if limit < timeout:
+                        # 请求总时限先到，不代表上游异常
+                        breaker.release()
+                        raise ProviderError(route.provider, f"Request deadline exceeded after {limit:.1f}s")
+                    # 删失样本：真实耗时至少为超时值
+                    self.latency.observe(key, timeout)
+                    breaker.record_failure()
+                    logger.warning(f"Route {route} timed out after {timeout:.1f}s")
+                    raise ProviderError(route.provider, f"Upstream timeout after {timeout:.1f}s")
+                if isinstance(e, AIGatewayError):
+                    error = e
+                else:
+                    error = classify_exception(e, route.provider)
+                if not isinstance(error, FAILOVER_ERRORS):
+                    # 请求本身有问题，不计入熔断
+                    breaker.release()
+                    raise error
+                delay = self.retry_delay(policy, error, attempt)
+                if delay is not None and deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                    delay = None
+                if delay is None:
+                    breaker.record_failure()
+                    logger.warning(f"Route {route} failed: {error.message}")
+                    raise error
+                # 还会重试，这次失败不计入熔断
+                breaker.release()
+                logger.info(f"Route {route} failed ({error.code}), retrying in {delay:.2f}s")
+                self._count_retry(route, error)
+                last_error = error
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 被取消（如 hedge 落败），不计入熔断
+                breaker.release()
+                raise
+
+            elapsed = time.monotonic() - started
+            breaker.record_success()
+            self.latency.observe(key, elapsed)
+            metrics.UPSTREAM_DURATION.observe(route.provider, self.model_label(route.model), "ok", value=elapsed)
+            return value
+
+    def _count_retry(self, route: Route, error: AIGatewayError) -> None:
+        self.stats["retries"] += 1
+        metrics.RETRIES.inc(route.provider, error.code)
+        self.retries_by_code[error.code] = self.retries_by_code.get(error.code, 0) + 1
+        ctx = request_context.current()
+        if ctx is not None:
+            ctx.retries += 1
+
+    async def _hedged(
+        self,
+        primary: Route,
+        backup: Route,
+        delay: float,
+        invoke: Callable[[BaseProvider, str], Awaitable[T]],
+        tried: set[Route],
+        deadline_at: float | None = None,
+        flow: Flow | None = None,
+    ) -> tuple[Route, T, bool]:
+        """主请求超过 delay 未返回时，向 backup 发出第二个请求，先完成者胜出"""
+        first = asyncio.create_task(self._attempt(primary, invoke, deadline_at, flow=flow))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary, first.result(), False
+
+            if not self.hedge_budget.try_spend():
+                self.stats["hedges_skipped"] += 1
+                metrics.HEDGES.inc("skipped")
+                pending = set()
+                return primary, await first, False
+
+            self.stats["hedges"] += 1
+            logger.debug(f"Hedging {primary} after {delay:.2f}s via {backup}")
+            tried.add(backup)
+            second = asyncio.create_task(self._attempt(backup, invoke, deadline_at, flow=flow))
+            routes = {first: primary, second: backup}
+            pending = {first, second}
+            errors: dict[asyncio.Task, BaseException] = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        metrics.HEDGES.inc("won" if task is second else "lost")
+                        return routes[task], task.result(), True
+                    if not isinstance(error, FAILOVER_ERRORS):
+                        raise error
+                    errors[task] = error
+            # 两个请求都失败，优先报告主请求的错误
+            metrics.HEDGES.inc("failed")
+            raise errors.get(first) or errors[second]
+        finally:
+            # 取消落败或被放弃的请求
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def call(
+        self,
+        model: str,
+        invoke: Callable[[BaseProvider, str], Awaitable[T]],
+        allow_fallback: bool = True,
+        interactive: bool = False,
+        operation: str = "chat",
+    ) -> RouteResult[T]:
+        """沿调用链执行 invoke(provider, model)，返回第一个成功的结果
+
+        interactive 标记交互式（流式）请求，调度时优先于批量请求。
+        operation 为 "chat" 以外的值（如 "images"）时，按该操作单独统计延迟和超时，不做 hedging。
+        """
+        flow = self.scheduler.flow(request_context.api_key(), interactive)
+        chain = self.resolve(model, allow_fallback)
+        self.hedge_budget.deposit()
+        self.retry_budget.deposit()
+        hedge_delay = self.hedge_delay(model) if operation == "chat" else None
+        total = self.timeouts.settings.total
+        deadline_at = time.monotonic() + total if total else None
+        last_error: AIGatewayError | None = None
+        tried: set[Route] = set()
+
+        for index, route in enumerate(chain):
+            if route in tried:
+                continue
+            if deadline_at is not None and time.monotonic() >= deadline_at:
+                break
+            tried.add(route)
+            try:
+                if index == 0 and hedge_delay is not None and (len(chain) > 1 or self.hedging.same_route):
+                    # hedge 发往下一个 fallback；没有 fallback 时（需开启 same_route）在同一路由上再发一次
+                    backup = chain[1] if len(chain) > 1 else route
+                    served, value, hedged = await self._hedged(
+                        route, backup, hedge_delay, invoke, tried, deadline_at, flow
+                    )
+                else:
+                    value = await self._attempt(route, invoke, deadline_at, operation, flow)
+                    served, hedged = route, False
+            except FAILOVER_ERRORS as e:
+                # 未配置的 provider 不覆盖真实的失败原因
+                if last_error is None or route.provider in self.providers:
+                    last_error = e
+                continue
+
+            if served != chain[0]:
+                logger.info(f"Served {model} via fallback {served}")
+            return RouteResult(value, served, hedged)
+
+        raise last_error or ProviderError(chain[0].provider, "No available route")
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "fallbacks": {model: [str(r) for r in routes] for model, routes in self.fallbacks.items()},
+            "breakers": self.breakers.snapshot(),
+            "timeouts": self.stats["timeouts"],
+            "hedging": {
+                "models": {model: self.hedge_delay(model) for model in self.hedging.models},
+                "budget_tokens": round(self.hedge_budget.tokens, 3),
+                "hedges": self.stats["hedges"],
+                "hedge_wins": self.stats["hedge_wins"],
+                "hedges_skipped": self.stats["hedges_skipped"],
+            },
+            "retry": {
+                "budget_tokens": round(self.retry_budget.tokens, 3),
+                "retries": self.stats["retries"],
+                "retries_skipped": self.stats["retries_skipped"],
+                "by_code": dict(self.retries_by_code),
+            },
+        }
@@ -0,0 +1,141 @@
+"""运行时快照
+
+一个 Runtime 是某一版配置下的全部运行组件（provider、路由、模型目录等），
+创建后不再修改。配置重载时在后台构建新快照并原子替换：
+- 每个请求开始时租用（lease）当前快照，整个请求都使用同一个快照
+- 替换后旧快照上的请求继续完成，租约归零后再关闭旧 provider
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+from app.config.settings import Settings
+from app.services.logger import logger
+from app.services.model_catalog import ModelCatalog
+from app.services.router import FailoverRouter
+
+if TYPE_CHECKING:
+    from app.providers.g4f import G4FProvider
+    from app.providers.gemini import GeminiProvider
+
+
+@dataclass(frozen=True)
+class Runtime:
+    settings: Settings = field(default_factory=Settings)
+    gemini: "GeminiProvider | None" = None
+    g4f: "G4FProvider | None" = None
+    router: FailoverRouter = field(default_factory=lambda: FailoverRouter({}))
+    catalog: ModelCatalog = field(default_factory=ModelCatalog)
+    version: int = 0
+
+    @property
+    def providers(self) -> list:
+        return [p for p in (self.gemini, self.g4f) if p is not None]
+
+
+RuntimeBuilder = Callable[[Settings, Runtime], Awaitable[Runtime]]
+
+
+class RuntimeManager:
+    def __init__(self, initial: Runtime | None = None, drain_timeout: float = 300.0) -> None:
+        self._current = initial or Runtime()
+        self._leases: dict[int, int] = {}
+        self._lock = Lock()
+        self._reload_lock: asyncio.Lock | None = None
+        self._listeners: list[Callable[[Runtime], None]] = []
+        self.builder: RuntimeBuilder | None = None
+        self.drain_timeout = drain_timeout
+
+    @property
+    def current(self) -> Runtime:
+        return self._current
+
+    def add_listener(self, listener: Callable[[Runtime], None]) -> None:
+        """配置重载完成后回调（如更新认证配置）"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def acquire(self) -> Runtime:
+        with self._lock:
+            runtime = self._current
+            self._leases[id(runtime)] = self._leases.get(id(runtime), 0) + 1
+            return runtime
+
+    def release(self, runtime: Runtime) -> None:
+        with self._lock:
+            count = self._leases.get(id(runtime), 0) - 1
+            if count > 0:
+                self._leases[id(runtime)] = count
+            else:
+                self._leases.pop(id(runtime), None)
+
+    def leases(self, runtime: Runtime) -> int:
+        return self._leases.get(id(runtime), 0)
+
+    def install(self, runtime: Runtime) -> Runtime:
+        """原子替换当前快照，返回旧快照"""
+        with self._lock:
+            previous, self._current = self._current, runtime
+        return previous
+
+    async def reload(self, settings: Settings) -> Runtime:
+        """在后台构建新快照并替换；构建失败时保留旧快照"""
+        if self.builder is None:
+            return self._current
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            previous = self._current
+            try:
+                runtime = await self.builder(settings, previous)
+            except Exception as e:
+                logger.error(f"Failed to build runtime v{previous.version + 1}, keeping v{previous.version}: {e}")
+                raise
+            self.install(runtime)
+            for listener in self._listeners:
+                listener(runtime)
+            logger.info(f"Runtime swapped: v{previous.version} -> v{runtime.version}")
+            asyncio.create_task(self.retire(previous))
+            return runtime
+
+    async def retire(self, runtime: Runtime, poll_interval: float = 0.1) -> None:
+        """等待旧快照上的请求结束，然后关闭其独有的 provider"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        while self.leases(runtime) and loop.time() < deadline:
+            await asyncio.sleep(poll_interval)
+        if self.leases(runtime):
+            logger.warning(f"Runtime v{runtime.version} still has {self.leases(runtime)} requests after drain timeout")
+
+        in_use = {id(p) for p in self._current.providers}
+        for provider in runtime.providers:
+            if id(provider) in in_use:
+                continue
+            try:
+                await provider.close()
+            except Exception as e:
+                logger.warning(f"Failed to close {provider.name} provider: {e}")
+        logger.info(f"Runtime v{runtime.version} retired")
+
+
+manager = RuntimeManager()
+_leased: ContextVar[Runtime | None] = ContextVar("runtime", default=None)
+
+
+def current() -> Runtime:
+    """当前请求租用的快照；不在请求中时返回最新快照"""
+    return _leased.get() or manager.current
+
+
+@asynccontextmanager
+async def lease():
+    runtime = manager.acquire()
+    token = _leased.set(runtime)
+    try:
+        yield runtime
+    finally:
+        _leased.reset(token)
+        manager.release(runtime)
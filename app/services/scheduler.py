@@ -0,0 +1,127 @@
+"""上游名额的加权公平调度
+
+上游（尤其是 Gemini）能同时承载的请求有限。并发达到 max_concurrent 后，
+新请求按流（优先级类 + 租户）进入加权公平队列（start-time fair queuing）：
+- 每个流的请求获得完成标签 F = max(V, 该流上一个 F) + 1 / 权重
+- 名额释放时交给 F 最小的请求，并把虚拟时间 V 推进到它的开始标签
+权重 = 优先级类权重 × 租户权重，因此 interactive 请求总是先于 batch，
+同一类中大批量的租户也无法饿死其他租户。
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, NamedTuple
+
+from app.config.settings import SchedulerSettings
+from app.services.latency import LatencyTracker
+from app.services.tracing import span
+
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+
+
+class Flow(NamedTuple):
+    priority: str
+    tenant: str
+
+
+class FairScheduler:
+    def __init__(self, settings: SchedulerSettings | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.settings = settings or SchedulerSettings()
+        self._clock = clock
+        self._active = 0
+        self._queue: list[tuple[float, int, float, Flow, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._finish: dict[Flow, float] = {}
+        self.waits = LatencyTracker()  # 按优先级类统计排队时间
+        self.granted: dict[Flow, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.max_concurrent > 0
+
+    def flow(self, tenant: str | None, interactive: bool = False) -> Flow:
+        tenant = tenant or "anonymous"
+        policy = self.settings.tenants.get(tenant)
+        priority = policy.priority if policy and policy.priority else (INTERACTIVE if interactive else STANDARD)
+        return Flow(priority, tenant)
+
+    def weight(self, flow: Flow) -> float:
+        policy = self.settings.tenants.get(flow.tenant)
+        tenant_weight = policy.weight if policy else 1.0
+        return max(1e-6, self.settings.classes.get(flow.priority, 1.0) * tenant_weight)
+
+    @asynccontextmanager
+    async def slot(self, flow: Flow):
+        """占用一个上游名额，名额不足时排队"""
+        if not self.enabled:
+            yield
+            return
+        started = self._clock()
+        with span("queue"):
+            await self._acquire(flow)
+        self.waits.observe(flow.priority, self._clock() - started)
+        self.granted[flow] = self.granted.get(flow, 0) + 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, flow: Flow) -> None:
+        if self._active < self.settings.max_concurrent and not self._queue:
+            self._active += 1
+            return
+        start = max(self._vtime, self._finish.get(flow, 0.0))
+        finish = start + 1.0 / self.weight(flow)
+        self._finish[flow] = finish
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish, next(self._seq), start, flow, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已移交但请求被取消，转交给下一个
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        """归还名额：直接移交给队首请求，队列为空时才减少占用数"""
+        while self._queue:
+            _, _, start, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # 排队中被取消
+            self._vtime = start
+            future.set_result(None)
+            return
+        self._active -= 1
+
+    def snapshot(self) -> dict[str, Any]:
+        queued: dict[str, int] = {}
+        for _, _, _, flow, future in self._queue:
+            if not future.done():
+                queued[flow.priority] = queued.get(flow.priority, 0) + 1
+
+        # Jain 公平指数：各租户（按权重归一化的）获得名额数越接近，越接近 1
+        shares = [count / self.weight(flow) for flow, count in self.granted.items()]
+        fairness = None
+        if shares:
+            fairness = round(sum(shares) ** 2 / (len(shares) * sum(x * x for x in shares)), 4)
+
+        return {
+            "max_concurrent": self.settings.max_concurrent,
+            "active": self._active,
+            "queued": queued,
+            "fairness_index": fairness,
+            "wait_seconds": {
+                priority: {
+                    "p50": self.waits.percentile(priority, 50),
+                    "p95": self.waits.percentile(priority, 95),
+                    "samples": self.waits.count(priority),
+                }
+                for priority in self.waits.keys()
+            },
+            "granted": {f"{flow.priority}/{flow.tenant}": count for flow, count in self.granted.items()},
+        }
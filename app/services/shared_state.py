@@ -0,0 +1,148 @@
+"""跨进程共享状态
+
+多 worker 部署时，各进程通过同一个 SQLite 文件（WAL 模式）共享：
+- 带过期时间的键值（熔断器的冷却状态，见 circuit_breaker）
+- 计数器（各 API Key 的 rpm 窗口，见 rate_limit）
+- 租约（cookie 轮换的 leader 选举，见 cookie_store；各 API Key 的并发流名额，见 rate_limit）
+单进程时使用内存数据库，接口不变。
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+from threading import Lock
+from typing import Any
+
+MEMORY = ":memory:"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires REAL
+)
+"""
+
+
+def worker_id() -> str:
+    """当前进程的唯一标识，作为租约持有者"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SharedState:
+    def __init__(self, path: str = MEMORY, purge_every: int = 1000) -> None:
+        self.path = path or MEMORY
+        self._conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._lock = Lock()
+        self._writes = 0
+        self._purge_every = purge_every
+        if self.shared:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+
+    @property
+    def shared(self) -> bool:
+        """是否跨进程共享（文件数据库）"""
+        return self.path != MEMORY
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._after_write()
+
+    def _after_write(self) -> None:
+        # 定期清理过期条目，避免文件无限增长
+        self._writes += 1
+        if self._writes % self._purge_every == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        expires = time.time() + ttl if ttl is not None else None
+        self._write(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires),
+        )
+
+    def delete(self, key: str) -> None:
+        self._write("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: float = 1, ttl: float | None = None) -> float:
+        """原子递增计数器并返回新值；ttl 仅在计数器新建（或已过期）时生效"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                    (key, now),
+                ).fetchone()
+                if row:
+                    value, expires = json.loads(row[0]) + amount, row[1]
+                else:
+                    value, expires = amount, (now + ttl if ttl is not None else None)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._after_write()
+        return value
+
+    def try_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """获取或续期租约；租约被其他持有者占用且未过期时返回 False"""
+        key = f"lock:{name}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM kv WHERE key = ? AND expires > ?", (key, now)
+                ).fetchone()
+                acquired = row is None or json.loads(row[0]) == owner
+                if acquired:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(owner), now + ttl),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return acquired
+
+    def unlock(self, name: str, owner: str) -> None:
+        """释放自己持有的租约"""
+        self._write("DELETE FROM kv WHERE key = ? AND value = ?", (f"lock:{name}", json.dumps(owner)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_state = SharedState()
+
+
+def configure(path: str) -> SharedState:
+    """切换共享状态后端；path 为空时使用进程内存"""
+    global _state
+    if (path or MEMORY) != _state.path:
+        previous, _state = _state, SharedState(path)
+        previous.close()
+    return _state
+
+
+def get_state() -> SharedState:
+    return _state
@@ -0,0 +1,53 @@
+"""基于观测延迟的自适应超时
+
+每个模型的超时 = 滚动窗口内第 p 分位耗时 × factor，并限制在配置的
+[min, max] 区间内；样本不足时使用 initial（默认为上限），避免在
+还不了解模型延迟时误杀正常的慢请求。
+图片生成、文件对话等非对话调用以 "操作:模型" 为 key 单独统计，默认使用该操作的超时区间。
+"""
+from app.config.settings import TimeoutBounds, TimeoutSettings
+from app.services.latency import LatencyTracker
+
+
+def latency_key(model: str, operation: str = "chat") -> str:
+    """延迟统计和超时的 key：对话调用为模型名，其他操作加操作名前缀（如 images:gemini-3.0-flash）"""
+    return model if operation == "chat" else f"{operation}:{model}"
+
+
+class AdaptiveTimeouts:
+    def __init__(self, settings: TimeoutSettings | None = None, latency: LatencyTracker | None = None) -> None:
+        self.settings = settings or TimeoutSettings()
+        self.latency = latency or LatencyTracker()
+
+    def bounds(self, model: str) -> TimeoutBounds:
+        if model in self.settings.models:
+            return self.settings.models[model]
+        operation, sep, _ = model.partition(":")
+        if sep and operation in self.settings.operations:
+            return self.settings.operations[operation]
+        return self.settings.default
+
+    def timeout_for(self, model: str) -> float:
+        """返回模型当前的超时时间（秒）"""
+        bounds = self.bounds(model)
+        observed = self.latency.percentile(model, self.settings.percentile, self.settings.min_samples)
+        if observed is None:
+            value = bounds.initial if bounds.initial is not None else bounds.max
+        else:
+            value = observed * self.settings.factor
+        return min(bounds.max, max(bounds.min, value))
+
+    def snapshot(self) -> dict[str, dict]:
+        models = set(self.settings.models) | set(self.latency.keys())
+        result = {}
+        for model in sorted(models):
+            bounds = self.bounds(model)
+            observed = self.latency.percentile(model, self.settings.percentile, self.settings.min_samples)
+            result[model] = {
+                "timeout": round(self.timeout_for(model), 3),
+                "samples": self.latency.count(model),
+                f"p{self.settings.percentile:g}": round(observed, 3) if observed is not None else None,
+                "min": bounds.min,
+                "max": bounds.max,
+            }
+        return result
@@ -0,0 +1,122 @@
+"""本地 token 计数
+
+用于 /v1/messages/count_tokens、响应中的 usage 和用量统计：
+- 安装了 tiktoken 时使用 cl100k_base 编码（进程内只加载一次），否则用启发式估算：
+  CJK 字符每字 1 token，其余按单词/标点切分，长单词每 4 个字符 1 token
+- 按消息缓存计数：重复的 system prompt 和相同的历史消息前缀不会重复分词
+编码在启动时于线程中预加载（warm），首个请求不必在事件循环上等待加载编码文件。
+"""
+import json
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Iterable
+
+# 每条消息的格式开销（角色、分隔符）和回复前缀，参照 OpenAI 的计数方式
+MESSAGE_OVERHEAD = 3
+REPLY_OVERHEAD = 3
+
+_PIECE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+def _heuristic_count(text: str) -> int:
+    count = 0
+    for piece in _PIECE.findall(text):
+        count += (len(piece) + 3) // 4 if piece[0].isascii() and piece[0].isalnum() else 1
+    return count
+
+
+def _load_encoder() -> tuple[str, Callable[[str], int]]:
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # 未安装 tiktoken 或编码文件不可用（离线环境）
+        return "heuristic", _heuristic_count
+    return "cl100k_base", lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class Tokenizer:
+    def __init__(self, encoder: Callable[[str], int] | None = None, cache_size: int = 4096, min_cached: int = 256) -> None:
+        self._encoder = encoder
+        self.name = "custom" if encoder else None
+        self._cache: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._cache_size = cache_size
+        self._min_cached = min_cached  # 短文本直接计数，不占缓存
+        self._lock = Lock()
+        self._load_lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self) -> str:
+        """加载编码（阻塞，应在线程中调用），返回编码名"""
+        with self._load_lock:
+            if self._encoder is None:
+                self.name, self._encoder = _load_encoder()
+        return self.name
+
+    def _encode(self, text: str) -> int:
+        if self._encoder is None:
+            self.warm()
+        return self._encoder(text)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if len(text) < self._min_cached:
+            return self._encode(text)
+        # 以 (hash, 长度) 为键，不持有大段文本本身
+        key = (hash(text), len(text))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        tokens = self._encode(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = tokens
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: Iterable[dict], system: str | None = None) -> int:
+        """OpenAI 风格消息列表的输入 token 数"""
+        total = REPLY_OVERHEAD
+        if system:
+            total += MESSAGE_OVERHEAD + self.count(system)
+        for message in messages:
+            total += MESSAGE_OVERHEAD + self.count(content_text(message.get("content")))
+        return total
+
+
+def content_text(content: Any) -> str:
+    """提取消息内容中参与计数的文本（字符串或 content block 列表）"""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(content_text(block) for block in content)
+    if isinstance(content, dict):
+        kind = content.get("type")
+        if kind == "text":
+            return content.get("text", "")
+        if kind == "tool_use":
+            return f"{content.get('name', '')} {json.dumps(content.get('input') or {}, ensure_ascii=False)}"
+        if kind == "tool_result":
+            return content_text(content.get("content"))
+        return ""
+    return str(content)
+
+
+default = Tokenizer()
+
+
+def count(text: str) -> int:
+    return default.count(text)
+
+
+def count_messages(messages: Iterable[dict], system: str | None = None) -> int:
+    return default.count_messages(messages, system)
@@ -0,0 +1,129 @@
+"""请求追踪
+
+每个请求一个 request ID（沿用客户端传入的 X-Request-ID，否则生成），
+各处理阶段（解析、消息转换、排队、客户端初始化、上游调用、图片下载等）
+记为 span，响应时：
+- 以 Server-Timing 头返回各阶段耗时（同名 span 累加）
+- 可选按采样率写入本地 JSONL 文件，写入在后台批量进行
+"""
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from app.config.settings import TracingSettings
+from app.services import request_context
+from app.services.logger import logger
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def request_id(incoming: str | None) -> str:
+    """沿用合法的客户端 request ID，否则生成新的"""
+    if incoming and _REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def span(name: str):
+    """记录一个阶段的耗时；不在请求中时不做任何事"""
+    ctx = request_context.current()
+    if ctx is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        ctx.spans.append((name, start - ctx.started, time.monotonic() - start))
+
+
+def server_timing(ctx: request_context.RequestContext, total: float) -> str:
+    durations: dict[str, float] = {}
+    for name, _, duration in ctx.spans:
+        durations[name] = durations.get(name, 0.0) + duration
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TraceWriter:
+    def __init__(self, settings: TracingSettings | None = None) -> None:
+        self.settings = settings or TracingSettings()
+        self._pending: list[str] = []
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.file)
+
+    def write(self, ctx: request_context.RequestContext, method: str, path: str, status: int, total: float) -> None:
+        """按采样率缓冲一条追踪记录；出错和慢请求总是记录"""
+        if not self.enabled:
+            return
+        keep = (
+            status >= 500
+            or total >= self.settings.slow_threshold
+            or random.random() < self.settings.sample_rate
+        )
+        if not keep:
+            return
+        record: dict[str, Any] = {
+            "ts": time.time(),
+            "request_id": ctx.request_id,
+            "method": method,
+            "path": path,
+            "status": status,
+            "api_key": ctx.api_key,
+            "model": ctx.model,
+            "provider": ctx.provider,
+            "retries": ctx.retries,
+            "total_ms": round(total * 1000, 2),
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                for name, start, duration in ctx.spans
+            ],
+        }
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if len(self._pending) < self.settings.max_pending:
+                self._pending.append(line)
+
+    def _append(self, lines: list[str]) -> None:
+        path = Path(self.settings.file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self) -> int:
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return 0
+        try:
+            await asyncio.to_thread(self._append, lines)
+        except Exception as e:
+            logger.warning(f"Trace flush failed, {len(lines)} traces dropped: {e}")
+            return 0
+        return len(lines)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.flush_interval)
+            await self.flush()
+
+
+writer = TraceWriter()
+
+
+def configure(settings: TracingSettings) -> TraceWriter:
+    global writer
+    writer = TraceWriter(settings)
+    return writer
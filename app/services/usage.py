@@ -0,0 +1,223 @@
+"""按 API Key 的用量统计
+
+路由在请求上下文中记下模型、provider 和输入/输出大小，请求日志中间件
+在响应结束时生成一条 UsageRecord 交给 recorder：
+- 记录先进入内存缓冲并累加到内存汇总，请求路径上不做磁盘写入
+- 后台任务按 flush_interval 或缓冲达到 max_batch 时批量写入 SQLite
+- 管理接口按时间桶汇总查询
+"""
+import asyncio
+import sqlite3
+import time
+from collections import deque
+from dataclasses import astuple, dataclass, fields
+from threading import Lock
+from typing import Any
+
+from app.config.settings import UsageSettings
+from app.services import request_context
+from app.services.logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    ts REAL NOT NULL,
+    api_key TEXT,
+    model TEXT,
+    provider TEXT,
+    input_chars INTEGER,
+    output_chars INTEGER,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    latency REAL,
+    status INTEGER
+);
+CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts);
+"""
+
+GROUP_COLUMNS = {"api_key", "model", "provider"}
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(slots=True)
+class UsageRecord:
+    ts: float
+    api_key: str | None
+    model: str | None
+    provider: str | None
+    input_chars: int = 0
+    output_chars: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0
+    status: int = 200
+
+
+_COLUMNS = ", ".join(f.name for f in fields(UsageRecord))
+_INSERT = f"INSERT INTO usage ({_COLUMNS}) VALUES ({', '.join('?' * len(fields(UsageRecord)))})"
+
+
+def estimate_tokens(chars: int) -> int:
+    """按字符数粗略估算 token 数"""
+    return (chars + 3) // 4
+
+
+def track_request(model: str, input_chars: int, input_tokens: int | None = None) -> None:
+    """路由调用上游前记下模型和输入大小"""
+    ctx = request_context.current()
+    if ctx is not None:
+        ctx.model = model
+        ctx.input_chars = input_chars
+        ctx.input_tokens = input_tokens
+
+
+def track_response(provider: str, output_chars: int, output_tokens: int | None = None) -> None:
+    """上游返回后记下实际服务的 provider 和输出大小"""
+    ctx = request_context.current()
+    if ctx is not None:
+        ctx.provider = provider
+        ctx.output_chars = output_chars
+        ctx.output_tokens = output_tokens
+
+
+class UsageRecorder:
+    def __init__(self, settings: UsageSettings | None = None) -> None:
+        self.settings = settings or UsageSettings()
+        # 持久化跟不上时丢弃最旧的记录，内存汇总仍然准确
+        self._pending: deque[UsageRecord] = deque(maxlen=self.settings.max_pending)
+        self._lock = Lock()
+        self._db_lock = Lock()
+        self._conn = self._connect(self.settings.path)
+        self._flush_requested: asyncio.Event | None = None
+        # 进程启动以来的内存汇总，按 (api_key, model)
+        self.totals: dict[tuple[str | None, str | None], dict[str, float]] = {}
+        self.dropped = 0
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path or ":memory:", timeout=5.0, check_same_thread=False)
+        if path:
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def record_request(self, latency: float, status: int) -> None:
+        """根据当前请求上下文生成记录；未调用模型的请求不记录"""
+        ctx = request_context.current()
+        if ctx is None or ctx.model is None or not self.settings.enabled:
+            return
+        self.record(UsageRecord(
+            ts=time.time(),
+            api_key=ctx.api_key,
+            model=ctx.model,
+            provider=ctx.provider,
+            input_chars=ctx.input_chars,
+            output_chars=ctx.output_chars,
+            input_tokens=ctx.input_tokens if ctx.input_tokens is not None else estimate_tokens(ctx.input_chars),
+            output_tokens=ctx.output_tokens if ctx.output_tokens is not None else estimate_tokens(ctx.output_chars),
+            latency=latency,
+            status=status,
+        ))
+
+    def record(self, record: UsageRecord) -> None:
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(record)
+            total = self.totals.setdefault((record.api_key, record.model), {
+                "requests": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0, "latency": 0.0,
+            })
+            total["requests"] += 1
+            total["errors"] += record.status >= 400
+            total["input_tokens"] += record.input_tokens
+            total["output_tokens"] += record.output_tokens
+            total["latency"] += record.latency
+            full = len(self._pending) >= self.settings.max_batch
+        if full and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _write(self, batch: list[UsageRecord]) -> None:
+        with self._db_lock:
+            with self._conn:
+                self._conn.executemany(_INSERT, [astuple(r) for r in batch])
+
+    async def flush(self) -> int:
+        """把缓冲的记录批量写入 SQLite（在线程中执行），返回写入条数"""
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+        if not batch:
+            return 0
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.warning(f"Usage flush failed, {len(batch)} records requeued: {e}")
+            with self._lock:
+                requeued = [*batch, *self._pending]
+                self.dropped += max(0, len(requeued) - self.settings.max_pending)
+                self._pending = deque(requeued, maxlen=self.settings.max_pending)
+            return 0
+        return len(batch)
+
+    async def run(self) -> None:
+        """后台定期（或缓冲满时）批量写入"""
+        self._flush_requested = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), self.settings.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                await self.flush()
+        finally:
+            self._flush_requested = None
+
+    def _query(self, since: float, until: float, bucket: int, group_by: str) -> list[dict[str, Any]]:
+        sql = f"""
+            SELECT CAST(ts / ? AS INTEGER) * ? AS bucket, {group_by} AS grp,
+                   COUNT(*), SUM(status >= 400), SUM(input_tokens), SUM(output_tokens),
+                   AVG(latency)
+            FROM usage WHERE ts >= ? AND ts < ?
+            GROUP BY bucket, grp ORDER BY bucket, grp
+        """
+        with self._db_lock:
+            rows = self._conn.execute(sql, (bucket, bucket, since, until)).fetchall()
+        return [
+            {
+                "bucket": row[0],
+                group_by: row[1],
+                "requests": row[2],
+                "errors": row[3],
+                "input_tokens": row[4],
+                "output_tokens": row[5],
+                "avg_latency": round(row[6], 4),
+            }
+            for row in rows
+        ]
+
+    async def rollup(self, since: float, until: float, bucket: str = "hour", group_by: str = "api_key") -> list[dict]:
+        """按时间桶和维度汇总；查询前先写入缓冲中的记录"""
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {sorted(BUCKETS)}")
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {sorted(GROUP_COLUMNS)}")
+        await self.flush()
+        return await asyncio.to_thread(self._query, since, until, BUCKETS[bucket], group_by)
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+
+
+recorder = UsageRecorder()
+
+
+def configure(settings: UsageSettings) -> UsageRecorder:
+    global recorder
+    recorder.close()
+    recorder = UsageRecorder(settings)
+    return recorder
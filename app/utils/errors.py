@@ -1,4 +1,5 @@
 """错误处理和分类模块"""
+import re
 from typing import Any
 from fastapi import HTTPException
 
@@ -31,8 +32,9 @@ class AuthenticationError(AIGatewayError):
 
 class RateLimitError(AIGatewayError):
     """限流错误"""
-    def __init__(self, message: str = "Rate limit exceeded"):
-        super().__init__(message, "rate_limit_exceeded", 429)
+    def __init__(self, message: str = "Rate limit exceeded", retry_after: float | None = None):
+        details = {"retry_after": retry_after} if retry_after is not None else None
+        super().__init__(message, "rate_limit_exceeded", 429, details)
 
 
 class ModelNotFoundError(AIGatewayError):
@@ -65,12 +67,32 @@ class InvalidRequestError(AIGatewayError):
 
 def http_exception_from_error(error: AIGatewayError) -> HTTPException:
     """将自定义错误转换为 FastAPI HTTPException"""
+    headers = None
+    retry_after = error.details.get("retry_after")
+    if retry_after is not None:
+        headers = {"Retry-After": str(max(1, round(retry_after)))}
     return HTTPException(
         status_code=error.status_code,
-        detail=error.to_dict()
+        detail=error.to_dict(),
+        headers=headers
     )
 
 
+# 上游错误信息中的重试提示，如 "retry after 30" / "retry in 2.5s"
+_RETRY_HINT = re.compile(r"retry[\s_-]*(?:after|in)[:\s]*(\d+(?:\.\d+)?)\s*(ms|s)?", re.IGNORECASE)
+
+
+def parse_retry_after(message: str) -> float | None:
+    """从错误信息中提取重试等待时间（秒）"""
+    match = _RETRY_HINT.search(message)
+    if not match:
+        return None
+    value = float(match.group(1))
+    if (match.group(2) or "").lower() == "ms":
+        value /= 1000
+    return value
+
+
 def classify_exception(exc: Exception, provider: str = "unknown") -> AIGatewayError:
     """分类异常为具体的错误类型"""
     error_msg = str(exc).lower()
@@ -81,7 +103,7 @@ def classify_exception(exc: Exception, provider: str = "unknown") -> AIGatewayEr
     
     # 限流相关
     if any(k in error_msg for k in ["rate limit", "too many", "429"]):
-        return RateLimitError(str(exc))
+        return RateLimitError(str(exc), retry_after=parse_retry_after(error_msg))
     
     # 超时/连接错误
     if any(k in error_msg for k in ["timeout", "connection", "refused"]):
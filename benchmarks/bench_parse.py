@@ -0,0 +1,82 @@
+"""对话请求解析与响应序列化基准
+
+对比两条路径处理同一请求体的耗时：
+- pydantic: FastAPI 原来的做法——json 解析 + ChatCompletionRequest 完整校验，
+  响应经 jsonable_encoder + 标准库 json 序列化
+- fast: codec.parse_openai（orjson，未安装时为标准库 json）+ 直接序列化为 bytes
+请求体为带 base64 图片的 vision 请求，图片大小和历史轮数可调。
+
+用法:
+    python -m benchmarks.bench_parse [--image-kb 4096] [--turns 20] [--runs 50]
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.routes.openai import ChatCompletionRequest, _create_openai_response
+from app.services import codec
+
+
+def make_body(image_kb: int, turns: int = 20) -> bytes:
+    image = base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        messages.append({"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " * 50})
+    messages.append({"role": "user", "content": [
+        {"type": "text", "text": "What is in this picture?"},
+        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+    ]})
+    return json.dumps({"model": "gemini-3.0-flash", "messages": messages}).encode()
+
+
+def pydantic_path(body: bytes) -> bytes:
+    payload = ChatCompletionRequest.model_validate(json.loads(body))
+    return json.dumps(jsonable_encoder(_create_openai_response("ok " * 200, payload.model))).encode()
+
+
+def fast_path(body: bytes) -> bytes:
+    request = codec.parse_openai(body)
+    return codec.dumps(_create_openai_response("ok " * 200, request.model))
+
+
+def _time(fn, body: bytes, runs: int) -> list[float]:
+    fn(body)  # 预热
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(body)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure(image_kb: int = 4096, turns: int = 20, runs: int = 50) -> dict[str, dict[str, float]]:
+    body = make_body(image_kb, turns)
+    results = {}
+    for name, fn in (("pydantic", pydantic_path), ("fast", fast_path)):
+        samples = _time(fn, body, runs)
+        results[name] = {
+            "median_ms": round(statistics.median(samples) * 1000, 3),
+            "min_ms": round(min(samples) * 1000, 3),
+        }
+    results["speedup"] = round(results["pydantic"]["median_ms"] / results["fast"]["median_ms"], 2)
+    results["body_kb"] = len(body) // 1024
+    results["json_backend"] = "orjson" if codec.orjson is not None else "json"
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare chat request parsing paths")
+    parser.add_argument("--image-kb", type=int, default=4096)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(measure(args.image_kb, args.turns, args.runs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
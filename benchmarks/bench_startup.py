@@ -0,0 +1,64 @@
+"""启动耗时基准
+
+测量两项指标，每项在独立子进程中运行以保证冷启动：
+- import: `import app.main` 的耗时
+- first_request: 从创建应用、执行 lifespan 到第一个请求返回的耗时
+
+用法:
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start)
+"""
+
+FIRST_REQUEST_SNIPPET = """
+import time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import create_app
+with TestClient(create_app()) as client:
+    client.get("/health")
+print(time.perf_counter() - start)
+"""
+
+
+def _run(snippet: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", snippet],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int = 5) -> dict[str, dict[str, float]]:
+    results = {}
+    for name, snippet in (("import", IMPORT_SNIPPET), ("first_request", FIRST_REQUEST_SNIPPET)):
+        samples = [_run(snippet) for _ in range(runs)]
+        results[name] = {
+            "median_ms": round(statistics.median(samples) * 1000, 2),
+            "min_ms": round(min(samples) * 1000, 2),
+            "max_ms": round(max(samples) * 1000, 2),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure gateway import and first-request time")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(measure(args.runs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
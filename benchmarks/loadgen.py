@@ -0,0 +1,376 @@
+"""端到端压测：对运行中的网关发起并发请求
+
+按 --mix 比例混合 /v1/chat/completions、/v1/messages、/v1/images 请求，
+以固定并发持续 --duration 秒（或共 --requests 个请求），按接口报告
+吞吐、延迟 p50/p90/p99、首字节时间（TTFB）和错误分布。
+
+--spawn 时在本机以 stub 假上游启动网关（见配置 stub 段），整个压测不访问外网，
+并按固定间隔采样网关进程（含 worker 子进程）的 RSS，报告峰值内存。
+--replay 时改为回放录制的上游交互（见配置 cassette 段），未指定 --mix 时
+按录制文件中对话和生图请求的比例混合。
+
+用法:
+    python -m benchmarks.loadgen --spawn --concurrency 64 --duration 30
+    python -m benchmarks.loadgen --spawn --workers 4 --stub-ttft-ms 50 --stub-error-rate 0.05
+    python -m benchmarks.loadgen --spawn --replay data/cassette.jsonl --time-scale 0.5
+    python -m benchmarks.loadgen --url http://127.0.0.1:8022 --key sk-xxx --mix chat=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+DEFAULT_KEY = "loadgen-key"
+GEMINI_MODEL = "gemini-3.0-flash"
+
+
+def chat_request(stream: bool = False) -> tuple[str, dict]:
+    return "/v1/chat/completions", {
+        "model": GEMINI_MODEL,
+        "stream": stream,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "Summarize the benefits of load testing in three sentences."},
+        ],
+    }
+
+
+def messages_request() -> tuple[str, dict]:
+    return "/v1/messages", {
+        "model": GEMINI_MODEL,
+        "max_tokens": 512,
+        "messages": [{"role": "user", "content": "Explain tail latency briefly."}],
+    }
+
+
+def images_request() -> tuple[str, dict]:
+    return "/v1/images", {"model": GEMINI_MODEL, "prompt": "a lighthouse at dusk", "n": 1}
+
+
+SCENARIOS = {
+    "chat": chat_request,
+    "stream": lambda: chat_request(stream=True),
+    "messages": messages_request,
+    "images": images_request,
+}
+
+
+@dataclass
+class Stats:
+    latencies: list[float] = field(default_factory=list)
+    ttfb: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    bytes: int = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies) + sum(self.errors.values())
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def parse_mix(text: str) -> list[tuple[str, float]]:
+    """"chat=6,messages=3,images=1" -> [(名称, 权重)]"""
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def schedule(mix: list[tuple[str, float]], size: int = 100) -> list[str]:
+    """按权重展开为循环使用的场景序列（平滑加权轮询，同一场景不会集中出现）"""
+    total = sum(w for _, w in mix)
+    current = {name: 0.0 for name, _ in mix}
+    sequence = []
+    for _ in range(size):
+        for name, weight in mix:
+            current[name] += weight
+        chosen = max(current, key=current.get)
+        current[chosen] -= total
+        sequence.append(chosen)
+    return sequence
+
+
+def mix_from_cassette(path: str) -> list[tuple[str, float]]:
+    """按录制文件中各方法的调用次数确定场景比例"""
+    from app.services import cassette
+    methods = Counter(entry.get("method") for entry in cassette.load(path))
+    mix = [("chat", float(methods["chat"] + methods["chat_files"])), ("images", float(methods["images"]))]
+    mix = [(name, weight) for name, weight in mix if weight]
+    if not mix:
+        raise ValueError(f"no replayable interactions in {path}")
+    return mix
+
+
+async def _one(client: httpx.AsyncClient, name: str, stats: dict[str, Stats]) -> None:
+    path, body = SCENARIOS[name]()
+    entry = stats.setdefault(name, Stats())
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", path, json=body) as response:
+            first = None
+            size = 0
+            async for chunk in response.aiter_raw():
+                if first is None:
+                    first = time.perf_counter() - start
+                size += len(chunk)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            entry.errors[str(response.status_code)] += 1
+            return
+        entry.latencies.append(elapsed)
+        entry.ttfb.append(first if first is not None else elapsed)
+        entry.bytes += size
+    except httpx.HTTPError as e:
+        entry.errors[type(e).__name__] += 1
+
+
+async def run_load(
+    url: str,
+    key: str,
+    mix: list[tuple[str, float]],
+    concurrency: int,
+    duration: float | None,
+    requests: int | None,
+    timeout: float = 300.0,
+) -> tuple[dict[str, Stats], float]:
+    """固定并发发起请求，返回 (各场景统计, 实际耗时)"""
+    sequence = schedule(mix)
+    stats: dict[str, Stats] = {}
+    counter = iter(range(requests if requests else sys.maxsize))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=url, headers={"Authorization": f"Bearer {key}"}, limits=limits, timeout=timeout,
+    ) as client:
+        start = time.perf_counter()
+        deadline = start + duration if duration else float("inf")
+
+        async def worker() -> None:
+            for i in counter:
+                if time.perf_counter() >= deadline:
+                    return
+                await _one(client, sequence[i % len(sequence)], stats)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return stats, time.perf_counter() - start
+
+
+def report(stats: dict[str, Stats], elapsed: float) -> dict:
+    result = {"elapsed_s": round(elapsed, 2), "scenarios": {}}
+    for name, entry in sorted(stats.items()):
+        result["scenarios"][name] = {
+            "requests": entry.count,
+            "ok": len(entry.latencies),
+            "rps": round(entry.count / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(entry.latencies, 50) * 1000, 1),
+            "p90_ms": round(percentile(entry.latencies, 90) * 1000, 1),
+            "p99_ms": round(percentile(entry.latencies, 99) * 1000, 1),
+            "ttfb_p50_ms": round(percentile(entry.ttfb, 50) * 1000, 1),
+            "ttfb_p99_ms": round(percentile(entry.ttfb, 99) * 1000, 1),
+            "mean_kb": round(entry.bytes / len(entry.latencies) / 1024, 1) if entry.latencies else 0.0,
+            "errors": dict(entry.errors),
+        }
+    total = sum(s.count for s in stats.values())
+    result["total"] = {
+        "requests": total,
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(sum(sum(s.errors.values()) for s in stats.values()) / total, 4) if total else 0.0,
+    }
+    return result
+
+
+def format_report(result: dict) -> str:
+    lines = [
+        f"{'scenario':<10} {'reqs':>7} {'rps':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+        f"{'ttfb p50':>9} {'ttfb p99':>9}  errors",
+    ]
+    for name, s in result["scenarios"].items():
+        errors = ", ".join(f"{k}: {v}" for k, v in s["errors"].items()) or "-"
+        lines.append(
+            f"{name:<10} {s['requests']:>7} {s['rps']:>8.1f} {s['p50_ms']:>9.1f} {s['p90_ms']:>9.1f} "
+            f"{s['p99_ms']:>9.1f} {s['ttfb_p50_ms']:>9.1f} {s['ttfb_p99_ms']:>9.1f}  {errors}"
+        )
+    total = result["total"]
+    lines.append(f"total: {total['requests']} requests in {result['elapsed_s']}s, "
+                 f"{total['rps']} rps, error rate {total['error_rate']:.2%}")
+    if "rss_mb" in result:
+        lines.append(f"gateway RSS: start {result['rss_mb']['start']} MB, peak {result['rss_mb']['peak']} MB, "
+                     f"end {result['rss_mb']['end']} MB")
+    return "\n".join(lines)
+
+
+# ---- --spawn：本机启动带 stub 上游的网关 ----
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    try:
+        for task in Path(f"/proc/{pid}/task").iterdir():
+            children = (task / "children").read_text().split()
+            for child in children:
+                pids.extend(_process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def rss_bytes(pid: int) -> int:
+    """进程及其子进程（uvicorn worker）的 RSS 之和；非 Linux 返回 0"""
+    total = 0
+    for p in _process_tree(pid):
+        try:
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except OSError:
+            continue
+    return total
+
+
+def stub_config(args: argparse.Namespace, port: int) -> dict:
+    return {
+        "server": {"host": "127.0.0.1", "port": port, "workers": args.workers},
+        "auth": {"api_key": args.key},
+        "logging": {"level": "WARNING", "file": None, "sample_rate": 0.0},
+        "gemini": {"enabled": True, "cookie_path": "", "models": [GEMINI_MODEL]},
+        "g4f": {"enabled": True},
+        "usage": {"enabled": True, "path": ""},
+        "tracing": {"server_timing": True, "file": ""},
+        "cassette": {
+            "replay": str(Path(args.replay).resolve()) if args.replay else None,
+            "time_scale": args.time_scale,
+        },
+        "stub": {
+            "enabled": not args.replay,
+            "ttft_ms": args.stub_ttft_ms,
+            "tokens_per_second": args.stub_tps,
+            "output_tokens": args.stub_tokens,
+            "error_rate": args.stub_error_rate,
+            "image_kb": args.stub_image_kb,
+            "seed": 0,
+        },
+    }
+
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"gateway exited with code {process.returncode}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("gateway did not become ready in time")
+
+
+async def _sample_rss(pid: int, samples: list[int], interval: float = 0.5) -> None:
+    while True:
+        samples.append(rss_bytes(pid))
+        await asyncio.sleep(interval)
+
+
+async def spawn_and_run(args: argparse.Namespace, mix: list[tuple[str, float]]) -> dict:
+    with tempfile.TemporaryDirectory(prefix="loadgen-") as workdir:
+        port = _free_port()
+        config = Path(workdir) / "config.yaml"
+        # JSON 是合法的 YAML，无需额外依赖
+        config.write_text(json.dumps(stub_config(args, port)), encoding="utf-8")
+        env = {**os.environ, "CONFIG_PATH": str(config)}
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app.server", "--workers", str(args.workers)],
+            env=env, cwd=Path(__file__).resolve().parent.parent,
+            stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{port}"
+        samples: list[int] = []
+        try:
+            await _wait_ready(url, process)
+            sampler = asyncio.create_task(_sample_rss(process.pid, samples))
+            try:
+                stats, elapsed = await run_load(url, args.key, mix, args.concurrency, args.duration, args.requests)
+            finally:
+                sampler.cancel()
+            samples.append(rss_bytes(process.pid))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    result = report(stats, elapsed)
+    if any(samples):
+        mb = [round(s / 1024 / 1024, 1) for s in samples]
+        result["rss_mb"] = {"start": mb[0], "peak": max(mb), "end": mb[-1]}
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end load test for the gateway")
+    parser.add_argument("--url", default="http://127.0.0.1:8022", help="gateway base URL (ignored with --spawn)")
+    parser.add_argument("--key", default=os.getenv("API_KEY", DEFAULT_KEY))
+    parser.add_argument("--mix", default=None,
+                        help=f"weighted scenarios (default chat=6,messages=3,images=1), choose from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=None, help="total number of requests")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--spawn", action="store_true", help="start a local gateway backed by the stub upstream")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--stub-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--stub-tps", type=float, default=50.0)
+    parser.add_argument("--stub-tokens", type=int, default=200)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-image-kb", type=int, default=512)
+    parser.add_argument("--replay", default=None, help="with --spawn: replay this cassette instead of the stub")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="replay latency multiplier")
+    parser.add_argument("--verbose", action="store_true", help="show gateway stderr with --spawn")
+    args = parser.parse_args()
+
+    if args.mix:
+        mix = parse_mix(args.mix)
+    elif args.replay:
+        mix = mix_from_cassette(args.replay)
+    else:
+        mix = parse_mix("chat=6,messages=3,images=1")
+    duration = None if args.requests else args.duration
+    if args.spawn:
+        args.duration = duration
+        result = asyncio.run(spawn_and_run(args, mix))
+    else:
+        stats, elapsed = asyncio.run(run_load(args.url, args.key, mix, args.concurrency, duration, args.requests))
+        result = report(stats, elapsed)
+    print(json.dumps(result, indent=2) if args.json else format_report(result))
+
+
+if __name__ == "__main__":
+    main()
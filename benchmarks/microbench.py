@@ -0,0 +1,278 @@
+"""请求热路径的 CPU 微基准
+
+覆盖请求路径上的纯 CPU 环节：提示词拼接、请求体解析（含 1~20MB 图片 data URI）、
+图片解码、SSE 分块、HAR 校验、异常分类、认证中间件、响应构建。
+每个用例自动确定循环次数（每批至少 --min-time 秒），重复多批取中位数，
+结果为单次操作耗时（微秒）。
+
+基线保存在 benchmarks/baselines/microbench.json；--compare 与基线对比，
+任一用例变慢超过阈值时以退出码 1 结束，可直接用于 CI。
+
+用法:
+    python -m benchmarks.microbench                   # 运行并打印结果
+    python -m benchmarks.microbench --save            # 运行并写入基线
+    python -m benchmarks.microbench --compare [--threshold 0.2]
+    python -m benchmarks.microbench --filter parse    # 只运行名称包含 parse 的用例
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+BASELINE = Path(__file__).parent / "baselines" / "microbench.json"
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[], Callable[[], Any]]  # 返回被测的零参数函数（可返回协程）
+
+
+def _vision_body(megabytes: int) -> bytes:
+    image = base64.b64encode(os.urandom(megabytes * 1024 * 1024)).decode()
+    return json.dumps({"model": "gemini-3.0-flash", "messages": [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": [
+            {"type": "text", "text": "What is in this picture?"},
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+        ]},
+    ]}).encode()
+
+
+def _history(turns: int = 50) -> list:
+    from app.services.chat import Message
+    return [Message("user" if i % 2 == 0 else "assistant", f"message {i} " * 40) for i in range(turns)]
+
+
+def setup_prompt():
+    from app.providers.gemini import GeminiProvider
+    messages = _history()
+    return lambda: GeminiProvider._messages_to_prompt(messages)
+
+
+def setup_parse_claude():
+    from app.services import codec
+    body = json.dumps({
+        "model": "gemini-3.0-flash",
+        "system": "You are a helpful assistant." * 20,
+        "messages": [m.to_dict() for m in _history()],
+    }).encode()
+    return lambda: codec.parse_claude(body)
+
+
+def setup_parse_openai(megabytes: int):
+    def setup():
+        from app.services import codec
+        body = _vision_body(megabytes)
+        return lambda: codec.parse_openai(body)
+    return setup
+
+
+def setup_image_decode(megabytes: int):
+    def setup():
+        from app.services import codec
+        body = _vision_body(megabytes)
+
+        def run():
+            # 解析 + base64 解码（上传前的完整处理）
+            [attachment] = codec.parse_openai(body).messages[-1].attachments
+            return attachment.data()
+        return run
+    return setup
+
+
+def setup_sse():
+    from app.services.stream import sse_chat_chunks
+    text = "streamed token " * 1000
+    return lambda: list(sse_chat_chunks(text, "gemini-3.0-flash"))
+
+
+def setup_har():
+    from app.services.file_manager import FileManager
+    workdir = tempfile.TemporaryDirectory(prefix="microbench-")
+    directory = workdir.name
+    manager = FileManager(directory)
+    entries = [{
+        "request": {
+            "url": f"https://chatgpt.com/backend-api/conversation/{i}",
+            "headers": [{"name": "Authorization", "value": "Bearer x"}, {"name": "Cookie", "value": "c" * 200}],
+        },
+        "response": {"content": {"text": "r" * 2000}},
+    } for i in range(4000)]
+    path = Path(directory) / "large.har"
+    path.write_text(json.dumps({"log": {"version": "1.2", "entries": entries}}), encoding="utf-8")
+
+    def run():
+        return manager.validate_har_file(path)
+    run.workdir = workdir  # 用例释放时删除临时目录
+    return run
+
+
+def setup_classify():
+    from app.utils.errors import classify_exception
+    errors = [
+        RuntimeError("429 Too Many Requests, retry after 30s"),
+        RuntimeError("401 Unauthorized: cookie expired"),
+        TimeoutError("read timed out"),
+        ValueError("something unexpected happened in the upstream response"),
+    ]
+    return lambda: [classify_exception(e, "gemini") for e in errors]
+
+
+def setup_auth():
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+    from app.auth.middleware import auth_middleware, configure_auth
+    configure_auth("bench-key")
+    scope = {
+        "type": "http", "method": "POST", "path": "/v1/chat/completions", "query_string": b"",
+        "headers": [(b"authorization", b"Bearer bench-key")],
+    }
+    response = Response()
+
+    async def call_next(request):
+        return response
+
+    return lambda: auth_middleware(Request(scope), call_next)
+
+
+def setup_openai_response():
+    from app.routes.openai import _create_openai_response
+    from app.services import codec
+    text = "generated answer " * 500
+    return lambda: codec.dumps(_create_openai_response(text, "gemini-3.0-flash", 1200))
+
+
+def setup_claude_response():
+    from app.routes.claude import _openai_to_claude_response
+    text = "generated answer " * 500
+
+    def run():
+        response = _openai_to_claude_response({"text": text}, "gemini-3.0-flash", 1200)
+        return response.__pydantic_serializer__.to_json(response)
+    return run
+
+
+CASES = [
+    Case("prompt_50_messages", setup_prompt),
+    Case("parse_claude_50_messages", setup_parse_claude),
+    *(Case(f"parse_openai_image_{mb}mb", setup_parse_openai(mb)) for mb in (1, 5, 20)),
+    *(Case(f"image_decode_{mb}mb", setup_image_decode(mb)) for mb in (1, 5, 20)),
+    Case("sse_chat_chunks_15kb", setup_sse),
+    Case("validate_har_4000_entries", setup_har),
+    Case("classify_exception_x4", setup_classify),
+    Case("auth_middleware", setup_auth),
+    Case("openai_response", setup_openai_response),
+    Case("claude_response", setup_claude_response),
+]
+
+
+def _batch(fn: Callable[[], Any], loops: int) -> float:
+    """执行 loops 次并返回总耗时；协程在同一个事件循环中依次执行"""
+    probe = fn()
+    if asyncio.iscoroutine(probe):
+        async def run() -> float:
+            await probe
+            start = time.perf_counter()
+            for _ in range(loops):
+                await fn()
+            return time.perf_counter() - start
+        return asyncio.run(run())
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - start
+
+
+def measure_case(case: Case, repeat: int = 5, min_time: float = 0.2) -> dict[str, float]:
+    fn = case.setup()
+    loops = 1
+    while True:
+        elapsed = _batch(fn, loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    samples = [_batch(fn, loops) / loops for _ in range(repeat)]
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "loops": loops,
+    }
+
+
+def run(pattern: str = "", repeat: int = 5, min_time: float = 0.2) -> dict[str, Any]:
+    # 基准期间日志只会干扰测量
+    from app.services.logger import logger
+    logger.remove()
+    results = {}
+    for case in CASES:
+        if pattern in case.name:
+            results[case.name] = measure_case(case, repeat, min_time)
+            print(f"{case.name:<32} {results[case.name]['median_us']:>14.1f} us", file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "cases": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float = 0.2) -> tuple[str, list[str]]:
+    """生成对比报告，返回 (报告文本, 超过阈值的用例)"""
+    lines = [f"{'case':<32} {'baseline us':>14} {'current us':>14} {'change':>9}"]
+    regressions = []
+    for name, result in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            lines.append(f"{name:<32} {'-':>14} {result['median_us']:>14.1f} {'new':>9}")
+            continue
+        change = result["median_us"] / base["median_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        lines.append(f"{name:<32} {base['median_us']:>14.1f} {result['median_us']:>14.1f} {change:>+8.1%}{flag}")
+    if baseline.get("machine") != current["machine"] or baseline.get("python") != current["python"]:
+        lines.append(f"note: baseline from {baseline.get('machine')} / Python {baseline.get('python')}")
+    return "\n".join(lines), regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU microbenchmarks for gateway hot paths")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per batch")
+    parser.add_argument("--save", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with the stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    args = parser.parse_args()
+
+    current = run(args.filter, args.repeat, args.min_time)
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        previous = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"cases": {}}
+        # 只覆盖本次运行的用例，便于配合 --filter 更新部分基线
+        previous.update({k: v for k, v in current.items() if k != "cases"})
+        previous["cases"] = {**previous.get("cases", {}), **current["cases"]}
+        args.baseline.write_text(json.dumps(previous, indent=2) + "\n")
+    if args.compare:
+        report, regressions = compare(current, json.loads(args.baseline.read_text()), args.threshold)
+        print(report)
+        if regressions:
+            sys.exit(1)
+    elif not args.save:
+        print(json.dumps(current, indent=2))
+
+
+if __name__ == "__main__":
+    main()
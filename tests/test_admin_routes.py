@@ -1,8 +1,11 @@
 from fastapi.testclient import TestClient
 
+from app.auth.middleware import configure_auth
 from app.config.manager import ConfigManager
+from app.config.settings import APIKeySettings
 from app.main import app
 from app.routes.admin import configure
+from app.services.logger import log_manager
 from tests.conftest import TEST_API_KEY
 
 
@@ -27,4 +30,37 @@ def test_reload_success(tmp_path):
     configure(manager)
     client = TestClient(app)
     resp = client.post("/admin/config/reload", headers={"Authorization": f"Bearer {TEST_API_KEY}"})
-    assert resp.status_code == 200
\ No newline at end of file
+    assert resp.status_code == 200
+
+
+def test_reload_applies_all_logging_changes(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text("logging:\n  level: INFO\n")
+    manager = ConfigManager(str(config_path))
+    manager.load()
+    configure(manager)
+    previous = log_manager.settings
+    try:
+        # 级别和采样率同时修改，两者都要生效
+        config_path.write_text("logging:\n  level: DEBUG\n  sample_rate: 0.5\n")
+        client = TestClient(app)
+        resp = client.post("/admin/config/reload", headers={"Authorization": f"Bearer {TEST_API_KEY}"})
+        assert resp.status_code == 200
+        assert log_manager.get_level() == "DEBUG"
+        assert log_manager.settings.sample_rate == 0.5
+    finally:
+        log_manager.configure(previous)
+
+
+def test_tenant_key_cannot_use_admin_endpoints():
+    configure_auth(TEST_API_KEY, [APIKeySettings(name="team", key="team-key")])
+    client = TestClient(app)
+    tenant = {"X-API-Key": "team-key"}
+    assert client.post("/admin/cookies", headers=tenant, json={"__Secure_1PSID": "x"}).status_code == 403
+    assert client.get("/admin/cookies/content", headers=tenant).status_code == 403
+    assert client.post("/admin/config/reload", headers=tenant).status_code == 403
+    assert client.get("/admin/keys", headers=tenant).status_code == 403
+    assert client.get("/metrics", headers=tenant).status_code == 403
+    # 租户 key 仍可调用模型接口，管理 key 仍可访问管理接口
+    assert client.get("/v1/models", headers=tenant).status_code == 200
+    assert client.get("/admin/keys", headers={"X-API-Key": TEST_API_KEY}).status_code == 200
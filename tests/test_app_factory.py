@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from app.config.settings import Settings
+from app.main import StartupTimer, _build_providers, create_app
+from tests.conftest import TEST_API_KEY
+
+
+def test_disabled_providers_not_built():
+    gemini, g4f = _build_providers(Settings())
+    assert gemini is None
+    assert g4f is None
+
+
+def test_lifespan_wires_routes(monkeypatch):
+    monkeypatch.delenv("CONFIG_PATH", raising=False)
+    monkeypatch.setenv("API_KEY", TEST_API_KEY)
+    monkeypatch.setenv("HAR_COOKIES_PATH", "/nonexistent/har_and_cookies")
+    with TestClient(create_app()) as client:
+        resp = client.get("/admin/routing", headers={"Authorization": f"Bearer {TEST_API_KEY}"})
+        assert resp.status_code == 200
+        assert resp.json()["breakers"] == {}
+
+
+def test_startup_timer_summary():
+    timer = StartupTimer()
+    with timer.phase("config"):
+        pass
+    summary = timer.summary()
+    assert summary.startswith("Startup completed in")
+    assert "config" in summary
@@ -2,6 +2,8 @@ from fastapi.testclient import TestClient
 
 from app.main import app
 from app.auth.middleware import configure_auth
+from app.config.settings import APIKeySettings
+from app.services import metrics
 from tests.conftest import TEST_API_KEY
 
 
@@ -58,4 +60,37 @@ def test_server_requires_api_key():
     
     resp = client.get("/v1/models")
     assert resp.status_code == 500
-    assert resp.json()["error"]["code"] == "server_config_error"
\ No newline at end of file
+    assert resp.json()["error"]["code"] == "server_config_error"
+
+def test_multiple_keys_with_rate_limit():
+    """多租户 key 表，超出 rpm 返回 429"""
+    configure_auth(keys=[
+        APIKeySettings(key="tenant-a", name="a", rpm=2),
+        APIKeySettings(key="tenant-b", name="b"),
+    ])
+    client = TestClient(app)
+    headers_a = {"Authorization": "Bearer tenant-a"}
+    assert client.get("/v1/models", headers=headers_a).status_code == 200
+    assert client.get("/v1/models", headers=headers_a).status_code == 200
+    resp = client.get("/v1/models", headers=headers_a)
+    assert resp.status_code == 429
+    assert resp.json()["error"]["code"] == "rate_limit_exceeded"
+    assert int(resp.headers["Retry-After"]) >= 1
+
+    # 其他租户不受影响
+    assert client.get("/v1/models", headers={"X-API-Key": "tenant-b"}).status_code == 200
+    assert client.get("/v1/models", headers={"X-API-Key": TEST_API_KEY}).status_code == 401
+
+
+def test_rejections_counted_by_error_code():
+    """认证失败和限流的响应计入 gateway_errors_total"""
+    configure_auth(TEST_API_KEY, [APIKeySettings(key="tenant-a", name="a", rpm=1)])
+    client = TestClient(app)
+    invalid = metrics.ERRORS.value("invalid_api_key")
+    limited = metrics.ERRORS.value("rate_limit_exceeded")
+
+    assert client.get("/v1/models", headers={"X-API-Key": "wrong-key"}).status_code == 401
+    assert client.get("/v1/models", headers={"X-API-Key": "tenant-a"}).status_code == 200
+    assert client.get("/v1/models", headers={"X-API-Key": "tenant-a"}).status_code == 429
+    assert metrics.ERRORS.value("invalid_api_key") == invalid + 1
+    assert metrics.ERRORS.value("rate_limit_exceeded") == limited + 1
@@ -0,0 +1,17 @@
+from app.services.budget import Budget
+
+
+def test_budget_caps_extra_load():
+    budget = Budget(ratio=0.5, max_tokens=2, initial=0)
+    assert budget.try_spend() is False
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_spend() is True
+    assert budget.try_spend() is False
+
+
+def test_budget_never_exceeds_max_tokens():
+    budget = Budget(ratio=1, max_tokens=2)
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 2
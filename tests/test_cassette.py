@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from app.config.settings import CassetteSettings, Settings, StubSettings
+from app.main import _build_providers
+from app.providers.replay import (
+    RecordingProvider,
+    ReplayG4FProvider,
+    ReplayGeminiProvider,
+    rebuild_error,
+)
+from app.providers.stub import StubG4FProvider, StubGeminiProvider
+from app.services import cassette
+from app.services.chat import Message
+from app.utils.errors import AuthenticationError, ProviderError, RateLimitError
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    previous = cassette.recorder
+    yield cassette.configure(CassetteSettings(record=str(tmp_path / "cassette.jsonl")))
+    cassette.recorder = previous
+
+
+def _stub(**overrides) -> StubSettings:
+    return StubSettings(**{"ttft_ms": 0, "ttft_sigma": 0, "tokens_per_second": 0, "seed": 1, **overrides})
+
+
+@pytest.mark.anyio
+async def test_record_is_sanitized(recorder):
+    gemini = RecordingProvider(StubGeminiProvider(_stub(output_tokens=10, image_kb=3)))
+    await gemini.chat_completions(messages=[Message("user", "secret prompt")], model="gemini-3.0-flash")
+    await gemini.generate_images(prompt="secret picture", model="gemini-3.0-flash")
+    assert gemini.cookies_changed() is False  # 其他属性转发给被包装的 provider
+    assert await recorder.flush() == 2
+
+    text = open(recorder.settings.record, encoding="utf-8").read()
+    assert "secret" not in text
+    chat, images = [json.loads(line) for line in text.splitlines()]
+    assert chat["method"] == "chat"
+    assert chat["request"] == {"messages": 1, "input_chars": 13, "attachments": 0}
+    assert chat["response"] == {"text_chars": len("the gateway routes every request to a healthy upstream model")}
+    assert images["response"]["images"] == [{"bytes": 3072}]
+
+
+@pytest.mark.anyio
+async def test_record_errors(recorder):
+    g4f = RecordingProvider(StubG4FProvider(_stub(error_rate=1.0, errors=["rate_limit"])))
+    with pytest.raises(RateLimitError):
+        await g4f.chat_completions({"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]})
+    await recorder.flush()
+    [entry] = cassette.load(recorder.settings.record)
+    assert entry["provider"] == "g4f"
+    assert entry["error"]["code"] == "rate_limit_exceeded"
+    assert entry["error"]["retry_after"] == 1.0
+
+
+@pytest.mark.anyio
+async def test_replay_round_trip(recorder):
+    recorder.settings.keep_text = True
+    gemini = RecordingProvider(StubGeminiProvider(_stub(output_tokens=3, image_kb=1)))
+    await gemini.chat_completions(messages=[Message("user", "hi")], model="gemini-3.0-flash")
+    await gemini.generate_images(prompt="cat", model="gemini-3.0-flash")
+    await recorder.flush()
+
+    replay = ReplayGeminiProvider(cassette.load(recorder.settings.record), time_scale=0)
+    assert replay.models == ["gemini-3.0-flash"]
+    result = await replay.chat_completions(messages=[], model="another-model")
+    assert result["text"] == "the gateway routes"
+    [image] = await replay.generate_images("dog")
+    assert len(image["b64_json"]) == 1368
+    # 没有 g4f 记录时回放失败
+    with pytest.raises(ProviderError):
+        await ReplayG4FProvider(cassette.load(recorder.settings.record)).chat_completions({"model": "gpt-4o"})
+
+
+@pytest.mark.anyio
+async def test_replay_cycles_and_placeholder_text():
+    interactions = [
+        {"provider": "g4f", "method": "chat", "model": "gpt-4o", "duration_ms": 1, "response": {"text_chars": 40}},
+        {"provider": "g4f", "method": "chat", "model": "gpt-4o", "duration_ms": 1,
+         "error": {"type": "AuthenticationError", "message": "cookie expired", "code": "authentication_error"}},
+    ]
+    replay = ReplayG4FProvider(interactions, time_scale=0.5)
+    result = await replay.chat_completions({"model": "gpt-4o"})
+    assert len(result["choices"][0]["message"]["content"]) == 40
+    with pytest.raises(AuthenticationError):
+        await replay.chat_completions({"model": "gpt-4o"})
+    await replay.chat_completions({"model": "gpt-4o"})
+    assert replay.replayed == 3
+
+
+def test_rebuild_error():
+    error = rebuild_error("gemini", {"message": "gemini error: boom", "code": "provider_error", "status": 503})
+    assert isinstance(error, ProviderError)
+    assert error.message == "gemini error: boom"
+    assert isinstance(rebuild_error("g4f", {"type": "TimeoutError", "message": ""}), TimeoutError)
+    assert isinstance(rebuild_error("g4f", {"type": "ValueError", "message": "bad"}), RuntimeError)
+
+
+def test_replay_replaces_providers(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    path.write_text(json.dumps({"provider": "gemini", "method": "chat", "model": "m", "duration_ms": 5}) + "\n{broken")
+    gemini, g4f = _build_providers(Settings(cassette=CassetteSettings(replay=str(path))))
+    assert isinstance(gemini, ReplayGeminiProvider)
+    assert gemini.models == ["m"]
+    assert isinstance(g4f, ReplayG4FProvider)
@@ -0,0 +1,92 @@
+import time
+
+from app.services.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker("gemini", failure_threshold=2, recovery_timeout=10, clock=FakeClock())
+    breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.allow_request() is False
+
+
+def test_half_open_probe_and_recover():
+    clock = FakeClock()
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    assert breaker.state is CircuitState.HALF_OPEN
+    # 只放行一个探测请求
+    assert breaker.allow_request() is True
+    assert breaker.allow_request() is False
+    breaker.record_success()
+    assert breaker.state is CircuitState.CLOSED
+
+
+def test_half_open_failure_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("gemini", failure_threshold=3, recovery_timeout=10, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 11
+    assert breaker.allow_request() is True
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_release_returns_probe_slot():
+    clock = FakeClock()
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    assert breaker.allow_request() is True
+    breaker.release()
+    assert breaker.allow_request() is True
+
+
+def test_registry_reuses_breakers():
+    registry = CircuitBreakerRegistry()
+    assert registry.get("gemini") is registry.get("gemini")
+    assert registry.snapshot()["gemini"]["state"] == "closed"
+
+
+def test_cooldown_shared_between_workers(tmp_path):
+    from app.services.shared_state import SharedState
+
+    path = str(tmp_path / "state.db")
+    worker_a = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30, shared=SharedState(path))
+    worker_b = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30, shared=SharedState(path))
+    worker_a.record_failure()
+    assert worker_b.allow_request() is False
+    assert worker_b.state is CircuitState.OPEN
+    assert 0 < worker_b.snapshot()["retry_in"] <= 30
+
+
+def test_shared_cooldown_read_at_most_once_per_interval(tmp_path):
+    from app.services.shared_state import SharedState
+
+    clock = FakeClock()
+    shared = SharedState(str(tmp_path / "state.db"))
+    reads = []
+    get = shared.get
+    shared.get = lambda key: reads.append(key) or get(key)
+    breaker = CircuitBreaker("gemini", recovery_timeout=30, clock=clock, shared=shared, shared_sync_interval=1.0)
+    for _ in range(10):
+        assert breaker.allow_request() is True
+    assert len(reads) == 1
+    # 其他 worker 熔断后，下一个同步周期才会看到
+    shared.set("cooldown:gemini", time.time() + 30, ttl=30)
+    assert breaker.allow_request() is True
+    clock.now = 1.0
+    assert breaker.allow_request() is False
+    assert len(reads) == 2
@@ -1,9 +1,9 @@
 import pytest
 from app.routes.claude import (
     ClaudeRequest, ClaudeMessage,
-    _claude_to_openai_messages,
     _openai_to_claude_response
 )
+from app.services.codec import parse_claude
 
 
 class TestClaudeFormatConversion:
@@ -18,7 +18,7 @@ class TestClaudeFormatConversion:
             ]
         )
         
-        result = _claude_to_openai_messages(req)
+        result = parse_claude(req.model_dump_json().encode()).dicts()
         
         assert result == [{"role": "user", "content": "Hello!"}]
     
@@ -32,7 +32,7 @@ class TestClaudeFormatConversion:
             system="You are helpful"
         )
         
-        result = _claude_to_openai_messages(req)
+        result = parse_claude(req.model_dump_json().encode()).dicts()
         
         assert result == [
             {"role": "system", "content": "You are helpful"},
@@ -50,7 +50,7 @@ class TestClaudeFormatConversion:
             ]
         )
         
-        result = _claude_to_openai_messages(req)
+        result = parse_claude(req.model_dump_json().encode()).dicts()
         
         assert result == [
             {"role": "user", "content": "Hello"},
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import codec
+from tests.conftest import TEST_API_KEY
+
+
+def body(**data):
+    return json.dumps(data).encode()
+
+
+def test_parse_openai_keeps_image_url_reference():
+    url = "data:image/png;base64," + "A" * 1000
+    request = codec.parse_openai(body(model="gemini-3.0-flash", max_tokens=100, messages=[
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": [{"type": "text", "text": "hi"}, {"type": "image_url", "image_url": {"url": url}}]},
+    ]))
+    assert request.max_tokens == 100 and request.stream is False
+    assert [m.role for m in request.messages] == ["system", "user"]
+    assert request.messages[1].text == "hi"
+    assert request.messages[1].attachments[0].url == url
+
+
+def test_parse_claude_prepends_system():
+    request = codec.parse_claude(body(model="m", system="sys", messages=[{"role": "user", "content": "hi"}]))
+    assert request.dicts() == [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}]
+
+
+@pytest.mark.parametrize("payload, loc", [
+    (body(messages=[]), ("body", "model")),
+    (body(model="m", messages=[{"role": "tool", "content": "x"}]), ("body", "messages", 0, "role")),
+    (body(model="m", messages=[], stream="yes"), ("body", "stream")),
+    (b"{not json", ("body", 0)),
+])
+def test_parse_rejects_invalid_fields(payload, loc):
+    with pytest.raises(RequestValidationError) as exc:
+        codec.parse_openai(payload)
+    assert exc.value.errors()[0]["loc"] == loc
+
+
+def test_invalid_chat_body_returns_422():
+    client = TestClient(app)
+    resp = client.post("/v1/chat/completions", headers={"Authorization": f"Bearer {TEST_API_KEY}"},
+                       json={"model": "gemini-3.0-flash", "messages": "hi"})
+    assert resp.status_code == 422
+    assert resp.json()["detail"][0]["loc"] == ["body", "messages"]
+
+
+def test_json_bytes_response_passes_bytes_through():
+    assert codec.JSONBytesResponse(b'{"a":1}').body == b'{"a":1}'
+    assert json.loads(codec.JSONBytesResponse({"text": "你好"}).body) == {"text": "你好"}
+
+
+def test_large_images_referenced_from_body_without_json_decoding():
+    import base64
+    image = bytes(range(256)) * 1024
+    url = "data:image/png;base64," + base64.b64encode(image).decode()
+    raw = body(model="m", messages=[{"role": "user", "content": [
+        {"type": "text", "text": "describe"},
+        {"type": "image_url", "image_url": {"url": url}},
+    ]}])
+    stripped, refs = codec.extract_data_urls(raw)
+    assert len(stripped) < 200 and len(refs) == 1
+    [attachment] = codec.parse_openai(raw).messages[0].attachments
+    assert isinstance(attachment.payload, memoryview)
+    assert attachment.ext == "png" and attachment.data() == image
+
+
+def test_data_url_sent_as_text_is_left_intact():
+    url = "data:image/png;base64," + "A" * (codec.MIN_REF_BYTES + 4)
+    request = codec.parse_openai(body(model="m", messages=[{"role": "user", "content": url}]))
+    assert request.messages[0].text == url
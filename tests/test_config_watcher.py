@@ -32,10 +32,10 @@ class TestConfigReloadHandler:
         new.logging = Mock()
         new.logging.level = "DEBUG"
         
-        # 应该调用 log_manager.set_level
+        # 应该整体重新应用日志配置
         with patch('app.config.watcher.log_manager') as mock_log:
             handler._handle_reload(old, new)
-            mock_log.set_level.assert_called_once_with("DEBUG")
+            mock_log.configure.assert_called_once_with(new.logging)
 
 
 class TestConfigWatcher:
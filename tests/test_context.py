@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+
+from app.config.settings import ContextSettings, Settings
+from app.main import app
+from app.providers.base import BaseProvider
+from app.services import runtime
+from app.services.chat import Message
+from app.services.context import budget_for, trim
+from app.services.router import FailoverRouter
+from tests.conftest import TEST_API_KEY
+
+
+def turn(role, words):
+    return Message(role, " ".join(["word"] * words))
+
+
+def openai_turn(role, words):
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+def test_trim_drops_oldest_turns_and_keeps_system():
+    messages = [turn("system", 10), turn("user", 50), turn("assistant", 50), turn("user", 50), turn("user", 5)]
+    kept, report = trim(messages, budget=120)
+    assert kept == [messages[0], messages[3], messages[4]]
+    assert report.dropped == 2 and report.truncated == 0
+    assert report.tokens_after <= 120 < report.tokens_before
+
+
+def test_trim_truncates_oversized_history_message():
+    messages = [turn("user", 10), turn("assistant", 500), turn("user", 5)]
+    kept, report = trim(messages, budget=0, max_message_tokens=100)
+    assert report.truncated == 1 and report.dropped == 0
+    assert "[truncated" in kept[1].text
+    assert kept[2] == messages[2]  # 未超限的消息原样保留
+
+
+def test_trim_truncates_oversized_last_message():
+    messages = [turn("system", 10), turn("user", 500)]
+    kept, report = trim(messages, budget=0, max_message_tokens=100)
+    assert report.truncated == 1
+    assert kept[0] == messages[0]
+    assert "[truncated" in kept[1].text
+    assert report.tokens_after < report.tokens_before
+
+
+def test_trim_without_limits_is_noop():
+    messages = [turn("user", 10)]
+    kept, report = trim(messages, budget=0)
+    assert kept is messages and not report.trimmed
+
+
+def test_budget_reserves_max_tokens():
+    settings = ContextSettings(default_budget=10000, budgets={"small": 4000}, min_input_budget=1000)
+    assert budget_for(settings, "small", max_tokens=1000) == 3000
+    assert budget_for(settings, "small", max_tokens=8000) == 1000
+    assert budget_for(settings, "other") == 10000
+    assert budget_for(ContextSettings(), "other") == 0
+
+
+class RecordingProvider(BaseProvider):
+    name = "gemini"
+
+    def __init__(self):
+        self.seen = None
+
+    async def chat_completions(self, messages, model=None, **kwargs):
+        self.seen = messages
+        return {"text": "ok"}
+
+    async def list_models(self):
+        return []
+
+
+def test_chat_reports_trimmed_context():
+    provider = RecordingProvider()
+    settings = Settings(context=ContextSettings(budgets={"gemini-3.0-flash": 100}, min_input_budget=10))
+    previous = runtime.manager.install(runtime.Runtime(settings=settings, router=FailoverRouter({"gemini": provider})))
+    try:
+        client = TestClient(app)
+        resp = client.post("/v1/chat/completions", headers={"Authorization": f"Bearer {TEST_API_KEY}"}, json={
+            "model": "gemini-3.0-flash",
+            "messages": [openai_turn("user", 200), openai_turn("assistant", 20), openai_turn("user", 5)],
+        })
+        assert resp.status_code == 200
+        assert resp.headers["X-Context-Trimmed"].startswith("dropped=1; truncated=0")
+        assert len(provider.seen) == 2
+        assert resp.json()["usage"]["prompt_tokens"] <= 100
+    finally:
+        runtime.manager.install(previous)
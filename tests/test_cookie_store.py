@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from app.providers.gemini import GeminiProvider
+from app.services.cookie_store import CookieRefresher, CookieStore, write_json_atomic
+from app.services.shared_state import SharedState
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class FakeClient:
+    def __init__(self, cookies):
+        self.cookies = cookies
+        self.closed = False
+
+    async def init(self, **kwargs):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def make_provider(tmp_path, psidts="old"):
+    path = tmp_path / "cookies.json"
+    CookieStore(str(path)).save("psid", psidts)
+    provider = GeminiProvider(cookie_path=str(path))
+    provider._client = FakeClient({"__Secure-1PSID": "psid", "__Secure-1PSIDTS": psidts})
+    provider._initialized = True
+    provider._cookie_mtime = provider.store.mtime()
+    provider._cookie_values = ("psid", psidts)
+    return provider
+
+
+def test_atomic_write_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "cookies.json"
+    write_json_atomic(path, {"a": 1})
+    write_json_atomic(path, {"a": 2})
+    assert json.loads(path.read_text()) == {"a": 2}
+    assert os.listdir(tmp_path) == ["cookies.json"]
+
+
+def test_single_refresher_elected(tmp_path):
+    path = str(tmp_path / "state.db")
+    a = CookieRefresher(state=lambda: SharedState(path))
+    state_b = SharedState(path)
+    assert a.elect()
+    # 另一个 worker 进程持有不同的 owner，无法获得租约
+    assert not state_b.try_lock(CookieRefresher.LOCK, "other-worker", ttl=60)
+
+
+def test_persist_rotated_cookies(tmp_path):
+    provider = make_provider(tmp_path)
+    assert provider.persist_cookies() is False
+    provider._client.cookies["__Secure-1PSIDTS"] = "rotated"
+    assert provider.persist_cookies() is True
+    assert provider.load_cookie_values(provider.cookie_path) == ("psid", "rotated")
+    assert not provider.cookies_changed()
+
+
+@pytest.mark.anyio
+async def test_follower_reloads_on_mtime_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "app.providers.gemini.GeminiClient",
+        lambda psid, psidts, proxy=None: FakeClient({"__Secure-1PSID": psid, "__Secure-1PSIDTS": psidts}),
+    )
+    provider = make_provider(tmp_path)
+    client = provider._client
+    follower = CookieRefresher(state=SharedState)
+    follower.is_leader = True  # 已是 refresher，不会因接任而重载
+
+    await follower.sync(provider)
+    assert provider._client is client
+
+    CookieStore(provider.cookie_path).save("psid", "from-other-worker")
+    os.utime(provider.cookie_path, ns=(0, 0))
+    await follower.sync(provider)
+    assert provider._client is not client
+    assert provider._client.cookies["__Secure-1PSIDTS"] == "from-other-worker"
+    await provider.close()
+    assert client.closed
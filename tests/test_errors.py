@@ -89,6 +89,14 @@ class TestExceptionClassification:
         
         assert isinstance(err, RateLimitError)
     
+    def test_classify_rate_limit_retry_hint(self):
+        """测试提取限流错误中的重试提示"""
+        err = classify_exception(Exception("429 Too Many Requests, retry after 30"))
+        
+        assert isinstance(err, RateLimitError)
+        assert err.details["retry_after"] == 30.0
+        assert http_exception_from_error(err).headers == {"Retry-After": "30"}
+    
     def test_classify_timeout(self):
         """测试分类超时错误"""
         exc = Exception("Connection timeout")
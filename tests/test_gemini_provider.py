@@ -1,8 +1,10 @@
+import asyncio
 import json
 
 import pytest
 
 from app.providers.gemini import GeminiProvider
+from app.utils.errors import AIGatewayError
 
 
 def test_gemini_requires_cookie_path():
@@ -19,3 +21,86 @@ def test_load_cookie_values(tmp_path):
     psid, psidts = GeminiProvider.load_cookie_values(str(cookie_file))
     assert psid == "psid"
     assert psidts == "psidts"
+
+
+class FakeClient:
+    fail_init = False
+
+    def __init__(self, psid, psidts, proxy=None):
+        self.cookies = {"__Secure-1PSID": psid, "__Secure-1PSIDTS": psidts}
+        self.closed = False
+
+    async def init(self, **kwargs):
+        if FakeClient.fail_init:
+            raise RuntimeError("401 Unauthorized")
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.providers.gemini.GeminiClient", FakeClient)
+    FakeClient.fail_init = False
+    cookie_file = tmp_path / "gemini.json"
+    cookie_file.write_text(json.dumps({"__Secure-1PSID": "old"}), encoding="utf-8")
+    return GeminiProvider(cookie_path=str(cookie_file))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_rotation_keeps_old_client_until_drained(provider):
+    provider.drain_timeout = 5
+    async with provider._lease_client() as old:
+        await provider.update_cookies("new", "ts")
+        # 进行中的请求继续使用旧客户端，新请求使用新客户端
+        assert not old.closed
+        async with provider._lease_client() as new:
+            assert new.cookies["__Secure-1PSID"] == "new"
+    await asyncio.gather(*provider._retiring)
+    assert old.closed
+
+
+@pytest.mark.anyio
+async def test_failed_rotation_rolls_back(provider):
+    async with provider._lease_client() as old:
+        pass
+    FakeClient.fail_init = True
+    mtime = provider.store.mtime()
+    with pytest.raises(AIGatewayError):
+        await provider.update_cookies("bad")
+    # 验证失败的 cookie 从未写入文件
+    assert provider.store.mtime() == mtime
+    assert provider.load_cookie_values(provider.cookie_path) == ("old", "")
+    assert provider._client is old
+    assert not provider.cookies_changed()
+
+
+@pytest.mark.anyio
+async def test_attachments_uploaded_as_temp_files(provider):
+    import base64
+    from pathlib import Path
+    from types import SimpleNamespace
+
+    from app.services.chat import Attachment, Message
+
+    seen = {}
+
+    async def generate_content(prompt, **options):
+        seen["prompt"] = prompt
+        seen["files"] = [(f, Path(f).read_bytes()) for f in options.get("files", [])]
+        return SimpleNamespace(text="a cat", images=[])
+
+    client = await provider._ensure_client()
+    client.generate_content = generate_content
+    url = "data:image/png;base64," + base64.b64encode(b"png-bytes").decode()
+    result = await provider.chat_completions([Message("user", "what is this?", (Attachment(url),))])
+    assert result["text"] == "a cat"
+    assert seen["prompt"] == "user: what is this?"
+    [(path, data)] = seen["files"]
+    assert path.endswith(".png") and data == b"png-bytes"
+    assert not Path(path).exists()  # 请求结束后删除临时文件
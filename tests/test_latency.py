@@ -0,0 +1,25 @@
+from app.services.latency import LatencyTracker
+
+
+def test_percentile_requires_min_samples():
+    tracker = LatencyTracker()
+    tracker.observe("gemini-3.0-flash", 1.0)
+    assert tracker.percentile("gemini-3.0-flash", 95, min_samples=2) is None
+    assert tracker.percentile("unknown", 50) is None
+
+
+def test_percentile_nearest_rank():
+    tracker = LatencyTracker()
+    for i in range(1, 101):
+        tracker.observe("m", float(i))
+    assert tracker.percentile("m", 50) == 50.0
+    assert tracker.percentile("m", 99) == 99.0
+    assert tracker.percentile("m", 100) == 100.0
+
+
+def test_window_drops_old_samples():
+    tracker = LatencyTracker(window=3)
+    for value in (100.0, 1.0, 2.0, 3.0):
+        tracker.observe("m", value)
+    assert tracker.count("m") == 3
+    assert tracker.percentile("m", 100) == 3.0
@@ -0,0 +1,52 @@
+import json
+
+from app.config.settings import LoggingSettings
+from app.services.logger import LogManager, log_manager, logger
+
+
+def _restore():
+    log_manager._setup_logger()
+
+
+def test_set_level_keeps_file_sink(tmp_path):
+    path = tmp_path / "app.log"
+    manager = LogManager("INFO", enqueue=False)
+    try:
+        manager.setup_file_logging(str(path))
+        manager.set_level("WARNING")
+        logger.warning("after level change")
+        logger.complete()
+        assert manager.file_handler_id is not None
+        assert "after level change" in path.read_text(encoding="utf-8")
+    finally:
+        _restore()
+
+
+def test_serialize_writes_bound_fields_as_json(tmp_path):
+    path = tmp_path / "app.log"
+    manager = LogManager()
+    try:
+        manager.configure(LoggingSettings(file=str(path), serialize=True))
+        logger.bind(request_id="r1", status=200).info("GET /health")
+        logger.complete()  # 等待后台线程写完
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        record = lines[-1]
+        assert record["message"] == "GET /health"
+        assert record["request_id"] == "r1" and record["status"] == 200
+    finally:
+        _restore()
+
+
+def test_access_sampling_keeps_errors_and_slow_requests():
+    manager = LogManager(enqueue=False)
+    try:
+        manager.settings = LoggingSettings(sample_rate=0.0, slow_threshold=2.0)
+        assert not manager.should_log_access(200, 0.1)
+        assert manager.should_log_access(503, 0.1)
+        assert manager.should_log_access(429, 0.1)
+        assert manager.should_log_access(401, 0.1)
+        assert manager.should_log_access(200, 3.0)
+        manager.settings = LoggingSettings(sample_rate=0.0, always_log_status=500)
+        assert not manager.should_log_access(404, 0.1)
+    finally:
+        _restore()
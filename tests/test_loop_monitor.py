@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config.settings import LoopMonitorSettings
+from app.main import app
+from app.services import metrics
+from app.services.loop_monitor import LoopMonitor
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _blocking_callback(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.anyio
+async def test_detects_blocking_call_with_stack():
+    monitor = LoopMonitor(LoopMonitorSettings(interval=0.01, threshold=0.05))
+    stalls_before = metrics.LOOP_STALLS.value()
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    _blocking_callback(0.3)
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert monitor.stall_count == 1
+    [stall] = monitor.stalls
+    assert stall.duration >= 0.2
+    assert any("_blocking_callback" in line for line in stall.stack)
+    assert metrics.LOOP_STALLS.value() == stalls_before + 1
+    await asyncio.sleep(0.05)
+    assert not monitor.running  # 取消后看门狗线程退出
+
+
+def test_record_lag_window():
+    monitor = LoopMonitor(LoopMonitorSettings(threshold=0.1, window=60))
+    monitor.record(0.002)
+    monitor.record(0.03)
+    assert monitor.stall_count == 0
+    monitor.record(0.25)  # 看门狗未抓到调用栈时也记为 stall
+    snapshot = monitor.snapshot()
+    assert snapshot["lag_ms"] == 250.0
+    assert snapshot["max_lag_ms"] == 250.0
+    assert snapshot["stalls"] == 1
+    assert snapshot["recent_stalls"][0]["duration_ms"] == 250.0
+    assert "stack" not in snapshot["recent_stalls"][0]
+    assert monitor.snapshot(stacks=True)["recent_stalls"][0]["stack"] == []
+
+
+def test_health_and_admin_report_loop(auth_headers):
+    client = TestClient(app)
+    health = client.get("/health").json()
+    assert {"lag_ms", "max_lag_ms", "stalls", "recent_stalls"} <= health["event_loop"].keys()
+    resp = client.get("/admin/loop", headers=auth_headers)
+    assert resp.status_code == 200
+    assert "threshold_ms" in resp.json()
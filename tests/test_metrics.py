@@ -0,0 +1,86 @@
+from fastapi.testclient import TestClient
+
+from app.config.settings import Settings, StubSettings
+from app.main import app
+from app.providers.stub import StubGeminiProvider
+from app.services import metrics, runtime
+from app.services.metrics import Counter, Histogram, Registry
+from app.services.model_catalog import ModelCatalog
+from app.services.router import FailoverRouter
+from tests.conftest import TEST_API_KEY
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    hist.observe("/v1/models", value=0.05)
+    hist.observe("/v1/models", value=0.5)
+    hist.observe("/v1/models", value=5)
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="/v1/models",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/v1/models",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/v1/models",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/v1/models"} 3' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_counter_labels_escaped_and_collector_errors_isolated():
+    registry = Registry()
+    counter = registry.counter("errors_total", "Errors", ("code",))
+    counter.inc('bad"code')
+    registry.collector("broken", "Broken", lambda: 1 / 0)
+    text = registry.render()
+    assert 'errors_total{code="bad\\"code"} 1' in text
+    assert "broken collection failed" in text
+
+
+def test_metrics_endpoint_reports_routes():
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {TEST_API_KEY}"}
+    client.get("/v1/models", headers=headers)
+    client.get("/no-such-path", headers=headers)
+    resp = client.get("/metrics", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'gateway_requests_total{route="/v1/models",method="GET",status="200"}' in resp.text
+    assert 'route="unmatched"' in resp.text
+    assert "gateway_scheduler_active" in resp.text
+
+
+def test_model_labels_bounded_by_catalog_and_ttft_observed():
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {TEST_API_KEY}"}
+    stub = StubSettings(ttft_ms=0, ttft_sigma=0, tokens_per_second=0, output_tokens=3)
+    gemini = StubGeminiProvider(stub)
+    catalog = ModelCatalog(["gemini-3.0-flash"])
+    previous = runtime.manager.install(runtime.Runtime(
+        settings=Settings(), gemini=gemini, router=FailoverRouter({"gemini": gemini}, model_label=catalog.metric_label),
+        catalog=catalog,
+    ))
+    before = metrics.TIME_TO_FIRST_TOKEN.count("gemini-3.0-flash")
+    try:
+        for model in ("gemini-3.0-flash", "gemini-made-up-123"):
+            resp = client.post("/v1/chat/completions", headers=headers,
+                               json={"model": model, "messages": [{"role": "user", "content": "hi"}]})
+            assert resp.status_code == 200
+        text = client.get("/metrics", headers=headers).text
+    finally:
+        runtime.manager.install(previous)
+    assert 'gateway_model_requests_total{model="other",provider="gemini",status="200"}' in text
+    assert "gemini-made-up-123" not in text
+    assert metrics.TIME_TO_FIRST_TOKEN.count("gemini-3.0-flash") == before + 1
+
+
+def test_error_code_counted_from_exception_handler():
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {TEST_API_KEY}"}
+    before = metrics.ERRORS.value("provider_error")
+    previous = runtime.manager.install(runtime.Runtime(settings=Settings(), router=FailoverRouter({})))
+    try:
+        resp = client.post("/v1/chat/completions", headers=headers,
+                           json={"model": "gemini-3.0-flash", "messages": [{"role": "user", "content": "hi"}]})
+    finally:
+        runtime.manager.install(previous)
+    assert resp.status_code == 503
+    assert resp.json()["detail"]["error"]["code"] == "provider_error"
+    assert metrics.ERRORS.value("provider_error") == before + 1
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import runtime
+from app.services.model_catalog import ModelCatalog
+from tests.conftest import TEST_API_KEY
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class StubG4F:
+    name = "g4f"
+    model_prefixes = ["gpt-4"]
+
+    def available_models(self):
+        return ["gpt-4o", "gpt-5", "o1"]
+
+
+@pytest.fixture
+def catalog():
+    catalog = ModelCatalog(["gemini-3.0-flash"])
+    previous = runtime.manager.install(runtime.Runtime(catalog=catalog))
+    yield catalog
+    runtime.manager.install(previous)
+
+
+def test_catalog_renders_both_protocols():
+    catalog = ModelCatalog(["gemini-3.0-flash"])
+    openai = json.loads(catalog.openai.body)
+    claude = json.loads(catalog.claude.body)
+    assert openai["data"] == [{"id": "gemini-3.0-flash", "object": "model", "owned_by": "google"}]
+    assert claude["data"][0]["display_name"] == "gemini-3.0-flash"
+
+
+@pytest.mark.anyio
+async def test_refresh_filters_g4f_models_by_prefix():
+    catalog = ModelCatalog(["gemini-3.0-flash"], StubG4F())
+    await catalog.refresh()
+    assert catalog.models == [("gemini-3.0-flash", "google"), ("gpt-4o", "g4f")]
+
+
+def test_etag_changes_with_models():
+    etag = ModelCatalog(["gemini-3.0-flash"]).openai.etag
+    assert ModelCatalog(["gemini-3.0-flash"]).openai.etag == etag
+    assert ModelCatalog(["gemini-3.0-flash", "gemini-3.0-pro"]).openai.etag != etag
+
+
+def test_models_endpoint_supports_if_none_match(catalog):
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {TEST_API_KEY}"}
+    resp = client.get("/v1/models", headers=headers)
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert resp.json()["data"][0]["id"] == "gemini-3.0-flash"
+
+    resp = client.get("/v1/models", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+
+    resp = client.get("/v1/claude/models", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
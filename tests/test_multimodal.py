@@ -1,9 +1,13 @@
 """多模态功能测试"""
 import pytest
 import base64
+import json
 from pathlib import Path
 
-from app.routes.openai import _extract_image_from_content, ImageGenerationRequest
+from app.providers.gemini import GeminiProvider
+from app.routes.openai import ImageGenerationRequest
+from app.services.chat import split_openai_content
+from app.services.codec import parse_openai
 
 
 class TestVision:
@@ -12,10 +16,10 @@ class TestVision:
     def test_extract_text_only(self):
         """测试纯文本内容"""
         content = [{"type": "text", "text": "Hello"}]
-        text, files = _extract_image_from_content(content)
+        text, attachments = split_openai_content(content)
         
         assert text == "Hello"
-        assert files == []
+        assert attachments == ()
     
     def test_extract_base64_image(self):
         """测试提取 base64 图片"""
@@ -28,19 +32,18 @@ class TestVision:
             {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_str}"}}
         ]
         
-        text, files = _extract_image_from_content(content)
+        text, attachments = split_openai_content(content)
         
         assert text == "描述这张图"
-        assert len(files) == 1
-        # 验证临时文件存在
-        assert files[0].endswith('.png')
-        
-        # 清理
-        for f in files:
-            try:
-                Path(f).unlink()
-            except:
-                pass
+        assert len(attachments) == 1
+        assert attachments[0].mime == "image/png"
+        # 写入临时文件时才解码
+        path = attachments[0].write_temp()
+        try:
+            assert path.endswith('.png')
+            assert Path(path).read_bytes() == image_data
+        finally:
+            Path(path).unlink()
     
     def test_extract_multiple_images(self):
         """测试提取多张图片"""
@@ -51,26 +54,31 @@ class TestVision:
             {"type": "image_url", "image_url": {"url": f"data:image/webp;base64,{base64_str}"}}
         ]
         
-        text, files = _extract_image_from_content(content)
-        
-        assert len(files) == 2
-        assert files[0].endswith('.jpeg') or files[0].endswith('.jpg')
-        assert files[1].endswith('.webp')
+        text, attachments = split_openai_content(content)
         
-        # 清理
-        for f in files:
-            try:
-                Path(f).unlink()
-            except:
-                pass
+        assert len(attachments) == 2
+        assert attachments[0].ext == "jpeg"
+        assert attachments[1].ext == "webp"
     
     def test_extract_no_images(self):
         """测试没有图片的情况"""
         content = []
-        text, files = _extract_image_from_content(content)
+        text, attachments = split_openai_content(content)
         
         assert text == ""
-        assert files == []
+        assert attachments == ()
+
+    def test_images_never_serialized_into_prompt(self):
+        """图片作为附件传给 Gemini，不进入提示词文本"""
+        base64_str = base64.b64encode(b"x" * 1000).decode()
+        request = parse_openai(json.dumps({"model": "gemini-3.0-flash", "messages": [
+            {"role": "user", "content": [
+                {"type": "text", "text": "看图"},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_str}"}},
+            ]},
+        ]}).encode())
+        assert request.has_attachments
+        assert GeminiProvider._messages_to_prompt(request.messages) == "user: 看图"
 
 
 class TestImageGeneration:
@@ -129,6 +137,5 @@ class TestFileUpload:
     
     def test_file_import(self):
         """测试文件路由可导入"""
-        from app.routes.files import router, configure
+        from app.routes.files import router
         assert router is not None
-        assert configure is not None
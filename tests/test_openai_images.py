@@ -1,6 +1,11 @@
 from fastapi.testclient import TestClient
 
+from app.config.settings import RetryPolicy, RetrySettings, Settings, StubSettings
 from app.main import app
+from app.providers.stub import StubGeminiProvider
+from app.services import runtime
+from app.services.router import FailoverRouter
+from app.utils.errors import ProviderError
 from tests.conftest import TEST_API_KEY
 
 
@@ -12,3 +17,60 @@ def test_images_requires_prompt():
         json={"model": "gemini-2.5-pro"},
     )
     assert resp.status_code == 422
+
+
+class FailingImageProvider:
+    name = "gemini"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_images(self, prompt, model=None):
+        self.calls += 1
+        raise ProviderError("gemini", "image backend down")
+
+
+def _install(gemini, **router_kwargs):
+    return runtime.manager.install(runtime.Runtime(
+        settings=Settings(), gemini=gemini, router=FailoverRouter({"gemini": gemini}, **router_kwargs),
+    ))
+
+
+def test_images_served_through_router(auth_headers):
+    client = TestClient(app)
+    gemini = StubGeminiProvider(StubSettings(ttft_ms=0, ttft_sigma=0, tokens_per_second=0, image_kb=1))
+    previous = _install(gemini)
+    try:
+        resp = client.post(
+            "/v1/images",
+            headers=auth_headers,
+            json={"model": "gemini-3.0-flash", "prompt": "a cat", "response_format": "url"},
+        )
+        timeouts = runtime.current().router.timeouts.snapshot()
+    finally:
+        runtime.manager.install(previous)
+    assert resp.status_code == 200
+    assert resp.json()["data"][0]["url"].startswith("data:image/png;base64,")
+    # 图片生成单独统计延迟，使用 images 操作的超时区间
+    assert timeouts["images:gemini-3.0-flash"]["samples"] == 1
+    assert timeouts["images:gemini-3.0-flash"]["max"] == 300.0
+    assert "gemini-3.0-flash" not in timeouts
+
+
+def test_images_upstream_error_goes_through_breaker(auth_headers):
+    client = TestClient(app)
+    gemini = FailingImageProvider()
+    previous = _install(gemini, retry=RetrySettings(default=RetryPolicy(max_attempts=1)))
+    try:
+        resp = client.post(
+            "/v1/images",
+            headers=auth_headers,
+            json={"model": "gemini-3.0-flash", "prompt": "a cat"},
+        )
+        breaker = runtime.current().router.breakers.get("gemini")
+    finally:
+        runtime.manager.install(previous)
+    assert resp.status_code == 503
+    assert resp.json()["detail"]["error"]["code"] == "provider_error"
+    assert gemini.calls == 1
+    assert breaker.snapshot()["failures"] == 1
@@ -0,0 +1,139 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth.middleware import authenticate, configure_auth
+from app.config.settings import APIKeySettings, ProfilingSettings
+from app.main import app
+from app.middlewares.profiling import ProfilingMiddleware
+from app.services import profiling, request_context
+from app.services.profiling import Profiler, StackFolder
+from tests.conftest import TEST_API_KEY
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _busy(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        sum(range(1000))
+
+
+def test_fold_frame():
+    folded = StackFolder().fold(sys._getframe(), "thread:main")
+    assert folded.startswith("thread:main;")
+    assert folded.endswith(f"test_fold_frame (tests/test_profiling.py:{test_fold_frame.__code__.co_firstlineno})")
+
+
+def test_process_profile_samples_all_threads():
+    profiler = Profiler(ProfilingSettings(interval=0.001))
+    assert profiler.start()
+    assert not profiler.start()  # 已在运行
+    worker = threading.Thread(target=_busy, args=(0.2,), name="busy-worker")
+    worker.start()
+    worker.join()
+    content = profiler.stop()
+    assert not profiler.running
+    assert "thread:busy-worker;" in content
+    assert "_busy (tests/test_profiling.py" in content
+    stack, count = content.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert profiler.stop() == content  # 停止后可再次下载
+
+
+def test_process_profile_stops_at_max_duration():
+    profiler = Profiler(ProfilingSettings(interval=0.001, max_duration=0.05))
+    profiler.start(duration=10)
+    time.sleep(0.3)
+    assert not profiler.running
+    assert profiler.stop() is not None
+
+
+@pytest.mark.anyio
+async def test_request_profile_only_counts_own_tasks():
+    profiler = Profiler(ProfilingSettings(interval=0.001))
+    ctx = request_context.start("req-1")
+    profile = profiler.begin(ctx, "/v1/chat/completions")
+
+    async def child():
+        _busy(0.1)
+
+    await asyncio.create_task(child())  # 请求创建的任务归属该请求
+    request_context.start("req-2")  # 之后创建的任务属于另一个请求
+    other = asyncio.create_task(asyncio.sleep(0))
+    await other
+    profiler.end(profile)
+
+    assert profile.samples > 0
+    assert "child (tests/test_profiling.py" in profile.folded()
+    assert profiler.find("req-1") is profile
+    assert profiler._tasks.get(other) is None
+
+
+def test_admin_key_marks_tenant():
+    configure_auth("primary", [APIKeySettings(name="team", key="team-key")])
+    assert authenticate("primary").admin
+    assert not authenticate("team-key").admin
+    configure_auth("primary", admin_key="ops-key")
+    assert authenticate("ops-key").admin
+    assert not authenticate("primary").admin
+
+
+def test_profile_endpoints_require_admin_key():
+    configure_auth(TEST_API_KEY, [APIKeySettings(name="team", key="team-key")])
+    previous = profiling.profiler
+    profiling.profiler = Profiler(ProfilingSettings(interval=0.001))
+    try:
+        client = TestClient(app)
+        assert client.post("/admin/profile/start", headers={"X-API-Key": "team-key"}).status_code == 403
+
+        admin = {"X-API-Key": TEST_API_KEY}
+        assert client.post("/admin/profile/start", headers=admin).status_code == 200
+        resp = client.post("/admin/profile/stop", headers=admin)
+        assert resp.status_code == 200
+        assert resp.headers["content-disposition"].endswith('.folded"')
+
+        # 单请求 profile：非管理 key 的 X-Profile 头被忽略
+        assert "X-Profile-ID" not in client.get("/v1/models", headers={"X-API-Key": "team-key", "X-Profile": "1"}).headers
+        resp = client.get("/v1/models", headers={**admin, "X-Profile": "1", "X-Request-ID": "profiled-1"})
+        assert resp.headers["X-Profile-ID"] == "profiled-1"
+        resp = client.get("/admin/profile/requests/profiled-1", headers=admin)
+        assert resp.status_code == 200
+        assert client.get("/admin/profile", headers=admin).json()["requests"][0]["path"] == "/v1/models"
+        assert client.get("/admin/profile/requests/missing", headers=admin).status_code == 404
+    finally:
+        profiling.profiler = previous
+
+
+@pytest.mark.anyio
+async def test_request_profile_ends_when_body_never_sent():
+    previous = profiling.profiler
+    profiling.profiler = Profiler(ProfilingSettings(interval=0.001))
+    try:
+        ctx = request_context.start("req-aborted")
+        ctx.admin = True
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            raise OSError("client disconnected")
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "path": "/v1/chat/completions", "headers": [(b"x-profile", b"1")]}
+        with pytest.raises(OSError):
+            await ProfilingMiddleware(app)(scope, None, send)
+        assert (b"x-profile-id", b"req-aborted") in sent[0]["headers"]
+        assert not profiling.profiler._requests
+        assert profiling.profiler.find("req-aborted") is not None
+    finally:
+        profiling.profiler = previous
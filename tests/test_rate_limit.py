@@ -0,0 +1,89 @@
+import pytest
+
+from app.services.rate_limit import KeyLimiter, KeyLimits, TokenBucket
+from app.utils.errors import RateLimitError
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(1.0)
+    clock.now = 1.5
+    assert bucket.try_acquire() == 0
+
+
+@pytest.mark.anyio
+async def test_reconfigure_keeps_unchanged_buckets():
+    clock = FakeClock()
+    limiter = KeyLimiter(clock)
+    limiter.configure({"a": KeyLimits(rpm=1), "b": KeyLimits(rpm=1)})
+    assert await limiter.check_request("a") is None
+    assert await limiter.check_request("b") is None
+    # a 的限额未变，继续受限；b 的限额调整后重新计数
+    limiter.configure({"a": KeyLimits(rpm=1), "b": KeyLimits(rpm=10)})
+    assert await limiter.check_request("a") == pytest.approx(60.0)
+    assert await limiter.check_request("b") is None
+    assert await limiter.check_request("unknown") is None
+
+
+@pytest.mark.anyio
+async def test_concurrent_stream_limit():
+    limiter = KeyLimiter()
+    limiter.configure({"a": KeyLimits(max_concurrent_streams=1)})
+    async with limiter.stream("a"):
+        with pytest.raises(RateLimitError):
+            async with limiter.stream("a"):
+                pass
+        assert limiter.snapshot()["a"]["active_streams"] == 1
+    async with limiter.stream("a"):
+        pass
+    async with limiter.stream(None):
+        pass
+
+
+def _shared(tmp_path):
+    from app.services.shared_state import SharedState
+    return SharedState(str(tmp_path / "state.db"))
+
+
+@pytest.mark.anyio
+async def test_shared_rpm_counts_across_workers(tmp_path):
+    state = _shared(tmp_path)
+    # 两个 worker 共用同一个共享状态文件，合计不超过 rpm
+    workers = [KeyLimiter(state=state), KeyLimiter(state=_shared(tmp_path))]
+    for limiter in workers:
+        limiter.configure({"a": KeyLimits(rpm=3)})
+    results = [await workers[i % 2].check_request("a") for i in range(4)]
+    assert results[:3] == [None, None, None]
+    assert 0 < results[3] <= 60
+    assert workers[0].snapshot()["a"]["tokens"] == 0
+
+
+@pytest.mark.anyio
+async def test_shared_stream_slots_across_workers(tmp_path):
+    first, second = KeyLimiter(state=_shared(tmp_path)), KeyLimiter(state=_shared(tmp_path))
+    for limiter in (first, second):
+        limiter.configure({"a": KeyLimits(max_concurrent_streams=1)})
+    async with first.stream("a"):
+        assert second.snapshot()["a"]["active_streams"] == 1
+        with pytest.raises(RateLimitError):
+            async with second.stream("a"):
+                pass
+    async with second.stream("a"):
+        pass
+    assert first.snapshot()["a"]["active_streams"] == 0
@@ -0,0 +1,325 @@
+import asyncio
+
+import pytest
+
+from app.config.settings import (
+    CircuitBreakerSettings,
+    HedgePolicy,
+    HedgingSettings,
+    RetryPolicy,
+    RetrySettings,
+    SchedulerSettings,
+    TimeoutBounds,
+    TimeoutSettings,
+)
+from app.services import metrics, request_context
+from app.services.circuit_breaker import CircuitBreakerRegistry
+from app.services.router import FailoverRouter, Route
+from app.services.scheduler import FairScheduler
+from app.services.timeouts import AdaptiveTimeouts
+from app.utils.errors import AuthenticationError, InvalidRequestError, ProviderError, RateLimitError
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+NO_RETRY = RetrySettings(default=RetryPolicy(max_attempts=1))
+
+
+class StubProvider:
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.calls = []
+
+    async def chat_completions(self, *args, **kwargs):
+        return {}
+
+    async def list_models(self):
+        return []
+
+
+async def _invoke(provider, model):
+    provider.calls.append(model)
+    if provider.error:
+        raise provider.error
+    return f"{provider.name}:{model}"
+
+
+def test_route_parse():
+    assert Route.parse("g4f:deepseek-v3") == Route("g4f", "deepseek-v3")
+    assert Route.parse("gemini-3.0-pro") == Route("gemini", "gemini-3.0-pro")
+    assert Route.parse("gpt-4o") == Route("g4f", "gpt-4o")
+
+
+@pytest.mark.anyio
+async def test_fallback_on_provider_error():
+    gemini = StubProvider("gemini", ProviderError("gemini", "down"))
+    g4f = StubProvider("g4f")
+    router = FailoverRouter(
+        {"gemini": gemini, "g4f": g4f},
+        fallbacks={"gemini-3.0-flash": ["g4f:deepseek-v3"]},
+        retry=NO_RETRY,
+    )
+    result = await router.call("gemini-3.0-flash", _invoke)
+    assert result.value == "g4f:deepseek-v3"
+    assert result.route == Route("g4f", "deepseek-v3")
+
+
+@pytest.mark.anyio
+async def test_open_circuit_skips_backend():
+    gemini = StubProvider("gemini", Exception("connection refused"))
+    g4f = StubProvider("g4f")
+    router = FailoverRouter(
+        {"gemini": gemini, "g4f": g4f},
+        fallbacks={"gemini-3.0-flash": ["deepseek-v3"]},
+        breakers=CircuitBreakerRegistry(CircuitBreakerSettings(failure_threshold=1, recovery_timeout=60)),
+        retry=NO_RETRY,
+    )
+    await router.call("gemini-3.0-flash", _invoke)
+    await router.call("gemini-3.0-flash", _invoke)
+    # 第二次请求时 gemini 已熔断，不再调用
+    assert len(gemini.calls) == 1
+    assert len(g4f.calls) == 2
+    assert router.snapshot()["breakers"]["gemini"]["state"] == "open"
+
+
+@pytest.mark.anyio
+async def test_invalid_request_not_failed_over():
+    gemini = StubProvider("gemini", InvalidRequestError("bad"))
+    g4f = StubProvider("g4f")
+    router = FailoverRouter({"gemini": gemini, "g4f": g4f}, fallbacks={"gemini-3.0-flash": ["gpt-4o"]})
+    with pytest.raises(InvalidRequestError):
+        await router.call("gemini-3.0-flash", _invoke)
+    assert g4f.calls == []
+
+
+@pytest.mark.anyio
+async def test_unconfigured_provider_raises_provider_error():
+    router = FailoverRouter({})
+    with pytest.raises(ProviderError):
+        await router.call("claude-3-opus", _invoke)
+
+
+class SlowProvider(StubProvider):
+    def __init__(self, name, delays):
+        super().__init__(name)
+        self.delays = list(delays)
+        self.cancelled = 0
+
+
+async def _slow_invoke(provider, model):
+    delay = provider.delays.pop(0)
+    provider.calls.append(model)
+    try:
+        await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        provider.cancelled += 1
+        raise
+    return f"{provider.name}:{model}:{delay}"
+
+
+def _hedging(**policy):
+    return HedgingSettings(models={"gemini-3.0-flash": HedgePolicy(**policy)}, min_samples=100)
+
+
+@pytest.mark.anyio
+async def test_hedge_fires_and_cancels_loser():
+    gemini = SlowProvider("gemini", [1.0])
+    g4f = SlowProvider("g4f", [0.0])
+    router = FailoverRouter(
+        {"gemini": gemini, "g4f": g4f},
+        fallbacks={"gemini-3.0-flash": ["g4f:deepseek-v3"]},
+        hedging=_hedging(default_delay=0.01),
+    )
+    won = metrics.HEDGES.value("won")
+    result = await router.call("gemini-3.0-flash", _slow_invoke)
+    assert metrics.HEDGES.value("won") == won + 1
+    assert result.hedged is True
+    assert result.route == Route("g4f", "deepseek-v3")
+    assert gemini.cancelled == 1
+    assert router.stats["hedge_wins"] == 1
+
+
+@pytest.mark.anyio
+async def test_hedge_not_needed_when_primary_fast():
+    gemini = SlowProvider("gemini", [0.0])
+    router = FailoverRouter({"gemini": gemini}, hedging=_hedging(default_delay=1.0))
+    result = await router.call("gemini-3.0-flash", _slow_invoke)
+    assert result.hedged is False
+    assert router.stats["hedges"] == 0
+
+
+@pytest.mark.anyio
+async def test_hedge_budget_exhausted():
+    gemini = SlowProvider("gemini", [0.05])
+    router = FailoverRouter(
+        {"gemini": gemini},
+        hedging=_hedging(default_delay=0.01).model_copy(update={"budget_max_tokens": 0.0, "same_route": True}),
+    )
+    result = await router.call("gemini-3.0-flash", _slow_invoke)
+    assert result.hedged is False
+    assert router.stats["hedges_skipped"] == 1
+    assert len(gemini.calls) == 1
+
+
+@pytest.mark.anyio
+async def test_no_same_route_hedge_by_default():
+    gemini = SlowProvider("gemini", [0.05])
+    router = FailoverRouter({"gemini": gemini}, hedging=_hedging(default_delay=0.01))
+    result = await router.call("gemini-3.0-flash", _slow_invoke)
+    # 没有 fallback，也未开启 same_route，不发 hedge
+    assert result.hedged is False
+    assert router.stats["hedges"] == 0
+    assert len(gemini.calls) == 1
+
+
+def test_hedge_delay_uses_observed_percentile():
+    router = FailoverRouter({}, hedging=_hedging(percentile=50, min_delay=0.1))
+    router.hedging.min_samples = 1
+    for latency in (1.0, 2.0, 3.0):
+        router.latency.observe("gemini-3.0-flash", latency)
+    assert router.hedge_delay("gemini-3.0-flash") == 2.0
+    assert router.hedge_delay("gemini-3.0-pro") is None
+
+
+class FlakyProvider(StubProvider):
+    def __init__(self, name, errors):
+        super().__init__(name)
+        self.errors = list(errors)
+
+
+async def _flaky_invoke(provider, model):
+    provider.calls.append(model)
+    if provider.errors:
+        raise provider.errors.pop(0)
+    return "ok"
+
+
+def _retry(**policy):
+    return RetrySettings(default=RetryPolicy(base_delay=0.0, **policy))
+
+
+@pytest.mark.anyio
+async def test_retry_transient_error_on_same_route():
+    gemini = FlakyProvider("gemini", [ProviderError("gemini", "timeout")])
+    router = FailoverRouter({"gemini": gemini}, retry=_retry())
+    ctx = request_context.start()
+    retries = metrics.RETRIES.value("gemini", "provider_error")
+    result = await router.call("gemini-3.0-flash", _flaky_invoke)
+    assert metrics.RETRIES.value("gemini", "provider_error") == retries + 1
+    assert result.value == "ok"
+    assert len(gemini.calls) == 2
+    assert ctx.retries == 1
+    assert router.snapshot()["retry"]["by_code"] == {"provider_error": 1}
+
+
+@pytest.mark.anyio
+async def test_retried_request_counts_one_breaker_failure():
+    gemini = FlakyProvider("gemini", [ProviderError("gemini", "down")] * 3)
+    router = FailoverRouter(
+        {"gemini": gemini},
+        breakers=CircuitBreakerRegistry(CircuitBreakerSettings(failure_threshold=2, recovery_timeout=60)),
+        retry=_retry(),
+    )
+    with pytest.raises(ProviderError):
+        await router.call("gemini-3.0-flash", _flaky_invoke)
+    # 三次尝试都失败，但只算一个失败的请求，未达到熔断阈值
+    assert len(gemini.calls) == 3
+    assert router.snapshot()["breakers"]["gemini"]["state"] == "closed"
+
+
+@pytest.mark.anyio
+async def test_backoff_releases_scheduler_slot():
+    scheduler = FairScheduler(SchedulerSettings(max_concurrent=1))
+    gemini = FlakyProvider("gemini", [RateLimitError("slow down", retry_after=0.2)])
+    router = FailoverRouter({"gemini": gemini}, retry=_retry(), scheduler=scheduler)
+    task = asyncio.create_task(router.call("gemini-3.0-flash", _flaky_invoke))
+    await asyncio.sleep(0.05)
+    # 退避等待期间不占上游名额
+    assert len(gemini.calls) == 1
+    assert scheduler.snapshot()["active"] == 0
+    assert (await task).value == "ok"
+    assert scheduler.snapshot()["active"] == 0
+
+
+@pytest.mark.anyio
+async def test_retry_skips_unlisted_error_class():
+    gemini = FlakyProvider("gemini", [AuthenticationError("cookie expired")])
+    router = FailoverRouter({"gemini": gemini}, retry=_retry())
+    with pytest.raises(AuthenticationError):
+        await router.call("gemini-3.0-flash", _flaky_invoke)
+    assert len(gemini.calls) == 1
+
+
+@pytest.mark.anyio
+async def test_retry_after_hint_too_long_fails_fast():
+    gemini = FlakyProvider("gemini", [RateLimitError("slow down", retry_after=60)])
+    router = FailoverRouter({"gemini": gemini}, retry=_retry(max_retry_after=5))
+    with pytest.raises(RateLimitError):
+        await router.call("gemini-3.0-flash", _flaky_invoke)
+    assert len(gemini.calls) == 1
+
+
+@pytest.mark.anyio
+async def test_retry_budget_limits_retries():
+    errors = [ProviderError("gemini", "down")] * 10
+    gemini = FlakyProvider("gemini", errors)
+    retry = _retry(max_attempts=10).model_copy(update={"budget_max_tokens": 2.0, "budget_ratio": 0.0})
+    router = FailoverRouter({"gemini": gemini}, retry=retry)
+    with pytest.raises(ProviderError):
+        await router.call("gemini-3.0-flash", _flaky_invoke)
+    assert len(gemini.calls) == 3
+    assert router.stats["retries_skipped"] == 1
+
+
+@pytest.mark.anyio
+async def test_upstream_call_times_out_and_fails_over():
+    gemini = SlowProvider("gemini", [1.0])
+    g4f = SlowProvider("g4f", [0.0])
+    timeouts = AdaptiveTimeouts(TimeoutSettings(models={"gemini-3.0-flash": TimeoutBounds(min=0.01, max=0.05)}))
+    router = FailoverRouter(
+        {"gemini": gemini, "g4f": g4f},
+        fallbacks={"gemini-3.0-flash": ["g4f:deepseek-v3"]},
+        retry=NO_RETRY,
+        timeouts=timeouts,
+    )
+    result = await router.call("gemini-3.0-flash", _slow_invoke)
+    assert result.route == Route("g4f", "deepseek-v3")
+    assert gemini.cancelled == 1
+    assert router.stats["timeouts"] == 1
+
+
+@pytest.mark.anyio
+async def test_timeout_fails_over_without_retrying_same_route():
+    gemini = SlowProvider("gemini", [1.0, 1.0])
+    g4f = SlowProvider("g4f", [0.0])
+    timeouts = AdaptiveTimeouts(TimeoutSettings(models={"gemini-3.0-flash": TimeoutBounds(min=0.01, max=0.05)}))
+    router = FailoverRouter(
+        {"gemini": gemini, "g4f": g4f},
+        fallbacks={"gemini-3.0-flash": ["g4f:deepseek-v3"]},
+        retry=RetrySettings(default=RetryPolicy(max_attempts=3, base_delay=0.0)),
+        timeouts=timeouts,
+    )
+    result = await router.call("gemini-3.0-flash", _slow_invoke)
+    assert result.route == Route("g4f", "deepseek-v3")
+    assert gemini.calls == ["gemini-3.0-flash"]
+    assert router.stats["retries"] == 0
+    # 超时按超时值记为删失样本
+    assert router.latency.percentile("gemini-3.0-flash", 100) == pytest.approx(0.05)
+
+
+@pytest.mark.anyio
+async def test_total_deadline_stops_retries():
+    gemini = StubProvider("gemini", RateLimitError("slow down", retry_after=0.5))
+    router = FailoverRouter(
+        {"gemini": gemini},
+        retry=RetrySettings(default=RetryPolicy(max_attempts=5)),
+        timeouts=AdaptiveTimeouts(TimeoutSettings(total=0.2)),
+    )
+    with pytest.raises(RateLimitError):
+        await router.call("gemini-3.0-flash", _invoke)
+    # 退避等待会越过总时限，不再重试
+    assert len(gemini.calls) == 1
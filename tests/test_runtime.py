@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.config.settings import Settings
+from app.services.runtime import Runtime, RuntimeManager
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class StubProvider:
+    name = "stub"
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def make_builder(provider_factory=StubProvider):
+    async def builder(settings: Settings, previous: Runtime) -> Runtime:
+        return Runtime(settings=settings, g4f=provider_factory(), version=previous.version + 1)
+
+    return builder
+
+
+@pytest.mark.anyio
+async def test_reload_swaps_snapshot_and_notifies_listeners():
+    manager = RuntimeManager(Runtime(g4f=StubProvider()))
+    manager.builder = make_builder()
+    seen = []
+    manager.add_listener(seen.append)
+    manager.add_listener(seen.append)
+
+    runtime = await manager.reload(Settings())
+    assert manager.current is runtime
+    assert runtime.version == 1
+    assert seen == [runtime]
+
+
+@pytest.mark.anyio
+async def test_old_providers_closed_after_leases_drain():
+    old = StubProvider()
+    manager = RuntimeManager(Runtime(g4f=old))
+    manager.builder = make_builder()
+
+    leased = manager.acquire()
+    await manager.reload(Settings())
+    await asyncio.sleep(0.2)
+    assert not old.closed  # 旧快照上仍有请求
+
+    manager.release(leased)
+    await asyncio.sleep(0.2)
+    assert old.closed
+    assert not manager.current.g4f.closed
+
+
+@pytest.mark.anyio
+async def test_failed_build_keeps_current_snapshot():
+    async def broken(settings, previous):
+        raise RuntimeError("bad config")
+
+    initial = Runtime()
+    manager = RuntimeManager(initial)
+    manager.builder = broken
+    with pytest.raises(RuntimeError):
+        await manager.reload(Settings())
+    assert manager.current is initial
+
+
+@pytest.mark.anyio
+async def test_shared_provider_not_closed_on_retire():
+    shared = StubProvider()
+    manager = RuntimeManager(Runtime(g4f=shared))
+    manager.builder = make_builder(lambda: shared)
+
+    await manager.reload(Settings())
+    await asyncio.sleep(0.2)
+    assert not shared.closed
+
+
+@pytest.mark.anyio
+async def test_build_runtime_reuses_unchanged_components():
+    from app.config.settings import CircuitBreakerSettings, StubSettings
+    from app.main import build_runtime
+
+    settings = Settings(stub=StubSettings(enabled=True))
+    first = await build_runtime(settings, Runtime())
+    second = await build_runtime(settings.model_copy(deep=True), first)
+    assert second.gemini is first.gemini
+    assert second.g4f is first.g4f
+    assert second.router.breakers is first.router.breakers
+    assert second.router.scheduler is first.router.scheduler
+
+    changed = settings.model_copy(deep=True)
+    changed.g4f.model_prefixes = ["gpt-"]
+    changed.routing.circuit_breaker = CircuitBreakerSettings(failure_threshold=2)
+    third = await build_runtime(changed, second)
+    assert third.gemini is first.gemini
+    assert third.g4f is not first.g4f
+    assert third.router.breakers is not first.router.breakers
+    assert third.router.scheduler is first.router.scheduler
+
+
+@pytest.mark.anyio
+async def test_catalog_refresh_stops_without_interval():
+    from app.main import _refresh_catalog
+    from app.services import runtime
+
+    settings = Settings()
+    settings.g4f.models_refresh_interval = 0
+    previous = runtime.manager.install(Runtime(settings=settings))
+    try:
+        # 不做定时刷新：首次发现后立即返回，而不是以 0 秒间隔空转
+        await asyncio.wait_for(_refresh_catalog(), 1.0)
+    finally:
+        runtime.manager.install(previous)
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from app.config.settings import SchedulerSettings, TenantPolicy
+from app.services.scheduler import FairScheduler, Flow
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def run_queued(scheduler, flows):
+    """占住唯一名额后按顺序排队 flows，返回获得名额的顺序"""
+    order = []
+
+    async def worker(flow):
+        async with scheduler.slot(flow):
+            order.append(flow)
+
+    async with scheduler.slot(Flow("standard", "holder")):
+        tasks = []
+        for flow in flows:
+            tasks.append(asyncio.create_task(worker(flow)))
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.anyio
+async def test_interactive_served_before_batch():
+    scheduler = FairScheduler(SchedulerSettings(max_concurrent=1))
+    batch = [scheduler.flow("eval", False)] * 3
+    interactive = scheduler.flow("app", True)
+    order = await run_queued(scheduler, batch + [interactive])
+    assert order[0] == interactive
+
+
+@pytest.mark.anyio
+async def test_tenants_share_by_weight():
+    settings = SchedulerSettings(max_concurrent=1, tenants={"b": TenantPolicy(weight=2)})
+    scheduler = FairScheduler(settings)
+    a, b = scheduler.flow("a"), scheduler.flow("b")
+    order = await run_queued(scheduler, [a] * 4 + [b] * 4)
+    # b 权重是 a 的两倍：前 6 个名额中 b 占 4 个
+    assert order[:6].count(b) == 4
+    snapshot = scheduler.snapshot()
+    assert snapshot["queued"] == {}
+    assert snapshot["wait_seconds"]["standard"]["samples"] == 9
+
+
+@pytest.mark.anyio
+async def test_pinned_priority_and_cancelled_waiter():
+    settings = SchedulerSettings(max_concurrent=1, tenants={"eval": TenantPolicy(priority="batch")})
+    scheduler = FairScheduler(settings)
+    assert scheduler.flow("eval", interactive=True).priority == "batch"
+
+    async with scheduler.slot(scheduler.flow("x")):
+        waiter = asyncio.create_task(scheduler.slot(scheduler.flow("y")).__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+    # 被取消的排队请求不会占住名额
+    async with scheduler.slot(scheduler.flow("z")):
+        assert scheduler.snapshot()["active"] == 1
+    assert scheduler.snapshot()["active"] == 0
+
+
+@pytest.mark.anyio
+async def test_disabled_scheduler_passes_through():
+    scheduler = FairScheduler()
+    async with scheduler.slot(scheduler.flow(None)):
+        pass
+    assert scheduler.snapshot()["granted"] == {}
@@ -0,0 +1,38 @@
+import time
+
+from app.server import prepare_state_path
+from app.services.shared_state import SharedState
+
+
+def test_values_expire():
+    state = SharedState()
+    state.set("cache:a", {"x": 1}, ttl=0.05)
+    assert state.get("cache:a") == {"x": 1}
+    time.sleep(0.06)
+    assert state.get("cache:a") is None
+    assert not state.shared
+
+
+def test_counter_is_visible_across_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    a, b = SharedState(path), SharedState(path)
+    assert a.incr("rpm:key", ttl=60) == 1
+    assert b.incr("rpm:key", ttl=60) == 2
+    assert a.get("rpm:key") == 2
+
+
+def test_lock_has_single_holder(tmp_path):
+    path = str(tmp_path / "state.db")
+    a, b = SharedState(path), SharedState(path)
+    assert a.try_lock("refresher", "worker-a", ttl=10)
+    assert not b.try_lock("refresher", "worker-b", ttl=10)
+    # 持有者可以续期
+    assert a.try_lock("refresher", "worker-a", ttl=10)
+    a.unlock("refresher", "worker-a")
+    assert b.try_lock("refresher", "worker-b", ttl=10)
+
+
+def test_multi_worker_gets_default_state_path():
+    assert prepare_state_path(1, "") == ""
+    assert prepare_state_path(4, "/data/state.db") == "/data/state.db"
+    assert prepare_state_path(4, "").endswith("gemini-gateway-state.db")
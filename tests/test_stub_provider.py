@@ -0,0 +1,85 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config.settings import Settings, StubSettings
+from app.main import _build_providers, app
+from app.providers.stub import StubG4FProvider, StubGeminiProvider
+from app.services import runtime
+from app.services.chat import Message
+from app.services.router import FailoverRouter
+from app.utils.errors import AuthenticationError, ProviderError, RateLimitError
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _fast(**overrides) -> StubSettings:
+    return StubSettings(**{"ttft_ms": 0, "ttft_sigma": 0, "tokens_per_second": 0, "seed": 1, **overrides})
+
+
+def test_stub_replaces_providers():
+    settings = Settings(stub=StubSettings(enabled=True))
+    gemini, g4f = _build_providers(settings)
+    assert isinstance(gemini, StubGeminiProvider)
+    assert isinstance(g4f, StubG4FProvider)
+    assert gemini.models == settings.gemini.models
+
+
+def test_ttft_distribution_is_seeded():
+    a = StubGeminiProvider(StubSettings(ttft_ms=200, seed=7))
+    b = StubGeminiProvider(StubSettings(ttft_ms=200, seed=7))
+    samples = [a.sample_ttft() for _ in range(200)]
+    assert samples == [b.sample_ttft() for _ in range(200)]
+    assert 0.15 < sorted(samples)[100] < 0.25  # 中位数接近 ttft_ms
+    assert StubGeminiProvider(StubSettings(ttft_ms=200, ttft_sigma=0)).sample_ttft() == 0.2
+
+
+@pytest.mark.anyio
+async def test_gemini_stub_output():
+    provider = StubGeminiProvider(_fast(output_tokens=20))
+    result = await provider.chat_completions(messages=[Message("user", "hi")], model="gemini-3.0-flash")
+    assert len(result["text"].split()) == 20
+    assert provider.calls == 1
+    assert provider.cookies_changed() is False
+
+
+@pytest.mark.anyio
+async def test_g4f_stub_output_and_images():
+    provider = StubG4FProvider(_fast(image_kb=1), ["gpt-4o", "deepseek-v3"], ["gpt"])
+    result = await provider.chat_completions({"model": "gpt-4o", "messages": []})
+    assert result["choices"][0]["message"]["role"] == "assistant"
+    images = await provider.generate_images("cat", n=2)
+    assert len(images) == 2
+    assert len(images[0]["b64_json"]) == 1368  # 1KB 的 base64 长度
+    assert provider.available_models() == ["gpt-4o", "deepseek-v3"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("kind, error", [
+    ("rate_limit", RateLimitError),
+    ("provider", ProviderError),
+    ("auth", AuthenticationError),
+])
+async def test_error_injection(kind, error):
+    provider = StubGeminiProvider(_fast(error_rate=1.0, errors=[kind]))
+    with pytest.raises(error):
+        await provider.chat_completions(messages=[Message("user", "hi")])
+
+
+def test_stub_serves_chat_route(auth_headers):
+    client = TestClient(app)
+    gemini = StubGeminiProvider(_fast(output_tokens=5))
+    previous = runtime.manager.install(runtime.Runtime(settings=Settings(), gemini=gemini,
+                                                       router=FailoverRouter({"gemini": gemini})))
+    try:
+        resp = client.post(
+            "/v1/chat/completions",
+            headers=auth_headers,
+            json={"model": "gemini-3.0-flash", "messages": [{"role": "user", "content": "hi"}]},
+        )
+    finally:
+        runtime.manager.install(previous)
+    assert resp.status_code == 200
+    assert resp.json()["choices"][0]["message"]["content"] == "the gateway routes every request"
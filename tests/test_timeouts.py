@@ -0,0 +1,53 @@
+from app.config.settings import TimeoutBounds, TimeoutSettings
+from app.services.timeouts import AdaptiveTimeouts, latency_key
+
+
+def _timeouts(**models):
+    return AdaptiveTimeouts(TimeoutSettings(min_samples=3, models=models))
+
+
+def test_initial_timeout_without_samples():
+    timeouts = _timeouts(**{"gemini-3.0-flash": TimeoutBounds(min=2, max=10, initial=8)})
+    assert timeouts.timeout_for("gemini-3.0-flash") == 8
+    # 未配置 initial 时取上限
+    assert timeouts.timeout_for("gemini-3.0-pro") == TimeoutBounds().max
+
+
+def test_timeout_follows_observed_latency():
+    timeouts = _timeouts(**{"gemini-3.0-flash": TimeoutBounds(min=1, max=10)})
+    for latency in (1.0, 2.0, 3.0):
+        timeouts.latency.observe("gemini-3.0-flash", latency)
+    # p99 = 3.0, factor 2
+    assert timeouts.timeout_for("gemini-3.0-flash") == 6.0
+
+
+def test_timeout_clamped_to_bounds():
+    timeouts = _timeouts(
+        **{
+            "gemini-3.0-flash": TimeoutBounds(min=1, max=10),
+            "gemini-3.0-flash-thinking": TimeoutBounds(min=90, max=180),
+        }
+    )
+    for latency in (20.0, 30.0, 40.0):
+        timeouts.latency.observe("gemini-3.0-flash", latency)
+        timeouts.latency.observe("gemini-3.0-flash-thinking", latency / 10)
+    assert timeouts.timeout_for("gemini-3.0-flash") == 10
+    assert timeouts.timeout_for("gemini-3.0-flash-thinking") == 90
+
+
+def test_snapshot_lists_configured_and_observed_models():
+    timeouts = _timeouts(**{"gemini-3.0-flash": TimeoutBounds(min=1, max=10)})
+    timeouts.latency.observe("gpt-4o", 1.0)
+    snapshot = timeouts.snapshot()
+    assert set(snapshot) == {"gemini-3.0-flash", "gpt-4o"}
+    assert snapshot["gpt-4o"]["samples"] == 1
+
+
+def test_operation_bounds_and_separate_samples():
+    timeouts = _timeouts(**{"gemini-3.0-flash": TimeoutBounds(min=1, max=10)})
+    key = latency_key("gemini-3.0-flash", "images")
+    assert key == "images:gemini-3.0-flash"
+    assert latency_key("gemini-3.0-flash") == "gemini-3.0-flash"
+    assert timeouts.timeout_for(key) == timeouts.settings.operations["images"].max
+    timeouts.latency.observe(key, 20.0)
+    assert timeouts.latency.count("gemini-3.0-flash") == 0
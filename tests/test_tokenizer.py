@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.tokenizer import Tokenizer, _heuristic_count, content_text
+from tests.conftest import TEST_API_KEY
+
+
+def test_heuristic_counts_words_punctuation_and_cjk():
+    assert _heuristic_count("hi, world") == 4  # hi + , + world(2)
+    assert _heuristic_count("你好世界") == 4
+    assert _heuristic_count("") == 0
+
+
+def test_long_texts_are_memoized():
+    calls = []
+    tok = Tokenizer(encoder=lambda text: calls.append(text) or len(text), min_cached=8)
+    system = "You are a helpful assistant." * 10
+    assert tok.count(system) == tok.count(system) == len(system)
+    assert len(calls) == 1 and tok.hits == 1
+    # 短文本不进缓存
+    tok.count("hi")
+    tok.count("hi")
+    assert len(calls) == 3
+
+
+def test_count_messages_adds_per_message_overhead():
+    tok = Tokenizer(encoder=len)
+    assert tok.count_messages([{"role": "user", "content": "abcd"}], system="xy") == 3 + (3 + 2) + (3 + 4)
+
+
+def test_content_text_handles_blocks():
+    content = [
+        {"type": "text", "text": "look"},
+        {"type": "tool_result", "content": [{"type": "text", "text": "done"}]},
+        {"type": "image", "source": {}},
+    ]
+    assert content_text(content) == "look\ndone\n"
+
+
+def test_warm_loads_encoder_once():
+    tok = Tokenizer()
+    name = tok.warm()
+    encoder = tok._encoder
+    assert name in ("cl100k_base", "heuristic")
+    assert tok.warm() == name
+    assert tok._encoder is encoder
+
+
+def test_count_tokens_endpoint():
+    client = TestClient(app)
+    resp = client.post("/v1/messages/count_tokens", headers={"x-api-key": TEST_API_KEY}, json={
+        "model": "claude-sonnet",
+        "system": [{"type": "text", "text": "Be brief."}],
+        "messages": [{"role": "user", "content": [{"type": "text", "text": "Hello there"}]}],
+    })
+    assert resp.status_code == 200
+    assert resp.json()["input_tokens"] > 6
+
+
+def test_tool_input_counted_as_json():
+    text = content_text({"type": "tool_use", "name": "search", "input": {"query": "天气"}})
+    assert text == 'search {"query": "天气"}'
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config.settings import TracingSettings
+from app.main import app
+from app.services import request_context, tracing
+from tests.conftest import TEST_API_KEY
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def test_request_id_reuses_valid_incoming_value():
+    assert tracing.request_id("abc-123") == "abc-123"
+    generated = tracing.request_id("bad id\nwith newline")
+    assert generated != "bad id\nwith newline" and len(generated) == 32
+
+
+def test_server_timing_sums_repeated_spans():
+    ctx = request_context.RequestContext(started=0.0)
+    ctx.spans = [("upstream", 0.0, 0.5), ("upstream", 0.6, 0.25), ("queue", 0.0, 0.01)]
+    assert tracing.server_timing(ctx, 1.0) == "upstream;dur=750.0, queue;dur=10.0, total;dur=1000.0"
+
+
+def test_response_carries_request_id_and_server_timing():
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {TEST_API_KEY}", "X-Request-ID": "trace-42"}
+    resp = client.get("/v1/models", headers=headers)
+    assert resp.headers["X-Request-ID"] == "trace-42"
+    assert "total;dur=" in resp.headers["Server-Timing"]
+
+
+@pytest.mark.anyio
+async def test_writer_samples_but_keeps_errors_and_slow_requests(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    writer = tracing.TraceWriter(TracingSettings(file=str(path), sample_rate=0.0, slow_threshold=5.0))
+    ctx = request_context.RequestContext(started=0.0, request_id="r1")
+    ctx.spans = [("upstream", 0.1, 0.2)]
+    writer.write(ctx, "POST", "/v1/chat/completions", 200, 0.3)
+    writer.write(ctx, "POST", "/v1/chat/completions", 502, 0.3)
+    writer.write(ctx, "POST", "/v1/chat/completions", 200, 6.0)
+    assert await writer.flush() == 2
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["status"] for r in records] == [502, 200]
+    assert records[0]["spans"] == [{"name": "upstream", "start_ms": 100.0, "duration_ms": 200.0}]
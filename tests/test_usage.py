@@ -0,0 +1,88 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config.settings import UsageSettings
+from app.main import app
+from app.providers.base import BaseProvider
+from app.services import runtime, tokenizer, usage
+from app.services.router import FailoverRouter
+from app.services.usage import UsageRecord, UsageRecorder
+from tests.conftest import TEST_API_KEY
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class EchoProvider(BaseProvider):
+    name = "gemini"
+
+    async def chat_completions(self, messages, model=None, **kwargs):
+        return {"text": "pong" * 10}
+
+    async def list_models(self):
+        return []
+
+
+def record(ts, api_key="a", status=200, **kwargs):
+    return UsageRecord(ts=ts, api_key=api_key, model="gemini-3.0-flash", provider="gemini",
+                       input_tokens=10, output_tokens=20, latency=0.5, status=status, **kwargs)
+
+
+@pytest.mark.anyio
+async def test_records_batched_and_rolled_up(tmp_path):
+    recorder = UsageRecorder(UsageSettings(path=str(tmp_path / "usage.db")))
+    recorder.record(record(3600 * 10 + 1))
+    recorder.record(record(3600 * 10 + 2, status=503))
+    recorder.record(record(3600 * 11 + 5, api_key="b"))
+    assert recorder.pending == 3
+    assert recorder.totals[("a", "gemini-3.0-flash")]["requests"] == 2
+
+    rows = await recorder.rollup(0, 3600 * 12, bucket="hour")
+    assert recorder.pending == 0
+    assert rows[0] == {
+        "bucket": 36000, "api_key": "a", "requests": 2, "errors": 1,
+        "input_tokens": 20, "output_tokens": 40, "avg_latency": 0.5,
+    }
+    assert rows[1]["api_key"] == "b"
+
+    with pytest.raises(ValueError):
+        await recorder.rollup(0, 1, group_by="status; DROP TABLE usage")
+
+
+def test_pending_buffer_is_bounded():
+    recorder = UsageRecorder(UsageSettings(max_pending=2))
+    for i in range(3):
+        recorder.record(record(i))
+    assert recorder.pending == 2
+    assert recorder.dropped == 1
+    # 丢弃的是最旧的记录
+    assert [r.ts for r in recorder._pending] == [1, 2]
+
+
+def test_chat_request_recorded_per_key():
+    usage.configure(UsageSettings())
+    previous = runtime.manager.install(runtime.Runtime(router=FailoverRouter({"gemini": EchoProvider()})))
+    try:
+        client = TestClient(app)
+        headers = {"Authorization": f"Bearer {TEST_API_KEY}"}
+        resp = client.post("/v1/chat/completions", headers=headers, json={
+            "model": "gemini-3.0-flash",
+            "messages": [{"role": "user", "content": "ping" * 5}],
+        })
+        assert resp.status_code == 200
+        input_tokens = tokenizer.count_messages([{"role": "user", "content": "ping" * 5}])
+        output_tokens = tokenizer.count("pong" * 10)
+        assert resp.json()["usage"]["prompt_tokens"] == input_tokens
+        assert resp.json()["usage"]["completion_tokens"] == output_tokens
+
+        resp = client.get("/admin/usage", headers=headers, params={"group_by": "model", "bucket": "day"})
+        rows = resp.json()["rows"]
+        assert len(rows) == 1
+        assert rows[0]["model"] == "gemini-3.0-flash"
+        assert rows[0]["input_tokens"] == input_tokens
+        assert rows[0]["output_tokens"] == output_tokens
+        assert usage.recorder.totals[("default", "gemini-3.0-flash")]["requests"] == 1
+    finally:
+        runtime.manager.install(previous)